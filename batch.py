@@ -0,0 +1,187 @@
+import quadcopter, controller, scheduler, flight_modes, battery, navigation, udp_quad
+import argparse, copy, json, multiprocessing, time
+import numpy as np
+
+# ===========================================================
+# ---- Headless Batch Mission Runner ----
+# ===========================================================
+# A mission is a dict:
+#   {'name': 'survey_1',
+#    'waypoints': [[1, 1, 2], [0, 0, 2]],
+#    'initial_state': {'position': [0, 0, 0], 'orientation': [0, 0, 0]},   # optional
+#    'quadcopter': {...},                                                  # optional, udp_quad.QUADCOPTER['q1'] layout
+#    'controller': {...},                                                  # optional, udp_quad.CONTROLLER_PARAMETERS layout
+#    'acceptance': 0.1, 'lookahead': 1.0,                                  # optional, see flight_modes.Flight_Mode_Handler
+#    'timeout': 60.0}                                                      # optional, simulated seconds
+# Missions are flown with no sockets or GUI on a free-running Lockstep_Scheduler, many at once:
+# each is one vehicle of a batched fleet, so the per-step NumPy overhead is shared. 'wall_time'
+# in the results is the mission's share of its group's wall time.
+
+DEFAULT_TIMEOUT = 60.0
+GROUP_SIZE = 256  # Most missions flown together in one batched fleet
+
+
+def fly_missions(missions):
+    """Fly missions headless together, one vehicle each in a single Quadcopter_Fleet driven by a
+    Controller_Bank, and return their metrics in mission order. Every mission stops, and its
+    metrics are taken, on the tick it completes or times out, exactly as if it flew alone."""
+    wall_start = time.perf_counter()
+    keys = [f'q{i+1}' for i in range(len(missions))]
+    quads = {}
+    ctrl_params = {}
+    for key, mission in zip(keys, missions):
+        quads[key] = copy.deepcopy(mission.get('quadcopter', udp_quad.QUADCOPTER['q1']))
+        quads[key].update(copy.deepcopy(mission.get('initial_state', {})))
+        ctrl_params[key] = copy.deepcopy(mission.get('controller', udp_quad.CONTROLLER_PARAMETERS))
+
+    fleet = quadcopter.Quadcopter_Fleet(quads)
+    pack = battery.Battery_Bank(quads)
+    bank = controller.Controller_Bank(lambda: fleet.states, fleet.set_all_motor_speeds, ctrl_params, keys)
+    sim_clock = scheduler.Lockstep_Scheduler(time_scaling=0)
+
+    n = len(keys)
+    flights = []
+    for key, mission in zip(keys, missions):
+        waypoints = [tuple(wp) for wp in mission['waypoints']]
+        # Approach direction of every leg, used to measure how far the vehicle flies past a waypoint
+        legs = np.array([quads[key]['position']] + [list(wp) for wp in waypoints], dtype=float)
+        directions = np.diff(legs, axis=0)
+        norms = np.linalg.norm(directions, axis=1)
+        directions[norms > 0] /= norms[norms > 0][:, None]
+        flights.append({
+            'handler': flight_modes.Flight_Mode_Handler(waypoints, mode=mission.get('mode', 'GUIDED'), home=quads[key]['position'],
+                                                        acceptance=mission.get('acceptance', navigation.DEFAULT_ACCEPTANCE_RADIUS),
+                                                        lookahead=mission.get('lookahead', navigation.DEFAULT_LOOKAHEAD)),
+            'ctrl': bank.controller(key),
+            'legs': legs,
+            'directions': directions,
+            'overshoot': np.zeros(len(waypoints)),
+            'waypoint_times': [None]*len(waypoints),
+            'timeout': mission.get('timeout', DEFAULT_TIMEOUT),
+            'stop': False,
+        })
+    # The leg each vehicle is past the waypoint of (the one it reached last), as arrays so the
+    # overshoot of the whole fleet is measured at once every control tick
+    on_leg = np.zeros(n, dtype=bool)
+    leg_waypoints = np.zeros((n, 3))
+    leg_directions = np.zeros((n, 3))
+    leg_overshoot = np.zeros(n)
+    energy = np.zeros(n)
+    saturated_ticks = np.zeros(n, dtype=int)
+    totals = {'control_ticks': 0}
+    active = list(range(n))
+    results = [None]*n
+
+    def flight_mode_tick():
+        for i in active:
+            flight = flights[i]
+            handler = flight['handler']
+            if handler.step(flight['ctrl'], fleet.states[i, 0:3]):
+                k = handler.wp_index-1
+                flight['waypoint_times'][k] = sim_clock.get_sim_time()
+                if k > 0:
+                    flight['overshoot'][k-1] = leg_overshoot[i]
+                on_leg[i] = True
+                leg_waypoints[i] = flight['legs'][k+1]
+                leg_directions[i] = flight['directions'][k]
+                leg_overshoot[i] = flight['overshoot'][k]
+            if handler.mission_complete():
+                flight['stop'] = True
+
+    def control_tick():
+        bank.update()
+        totals['control_ticks'] += 1
+        speeds = fleet.propulsion.commands
+        saturated_ticks[np.any(speeds <= bank.motor_limits[:, 0:1], axis=1) | np.any(speeds >= bank.motor_limits[:, 1:2], axis=1)] += 1
+        # Overshoot past the waypoint that was just reached, measured along its approach direction
+        past = np.sum((fleet.states[:, 0:3]-leg_waypoints)*leg_directions, axis=1)
+        np.maximum(leg_overshoot, past, out=leg_overshoot, where=on_leg)
+
+    def physics_tick():
+        dt = udp_quad.QUAD_DYNAMICS_UPDATE
+        fleet.update(dt)
+        energy[:] += fleet.propulsion.currents*fleet.propulsion.voltage*dt
+        pack.step(fleet.propulsion.currents, dt)
+        fleet.propulsion.voltage[:] = pack.voltage()
+
+    def finish(i):
+        flight = flights[i]
+        handler = flight['handler']
+        overshoot = flight['overshoot']
+        if on_leg[i]:
+            overshoot[handler.wp_index-1] = leg_overshoot[i]
+        results[i] = {
+            'name': missions[i].get('name'),
+            'completed': handler.mission_complete(),
+            'flight_time': sim_clock.get_sim_time(),
+            'waypoint_times': flight['waypoint_times'],
+            'overshoot': overshoot.tolist(),
+            'max_overshoot': float(overshoot.max()) if len(overshoot) else 0.0,
+            'energy': float(energy[i]),
+            'battery_used': float(100.0-pack.percent()[i]),
+            'motor_saturation': saturated_ticks[i]/max(1, totals['control_ticks']),
+            'final_position': fleet.states[i, 0:3].tolist(),
+        }
+
+    sim_clock.add_task(flight_mode_tick, udp_quad.FLIGHT_MODE_UPDATE, name='flight_mode')
+    sim_clock.add_task(control_tick, udp_quad.CONTROLLER_DYNAMICS_UPDATE, name='controller')
+    sim_clock.add_task(physics_tick, udp_quad.QUAD_DYNAMICS_UPDATE, name='physics')
+    # Vehicles whose mission is over keep hovering with the fleet, but no longer count
+    while active:
+        sim_clock.step()
+        next_tick = sim_clock.next_tick()
+        for i in [i for i in active if flights[i]['stop'] or next_tick > flights[i]['timeout']]:
+            finish(i)
+            active.remove(i)
+
+    wall_time = (time.perf_counter()-wall_start)/max(1, n)
+    for result in results:
+        result['wall_time'] = wall_time
+    return results
+
+
+def run_mission(mission):
+    """Fly one mission headless and return its metrics."""
+    return fly_missions([mission])[0]
+
+
+def run_missions(missions, processes=None, group_size=GROUP_SIZE):
+    """Fly every mission across a process pool and return the metrics in mission order.
+    Each worker flies its missions in groups of up to group_size vehicles in one fleet."""
+    processes = processes or multiprocessing.cpu_count()
+    groups = max(processes, -(-len(missions)//group_size))
+    size = max(1, -(-len(missions)//groups))
+    groups = [missions[i:i+size] for i in range(0, len(missions), size)]
+    if processes == 1 or len(groups) <= 1:
+        results = [fly_missions(group) for group in groups]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(fly_missions, groups, chunksize=1)
+    return [result for group in results for result in group]
+
+# ===========================================================
+# ---- CLI ----
+# ===========================================================
+def parse_args():
+    parser = argparse.ArgumentParser(description="Headless batch evaluation of waypoint missions")
+    parser.add_argument("missions", help="JSON file containing a list of missions")
+    parser.add_argument("-o", "--output", default=None, help="Write the per-mission metrics to this JSON file")
+    parser.add_argument("-j", "--processes", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("-g", "--group_size", type=int, default=GROUP_SIZE, help="Most missions flown together in one fleet")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    with open(args.missions) as f:
+        missions = json.load(f)
+    start = time.perf_counter()
+    results = run_missions(missions, processes=args.processes, group_size=args.group_size)
+    elapsed = time.perf_counter()-start
+    for result in results:
+        print(f"[BATCH] {result['name']}: completed={result['completed']} time={result['flight_time']:.2f}s "
+              f"overshoot={result['max_overshoot']:.3f}m energy={result['energy']:.1f}J")
+    print(f"[BATCH] {len(results)} missions in {elapsed:.2f}s ({60*len(results)/max(elapsed, 1e-9):.0f} missions/min)")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,76 @@
+import numpy as np
+
+# ===========================================================
+# ---- Battery ----
+# ===========================================================
+# The LiPo packs of every vehicle as arrays, discharged by the current drawn each physics
+# step. The terminal voltage is the open-circuit voltage of the cells at the present state
+# of charge (OCV_CURVE, interpolated) minus the drop across the pack's internal resistance.
+# Per-vehicle parameters are read from the quadcopter dictionary when present:
+#   'battery_capacity' (mAh), 'battery_cells' (in series), 'battery_resistance' (ohm per cell)
+
+DEFAULT_CAPACITY = 2200.0
+DEFAULT_CELLS = 3
+DEFAULT_CELL_RESISTANCE = 0.01
+NOMINAL_CELL_VOLTAGE = 3.7
+
+# Resting LiPo cell voltage against state of charge
+OCV_CURVE = np.array([
+    [0.00, 3.27], [0.05, 3.61], [0.10, 3.69], [0.20, 3.74], [0.30, 3.77], [0.40, 3.79],
+    [0.50, 3.82], [0.60, 3.87], [0.70, 3.92], [0.80, 3.98], [0.90, 4.06], [1.00, 4.20]])
+OCV_SOC = OCV_CURVE[:, 0].copy()
+OCV_VOLTAGE = OCV_CURVE[:, 1].copy()
+# Energy (Wh per Ah of capacity, per cell) stored between empty and each OCV_SOC point
+OCV_ENERGY = np.concatenate([[0.0], np.cumsum(np.diff(OCV_SOC)*(OCV_VOLTAGE[1:] + OCV_VOLTAGE[:-1])/2)])
+
+FAILSAFE_NONE = 0
+FAILSAFE_RTL = 1
+FAILSAFE_LAND = 2
+
+
+class Battery_Bank():
+    def __init__(self, quads):
+        self.keys = list(quads)
+        self.index = {key: i for i, key in enumerate(self.keys)}
+        n = len(self.keys)
+        self.capacity = np.array([quads[key].get('battery_capacity', DEFAULT_CAPACITY) for key in self.keys], dtype=float)
+        self.cells = np.array([quads[key].get('battery_cells', DEFAULT_CELLS) for key in self.keys], dtype=float)
+        self.resistance = self.cells*np.array([quads[key].get('battery_resistance', DEFAULT_CELL_RESISTANCE) for key in self.keys], dtype=float)
+        self.charge = self.capacity.copy()  # mAh remaining
+        self.current = np.zeros(n)
+        self.terminal_voltage = self.cells*OCV_VOLTAGE[-1]
+        self.energy_used = np.zeros(n)  # J delivered
+        self.failsafe = np.zeros(n, dtype=np.uint8)
+
+    def step(self, current, dt):
+        """Draw 'current' (A, one value per vehicle) for dt seconds."""
+        self.current[:] = current
+        self.charge -= self.current*(dt/3.6)
+        np.maximum(self.charge, 0.0, out=self.charge)
+        self.terminal_voltage = np.maximum(self.cells*np.interp(self.soc(), OCV_SOC, OCV_VOLTAGE) - self.current*self.resistance, 0.0)
+        self.energy_used += self.terminal_voltage*self.current*dt
+
+    def soc(self):
+        return self.charge/self.capacity
+
+    def voltage(self):
+        """Terminal voltage under the last step's load."""
+        return self.terminal_voltage
+
+    def percent(self):
+        return 100.0*self.soc()
+
+    def energy_remaining(self):
+        """Energy (Wh) left at the open-circuit voltage, so not counting resistive losses."""
+        return self.cells*self.capacity/1000.0*np.interp(self.soc(), OCV_SOC, OCV_ENERGY)
+
+    def check_failsafe(self, rtl_percent, land_percent):
+        """Vehicles that just fell below a threshold, as (index, 'RTL' or 'LAND'). Each action fires once."""
+        percent = self.percent()
+        land = (percent <= land_percent) & (self.failsafe < FAILSAFE_LAND)
+        rtl = (percent <= rtl_percent) & (self.failsafe < FAILSAFE_RTL) & ~land
+        if not (land.any() or rtl.any()):
+            return []
+        self.failsafe[rtl] = FAILSAFE_RTL
+        self.failsafe[land] = FAILSAFE_LAND
+        return [(i, 'RTL') for i in np.flatnonzero(rtl)] + [(i, 'LAND') for i in np.flatnonzero(land)]
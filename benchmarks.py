@@ -0,0 +1,444 @@
+import quadcopter, propulsion, controller, telemetry, state_store, gcs_plots, shm_telemetry, udp_quad
+import argparse, copy, json, math, os, socket, sys, tempfile, time
+import numpy as np
+import scipy.integrate
+
+# ===========================================================
+# ---- Benchmarks ----
+# ===========================================================
+# Suites (run all, or pick with --suite):
+#   dynamics   physics steps per second for every integrator and engine (per-vehicle
+#              Quadcopter and the batched Quadcopter_Fleet) over a range of fleet sizes, and
+#              accuracy of each integrator against a tight-tolerance reference solution of the
+#              same open-loop flight. 'vode' (the original stiff solver, per-vehicle engine
+#              only) is included as the baseline.
+#   control    controller ticks per second, per-vehicle controllers against Controller_Bank
+#   telemetry  encode and decode throughput of both wire formats, the cost of one
+#              telemetry_sender pass over the fleet, and the latency of one frame over
+#              loopback UDP and through the shared memory ring
+#   gcs        cost of one dashboard redraw (ModernDroneGCS.update_graph: every strip chart
+#              from full history) on a Tk canvas, or on a stub canvas without a display
+# Results are written as JSON with -o. --baseline compares them with an earlier results file
+# and flags every metric that got worse by more than --tolerance (or the measured spread, if that
+# is larger); the exit status is 1 if any did.
+
+DT = udp_quad.QUAD_DYNAMICS_UPDATE
+FLEET_SIZES = [1, 10, 100, 1000]
+SUITES = ['dynamics', 'control', 'telemetry', 'gcs']
+SCALAR_MAX_VEHICLES = 100  # The per-vehicle engine is only timed up to this fleet size
+ACCURACY_DURATION = 2.0
+ACCURACY_TIME_STEPS = [0.002, 0.005, 0.01]
+MOTOR_HOLD = 0.01  # s, motor commands of the accuracy flight change at this period
+MIN_TIME = 0.1  # s, each repeat of a rate is measured over at least this long
+REPEATS = 5  # Every timing is repeated this often; the best is kept and the spread recorded
+LATENCY_SAMPLES = 2000
+GCS_FRAMES = 200  # Redraws timed per canvas
+TOLERANCE = 0.2  # Relative change counted as a regression
+NOISE_FLOOR = 1e-9  # Values this small (round-off level errors) are never compared
+# Direction of every metric: +1 if higher is better, -1 if lower is better, 0 if it is too noisy
+# to compare (tail latencies) and only reported. Other fields name the case. 'spread' is how far
+# apart the repeats of the case's timing landed; a case is only flagged when it got worse by more
+# than the tolerance and than its spread in either run.
+METRICS = {'spread': 0,
+    'steps_per_second': 1, 'vehicle_steps_per_second': 1, 'position_error': -1, 'attitude_error': -1,
+    'ticks_per_second': 1, 'vehicle_ticks_per_second': 1,
+    'frames_per_second': 1, 'mb_per_second': 1, 'sends_per_second': 1, 'latency_p50_us': -1, 'latency_p99_us': 0,
+    'redraw_ms': -1, 'redraw_p99_ms': 0,
+}
+
+
+def make_quads(count, start=(0, 0, 5), instant_motors=False):
+    quads = {}
+    for i in range(count):
+        quad = copy.deepcopy(udp_quad.QUADCOPTER['q1'])
+        quad['position'] = [start[0] + i, start[1], start[2]]
+        if instant_motors:
+            quad['motor_time_constant'] = 0.0
+        quads[f'q{i+1}'] = quad
+    return quads
+
+
+def hover_speed(quad=udp_quad.QUADCOPTER['q1'], gravity=9.81):
+    return math.sqrt(quad['weight']*gravity/4/propulsion.propeller_thrust_coefficient(*quad['prop_size']))
+
+
+def motor_schedule(duration, seed=0):
+    """Motor speeds around hover, one row per MOTOR_HOLD interval, enough to pitch and roll gently."""
+    rng = np.random.default_rng(seed)
+    count = int(round(duration/MOTOR_HOLD))
+    return hover_speed()*(1 + 0.01*rng.standard_normal((count, 4)))
+
+
+def spread(values):
+    """(max - min)/median of repeated measurements of the same thing."""
+    values = np.asarray(values, dtype=float)
+    return float((values.max() - values.min())/np.median(values))
+
+
+def rate(step, min_time=MIN_TIME, batch=10, repeats=REPEATS):
+    """Calls of step() per second, best of 'repeats' timings, and the spread of the timings."""
+    step()
+    rates = []
+    for _ in range(repeats):
+        calls = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < min_time:
+            for _ in range(batch):
+                step()
+            calls += batch
+        rates.append(calls/(time.perf_counter() - start))
+    return max(rates), spread(rates)
+
+
+def steps_per_second(engine, count, integrator, min_time=MIN_TIME):
+    quad = engine(make_quads(count), integrator=integrator)
+    speeds = np.full(4, hover_speed())
+    for key in quad.quads:
+        quad.set_motor_speeds(key, speeds)
+    return rate(lambda: quad.update(DT), min_time)
+
+
+def fly_schedule(quad, schedule, dt):
+    per_hold = int(round(MOTOR_HOLD/dt))
+    for speeds in schedule:
+        quad.set_motor_speeds('q1', speeds)
+        for _ in range(per_hold):
+            quad.update(dt)
+    return quad.get_state('q1').copy()
+
+
+def reference_solution(schedule):
+    # Without motor lag the thrust is constant over each MOTOR_HOLD, as solve_ivp assumes
+    quad = quadcopter.Quadcopter(make_quads(1, instant_motors=True))
+    state = quad.get_state('q1').copy()
+    for speeds in schedule:
+        quad.set_motor_speeds('q1', speeds)
+        solution = scipy.integrate.solve_ivp(lambda t, s: quad.state_dot(t, s, 'q1'), (0, MOTOR_HOLD), state,
+                                             method='DOP853', rtol=1e-12, atol=1e-12)
+        state = solution.y[:, -1]
+    return state
+
+
+def engines(integrator, count=1):
+    found = []
+    if integrator in quadcopter.Quadcopter_Fleet.INTEGRATORS:
+        found.append(('fleet', quadcopter.Quadcopter_Fleet))
+    if count <= SCALAR_MAX_VEHICLES:
+        found.append(('scalar', quadcopter.Quadcopter))
+    return found
+
+
+def bench_dynamics(fleet_sizes=FLEET_SIZES, integrators=None):
+    integrators = integrators or quadcopter.Quadcopter.INTEGRATORS
+    results = {'steps_per_second': [], 'accuracy': []}
+    for integrator in integrators:
+        for count in fleet_sizes:
+            for name, engine in engines(integrator, count):
+                rate, noise = steps_per_second(engine, count, integrator)
+                results['steps_per_second'].append({'engine': name, 'integrator': integrator, 'vehicles': count,
+                                                    'steps_per_second': rate, 'vehicle_steps_per_second': rate*count,
+                                                    'spread': noise})
+                print(f"[BENCH] {name:6s} {integrator:13s} {count:5d} vehicles: {rate:10.0f} steps/s, {rate*count:12.0f} vehicle-steps/s")
+    schedule = motor_schedule(ACCURACY_DURATION)
+    reference = reference_solution(schedule)
+    for integrator in integrators:
+        engine = engines(integrator)[0][1]
+        for dt in ACCURACY_TIME_STEPS:
+            state = fly_schedule(engine(make_quads(1, instant_motors=True), integrator=integrator), schedule, dt)
+            position_error = float(np.linalg.norm(state[0:3] - reference[0:3]))
+            attitude_error = float(np.max(np.abs(state[6:9] - reference[6:9])))
+            results['accuracy'].append({'integrator': integrator, 'dt': dt, 'duration': ACCURACY_DURATION,
+                                        'position_error': position_error, 'attitude_error': attitude_error})
+            print(f"[BENCH] {integrator:13s} dt={dt:.3f}s: position error {position_error:.2e} m, attitude error {attitude_error:.2e} rad")
+    return results
+
+# ===========================================================
+# ---- Control Benchmarks ----
+# ===========================================================
+def hovering_fleet(count):
+    quad = quadcopter.Quadcopter_Fleet(make_quads(count))
+    params = {key: copy.deepcopy(udp_quad.CONTROLLER_PARAMETERS) for key in quad.quads}
+    return quad, params
+
+
+def bench_control(fleet_sizes=FLEET_SIZES):
+    """Controller updates of the whole fleet per second, towards a target 1 m from every vehicle."""
+    results = []
+    for count in fleet_sizes:
+        quad, params = hovering_fleet(count)
+        bank = controller.Controller_Bank(lambda: quad.states, quad.set_all_motor_speeds, params, quad.quads)
+        for i, key in enumerate(quad.quads):
+            bank.update_target(key, quad.states[i, 0:3] + 1.0)
+        cases = [('bank', bank.update)]
+        if count <= SCALAR_MAX_VEHICLES:
+            scalars = []
+            for i, key in enumerate(quad.quads):
+                ctrl = controller.Controller_PID_Point2Point(quad.get_state, quad.get_time, quad.set_motor_speeds,
+                                                             params=params[key], quad_identifier=key)
+                ctrl.update_target(quad.states[i, 0:3] + 1.0)
+                scalars.append(ctrl)
+            cases.append(('scalar', lambda: [ctrl.update() for ctrl in scalars]))
+        for name, update in cases:
+            ticks, noise = rate(update)
+            results.append({'engine': name, 'vehicles': count, 'ticks_per_second': ticks, 'vehicle_ticks_per_second': ticks*count,
+                            'spread': noise})
+            print(f"[BENCH] control {name:6s} {count:5d} vehicles: {ticks:10.0f} ticks/s, {ticks*count:12.0f} vehicle-ticks/s")
+    return results
+
+# ===========================================================
+# ---- Telemetry Benchmarks ----
+# ===========================================================
+ENCODERS = {'binary': telemetry.encode_state, 'json': telemetry.encode_state_json}
+
+
+def sample_state(seq=0):
+    return (seq, 'q1', 12.5, [1.0, 2.0, 3.0], [0.01, -0.02, 1.57], [0.5, 0.0, -0.1], 87.5, 'GUIDED', 3, 11.9, 8.2, 21.7)
+
+
+def percentile_us(samples, q):
+    return float(np.percentile(samples, q)*1e6)
+
+
+def udp_latency(fmt, samples=LATENCY_SAMPLES):
+    """Encode, send over loopback, receive and decode one frame at a time; seconds per frame."""
+    rx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    tx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        rx.bind(('127.0.0.1', 0))
+        rx.settimeout(1.0)
+        addr = rx.getsockname()
+        latencies = []
+        for seq in range(samples):
+            start = time.perf_counter()
+            tx.sendto(ENCODERS[fmt](*sample_state(seq)), addr)
+            telemetry.decode(rx.recv(65536))
+            latencies.append(time.perf_counter() - start)
+        return latencies
+    finally:
+        rx.close()
+        tx.close()
+
+
+def ring_latency(fmt, samples=LATENCY_SAMPLES):
+    """udp_latency through a shm_telemetry ring instead of a socket."""
+    path = os.path.join(tempfile.gettempdir(), f'benchmark_{os.getpid()}.ring')
+    writer = shm_telemetry.Ring_Writer(path)
+    reader = shm_telemetry.Ring_Reader(path)
+    try:
+        latencies = []
+        for seq in range(samples):
+            start = time.perf_counter()
+            writer.write(ENCODERS[fmt](*sample_state(seq)))
+            telemetry.decode(reader.read()[0])
+            latencies.append(time.perf_counter() - start)
+        return latencies
+    finally:
+        reader.close()
+        writer.unlink()
+
+
+def bench_telemetry(fleet_sizes=FLEET_SIZES):
+    results = {'codec': [], 'sender': [], 'latency': []}
+    for fmt, encode in ENCODERS.items():
+        state = sample_state()
+        frame = encode(*state)
+        for operation, step in [('encode', lambda: encode(*state)), ('decode', lambda: telemetry.decode(frame))]:
+            frames, noise = rate(step, batch=100)
+            results['codec'].append({'format': fmt, 'operation': operation, 'frame_bytes': len(frame),
+                                     'frames_per_second': frames, 'mb_per_second': frames*len(frame)/1e6, 'spread': noise})
+            print(f"[BENCH] telemetry {fmt:6s} {operation}: {frames:10.0f} frames/s, {frames*len(frame)/1e6:7.1f} MB/s ({len(frame)} bytes)")
+    # One pass of udp_quad.telemetry_sender without the socket: snapshot, then encode every vehicle
+    for count in fleet_sizes:
+        quad, params = hovering_fleet(count)
+        store = state_store.State_Store(quad.quads)
+        store.publish(0.0, quad.states, np.full(count, 100.0), ['GUIDED']*count, np.zeros(count))
+        for fmt, encode in ENCODERS.items():
+            def send_all():
+                snapshot = store.snapshot()
+                for key in store.keys:
+                    v = store.vehicle(snapshot, key)
+                    encode(0, key, snapshot['sim_time'], v['position'], v['orientation'], v['velocity'],
+                           v['battery'], v['mode'], v['waypoint_index'], v['voltage'], v['current'], v['energy'])
+            sends, noise = rate(send_all, batch=1)
+            results['sender'].append({'format': fmt, 'vehicles': count, 'sends_per_second': sends, 'frames_per_second': sends*count,
+                                      'spread': noise})
+            print(f"[BENCH] telemetry_sender {fmt:6s} {count:5d} vehicles: {sends:10.1f} passes/s, {sends*count:10.0f} frames/s")
+    for transport, latency in [('udp', udp_latency), ('ring', ring_latency)]:
+        for fmt in ENCODERS:
+            latencies = latency(fmt)
+            p50, p99 = percentile_us(latencies, 50), percentile_us(latencies, 99)
+            noise = spread([np.median(part) for part in np.array_split(latencies, REPEATS)])
+            results['latency'].append({'format': fmt, 'transport': transport, 'latency_p50_us': p50, 'latency_p99_us': p99,
+                                       'spread': noise})
+            print(f"[BENCH] telemetry {fmt:6s} {transport:4s} latency: p50 {p50:7.1f} us, p99 {p99:7.1f} us")
+    return results
+
+# ===========================================================
+# ---- GCS Rendering Benchmarks ----
+# ===========================================================
+class Stub_Canvas():
+    # Stands in for tk.Canvas without a display: accepts the calls Strip_Chart makes and keeps
+    # the coordinates, so the timing covers everything but Tk's own drawing.
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.items = {}
+        self.bindings = {}
+
+    def create_line(self, *coords, **options):
+        return self.create('line', coords)
+
+    def create_text(self, *coords, **options):
+        return self.create('text', coords)
+
+    def create(self, kind, coords):
+        item = len(self.items) + 1
+        self.items[item] = list(coords)
+        return item
+
+    def coords(self, item, *coords):
+        self.items[item] = list(coords)
+
+    def itemconfigure(self, item, **options):
+        pass
+
+    def bind(self, sequence, callback):
+        self.bindings[sequence] = callback
+
+    def configure_event(self):
+        class Event():
+            pass
+        event = Event()
+        event.width, event.height = self.width, self.height
+        self.bindings['<Configure>'](event)
+
+
+def gcs_canvases(width, height):
+    """(name, make_canvas, flush) for a real Tk canvas when a display is available, and the stub."""
+    found = [('stub', lambda: Stub_Canvas(width, height), lambda: None)]
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+    except Exception:
+        print("[BENCH] gcs: no display, timing the stub canvas only")
+        return found, None
+    root.geometry(f"{2*width}x{2*height}")
+
+    def make_canvas():
+        canvas = tk.Canvas(root, width=width, height=height)
+        canvas.pack()
+        root.update()
+        return canvas
+    found.insert(0, ('tk', make_canvas, root.update))
+    return found, root
+
+
+def bench_gcs(width=400, height=120, history=None):
+    """Time the dashboard's chart redraw with a new sample each frame, after filling the history."""
+    import main
+    history = history or main.PLOT_HISTORY
+    results = []
+    canvases, root = gcs_canvases(width, height)
+    rng = np.random.default_rng(0)
+    for name, make_canvas, flush in canvases:
+        buffer = gcs_plots.Ring_Buffer(history, len(main.HISTORY_FIELDS))
+        for row in rng.standard_normal((history, len(main.HISTORY_FIELDS))):
+            buffer.append(row)
+        charts = []
+        for title, series, columns, (low, high), units in main.PLOTS:
+            canvas = make_canvas()
+            chart = gcs_plots.Strip_Chart(canvas, title, series, low, high, units)
+            if isinstance(canvas, Stub_Canvas):
+                canvas.configure_event()
+            else:
+                flush()
+            charts.append((chart, columns))
+        times = []
+        for frame in range(GCS_FRAMES):
+            buffer.append(rng.standard_normal(len(main.HISTORY_FIELDS)))
+            start = time.perf_counter()
+            for chart, columns in charts:
+                chart.update(buffer, columns)
+            flush()
+            times.append(time.perf_counter() - start)
+        mean, p99 = float(np.mean(times)*1e3), float(np.percentile(times, 99)*1e3)
+        noise = spread([np.mean(part) for part in np.array_split(times, REPEATS)])
+        results.append({'canvas': name, 'charts': len(charts), 'history': history, 'width': width,
+                        'redraw_ms': mean, 'redraw_p99_ms': p99, 'spread': noise})
+        print(f"[BENCH] gcs {name:4s} canvas, {len(charts)} charts of {history} samples: {mean:6.2f} ms per redraw, p99 {p99:6.2f} ms")
+    if root is not None:
+        root.destroy()
+    return results
+
+# ===========================================================
+# ---- Baseline Comparison ----
+# ===========================================================
+def flatten(results, prefix=''):
+    """{(case name, metric): value} for every metric in a results tree."""
+    found = {}
+    if isinstance(results, dict):
+        for key, value in results.items():
+            found.update(flatten(value, f"{prefix}/{key}" if prefix else key))
+    elif isinstance(results, list):
+        for entry in results:
+            case = " ".join(f"{key}={value}" for key, value in entry.items() if key not in METRICS)
+            for metric in METRICS:
+                if metric in entry:
+                    found[(f"{prefix} {case}", metric)] = entry[metric]
+    return found
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Metrics present in both that got worse by more than tolerance, or than the case's spread in
+    either run if that is larger, as (case, metric, old, new)."""
+    old = flatten(baseline)
+    new = flatten(results)
+    regressions = []
+    for (case, metric), value in new.items():
+        if (case, metric) not in old:
+            continue
+        before = old[(case, metric)]
+        if not METRICS[metric] or max(abs(before), abs(value)) < NOISE_FLOOR:
+            continue
+        change = (value - before)/abs(before) if before else 0.0
+        allowed = max(tolerance, old.get((case, 'spread'), 0.0), new.get((case, 'spread'), 0.0))
+        if METRICS[metric]*change < -allowed:
+            regressions.append((case, metric, before, value))
+            print(f"[BENCH] REGRESSION {case}: {metric} {before:.4g} -> {value:.4g} ({100*change:+.0f}%, allowed {100*allowed:.0f}%)")
+    print(f"[BENCH] {len(regressions)} regressions against the baseline (tolerance {100*tolerance:.0f}%)")
+    return regressions
+
+# ===========================================================
+# ---- CLI ----
+# ===========================================================
+def parse_args():
+    parser = argparse.ArgumentParser(description="Simulator benchmarks")
+    parser.add_argument("--vehicles", type=int, nargs="+", default=FLEET_SIZES, help="Fleet sizes to time")
+    parser.add_argument("--integrator", choices=quadcopter.Quadcopter.INTEGRATORS, action="append", default=None)
+    parser.add_argument("--suite", choices=SUITES, action="append", default=None, help="Benchmarks to run (default all)")
+    parser.add_argument("-o", "--output", default=None, help="Write the results to this JSON file")
+    parser.add_argument("--baseline", default=None, help="Results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="Relative change flagged as a regression")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    suites = args.suite or SUITES
+    results = {}
+    if 'dynamics' in suites:
+        results['dynamics'] = bench_dynamics(args.vehicles, args.integrator)
+    if 'control' in suites:
+        results['control'] = bench_control(args.vehicles)
+    if 'telemetry' in suites:
+        results['telemetry'] = bench_telemetry(args.vehicles)
+    if 'gcs' in suites:
+        results['gcs'] = bench_gcs()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
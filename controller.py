@@ -1,7 +1,5 @@
 import numpy as np
 import math
-import time
-import threading
 
 class Controller_PID_Point2Point():
     def __init__(self, get_state, get_time, actuate_motors, params, quad_identifier):
@@ -9,6 +7,19 @@ class Controller_PID_Point2Point():
         self.actuate_motors = actuate_motors
         self.get_state = get_state
         self.get_time = get_time
+        self.set_params(params)
+        self.xi_term = 0
+        self.yi_term = 0
+        self.zi_term = 0
+        self.thetai_term = 0
+        self.phii_term = 0
+        self.gammai_term = 0
+        self.target = [0,0,0]
+        self.yaw_target = 0.0
+
+    def set_params(self, params):
+        # (Re)load gains and limits from a controller parameter dictionary; integrator terms are kept
+        self.params = params
         self.MOTOR_LIMITS = params['Motor_limits']
         self.TILT_LIMITS = [(params['Tilt_limits'][0]/180.0)*3.14,(params['Tilt_limits'][1]/180.0)*3.14]
         self.YAW_CONTROL_LIMITS = params['Yaw_Control_Limits']
@@ -21,20 +32,18 @@ class Controller_PID_Point2Point():
         self.ANGULAR_P = params['Angular_PID']['P']
         self.ANGULAR_I = params['Angular_PID']['I']
         self.ANGULAR_D = params['Angular_PID']['D']
-        self.xi_term = 0
-        self.yi_term = 0
-        self.zi_term = 0
-        self.thetai_term = 0
-        self.phii_term = 0
-        self.gammai_term = 0
-        self.thread_object = None
-        self.target = [0,0,0]
-        self.yaw_target = 0.0
-        self.run = True
+        self.LINEAR_I_LIMIT = params['Linear_PID'].get('I_limit')
+        self.ANGULAR_I_LIMIT = params['Angular_PID'].get('I_limit')
 
     def wrap_angle(self,val):
         return( ( val + np.pi) % (2 * np.pi ) - np.pi )
 
+    def limit_integrators(self,terms,limits):
+        # Anti-windup: clamp each integrator term to +-limit
+        if not isinstance(limits,(list,tuple)):
+            limits = [limits]*3
+        return [min(max(term,-limit),limit) for term,limit in zip(terms,limits)]
+
     def update(self):
         [dest_x,dest_y,dest_z] = self.target
         [x,y,z,x_dot,y_dot,z_dot,theta,phi,gamma,theta_dot,phi_dot,gamma_dot] = self.get_state(self.quad_identifier)
@@ -44,6 +53,8 @@ class Controller_PID_Point2Point():
         self.xi_term += self.LINEAR_I[0]*x_error
         self.yi_term += self.LINEAR_I[1]*y_error
         self.zi_term += self.LINEAR_I[2]*z_error
+        if self.LINEAR_I_LIMIT is not None:
+            self.xi_term,self.yi_term,self.zi_term = self.limit_integrators([self.xi_term,self.yi_term,self.zi_term],self.LINEAR_I_LIMIT)
         dest_x_dot = self.LINEAR_P[0]*(x_error) + self.LINEAR_D[0]*(-x_dot) + self.xi_term
         dest_y_dot = self.LINEAR_P[1]*(y_error) + self.LINEAR_D[1]*(-y_dot) + self.yi_term
         dest_z_dot = self.LINEAR_P[2]*(z_error) + self.LINEAR_D[2]*(-z_dot) + self.zi_term
@@ -58,6 +69,8 @@ class Controller_PID_Point2Point():
         self.thetai_term += self.ANGULAR_I[0]*theta_error
         self.phii_term += self.ANGULAR_I[1]*phi_error
         self.gammai_term += self.ANGULAR_I[2]*gamma_dot_error
+        if self.ANGULAR_I_LIMIT is not None:
+            self.thetai_term,self.phii_term,self.gammai_term = self.limit_integrators([self.thetai_term,self.phii_term,self.gammai_term],self.ANGULAR_I_LIMIT)
         x_val = self.ANGULAR_P[0]*(theta_error) + self.ANGULAR_D[0]*(-theta_dot) + self.thetai_term
         y_val = self.ANGULAR_P[1]*(phi_error) + self.ANGULAR_D[1]*(-phi_dot) + self.phii_term
         z_val = self.ANGULAR_P[2]*(gamma_dot_error) + self.gammai_term
@@ -69,29 +82,15 @@ class Controller_PID_Point2Point():
         M = np.clip([m1,m2,m3,m4],self.MOTOR_LIMITS[0],self.MOTOR_LIMITS[1])
         self.actuate_motors(self.quad_identifier,M)
 
+    def get_integrator_terms(self):
+        return [self.xi_term,self.yi_term,self.zi_term,self.thetai_term,self.phii_term,self.gammai_term]
+
     def update_target(self,target):
         self.target = target
 
     def update_yaw_target(self,target):
         self.yaw_target = self.wrap_angle(target)
 
-    def thread_run(self,update_rate,time_scaling):
-        update_rate = update_rate*time_scaling
-        last_update = self.get_time()
-        while(self.run==True):
-            time.sleep(0)
-            self.time = self.get_time()
-            if (self.time - last_update).total_seconds() > update_rate:
-                self.update()
-                last_update = self.time
-
-    def start_thread(self,update_rate=0.005,time_scaling=1):
-        self.thread_object = threading.Thread(target=self.thread_run,args=(update_rate,time_scaling))
-        self.thread_object.start()
-
-    def stop_thread(self):
-        self.run = False
-
 class Controller_PID_Velocity(Controller_PID_Point2Point):
     def update(self):
         [dest_x,dest_y,dest_z] = self.target
@@ -102,6 +101,8 @@ class Controller_PID_Velocity(Controller_PID_Point2Point):
         self.xi_term += self.LINEAR_I[0]*x_error
         self.yi_term += self.LINEAR_I[1]*y_error
         self.zi_term += self.LINEAR_I[2]*z_error
+        if self.LINEAR_I_LIMIT is not None:
+            self.xi_term,self.yi_term,self.zi_term = self.limit_integrators([self.xi_term,self.yi_term,self.zi_term],self.LINEAR_I_LIMIT)
         dest_x_dot = self.LINEAR_P[0]*(x_error) + self.LINEAR_D[0]*(-x_dot) + self.xi_term
         dest_y_dot = self.LINEAR_P[1]*(y_error) + self.LINEAR_D[1]*(-y_dot) + self.yi_term
         dest_z_dot = self.LINEAR_P[2]*(z_error) + self.LINEAR_D[2]*(-z_dot) + self.zi_term
@@ -116,6 +117,8 @@ class Controller_PID_Velocity(Controller_PID_Point2Point):
         self.thetai_term += self.ANGULAR_I[0]*theta_error
         self.phii_term += self.ANGULAR_I[1]*phi_error
         self.gammai_term += self.ANGULAR_I[2]*gamma_dot_error
+        if self.ANGULAR_I_LIMIT is not None:
+            self.thetai_term,self.phii_term,self.gammai_term = self.limit_integrators([self.thetai_term,self.phii_term,self.gammai_term],self.ANGULAR_I_LIMIT)
         x_val = self.ANGULAR_P[0]*(theta_error) + self.ANGULAR_D[0]*(-theta_dot) + self.thetai_term
         y_val = self.ANGULAR_P[1]*(phi_error) + self.ANGULAR_D[1]*(-phi_dot) + self.phii_term
         z_val = self.ANGULAR_P[2]*(gamma_dot_error) + self.gammai_term
@@ -126,3 +129,151 @@ class Controller_PID_Velocity(Controller_PID_Point2Point):
         m4 = throttle - y_val - z_val
         M = np.clip([m1,m2,m3,m4],self.MOTOR_LIMITS[0],self.MOTOR_LIMITS[1])
         self.actuate_motors(self.quad_identifier,M)
+
+# ===========================================================
+# ---- Controller Bank ----
+# ===========================================================
+# The cascade of Controller_PID_Point2Point/Controller_PID_Velocity for N vehicles at once:
+# targets, gains, limits and integrator terms are (N,...) arrays and update() computes every
+# vehicle's motor commands in one vectorized pass, with the same arithmetic in the same order
+# as the scalar controllers. Each vehicle has its own gains (params is either one parameter
+# dictionary shared by all vehicles, or a dictionary of them by vehicle id) and is either a
+# point to point or a velocity controller.
+# Integrator anti-windup: the optional 'I_limit' entries of Linear_PID and Angular_PID clamp
+# the accumulated integrator terms to +-I_limit (no limit when absent).
+
+class Controller_Bank():
+    def __init__(self, get_states, actuate_all, params, keys, velocity=False):
+        self.keys = list(keys)
+        self.index = {key: i for i, key in enumerate(self.keys)}
+        self.get_states = get_states
+        self.actuate_all = actuate_all
+        n = len(self.keys)
+        self.motor_limits = np.zeros((n,2))
+        self.tilt_limits = np.zeros((n,2))
+        self.yaw_control_limits = np.zeros((n,2))
+        self.z_limits = np.zeros((n,2))
+        self.linear_p = np.zeros((n,3))
+        self.linear_i = np.zeros((n,3))
+        self.linear_d = np.zeros((n,3))
+        self.linear_to_angular_scaler = np.zeros((n,2))
+        self.yaw_rate_scaler = np.zeros(n)
+        self.angular_p = np.zeros((n,3))
+        self.angular_i = np.zeros((n,3))
+        self.angular_d = np.zeros((n,3))
+        self.integral_limits = np.full((n,6), np.inf)
+        self.integrators = np.zeros((n,6))  # x, y, z, theta, phi, gamma
+        self.targets = np.zeros((n,3))
+        self.yaw_targets = np.zeros(n)
+        self.velocity = np.zeros(n, dtype=bool)
+        self.params = {}
+        for key in self.keys:
+            self.set_params(key, params[key] if key in params else params)
+            self.set_velocity(key, velocity[key] if isinstance(velocity, dict) else velocity)
+
+    def set_params(self, key, params):
+        """Load one vehicle's gains and limits from a controller parameter dictionary."""
+        i = self.index[key]
+        self.params[key] = params
+        self.motor_limits[i] = params['Motor_limits']
+        self.tilt_limits[i] = [(params['Tilt_limits'][0]/180.0)*3.14,(params['Tilt_limits'][1]/180.0)*3.14]
+        self.yaw_control_limits[i] = params['Yaw_Control_Limits']
+        self.z_limits[i] = [self.motor_limits[i,0]+params['Z_XY_offset'],self.motor_limits[i,1]-params['Z_XY_offset']]
+        self.linear_p[i] = params['Linear_PID']['P']
+        self.linear_i[i] = params['Linear_PID']['I']
+        self.linear_d[i] = params['Linear_PID']['D']
+        self.linear_to_angular_scaler[i] = params['Linear_To_Angular_Scaler'][0:2]
+        self.yaw_rate_scaler[i] = params['Yaw_Rate_Scaler']
+        self.angular_p[i] = params['Angular_PID']['P']
+        self.angular_i[i] = params['Angular_PID']['I']
+        self.angular_d[i] = params['Angular_PID']['D']
+        self.integral_limits[i,0:3] = params['Linear_PID'].get('I_limit', np.inf)
+        self.integral_limits[i,3:6] = params['Angular_PID'].get('I_limit', np.inf)
+        self.windup = bool(np.isfinite(self.integral_limits).any())
+
+    def set_velocity(self, key, velocity=True):
+        """Make a vehicle a velocity (x,y velocity and altitude) or a point to point controller."""
+        self.velocity[self.index[key]] = velocity
+
+    def wrap_angle(self,val):
+        return( ( val + np.pi) % (2 * np.pi ) - np.pi )
+
+    def update(self):
+        s = self.get_states()
+        x_dot, y_dot, z_dot = s[:,3], s[:,4], s[:,5]
+        theta, phi, gamma = s[:,6], s[:,7], s[:,8]
+        theta_dot, phi_dot, gamma_dot = s[:,9], s[:,10], s[:,11]
+        # Point to point controllers track position, velocity controllers x,y velocity
+        errors = self.targets - s[:,0:3]
+        if self.velocity.any():
+            errors[:,0:2] = np.where(self.velocity[:,None], self.targets[:,0:2] - s[:,3:5], errors[:,0:2])
+        integrators = self.integrators
+        integrators[:,0:3] += self.linear_i*errors
+        if self.windup:
+            np.clip(integrators[:,0:3], -self.integral_limits[:,0:3], self.integral_limits[:,0:3], out=integrators[:,0:3])
+        dest_dot = self.linear_p*errors + self.linear_d*(-s[:,3:6]) + integrators[:,0:3]
+        dest_x_dot, dest_y_dot = dest_dot[:,0], dest_dot[:,1]
+        throttle = np.clip(dest_dot[:,2],self.z_limits[:,0],self.z_limits[:,1])
+        sin_gamma, cos_gamma = np.sin(gamma), np.cos(gamma)
+        dest_theta = self.linear_to_angular_scaler[:,0]*(dest_x_dot*sin_gamma-dest_y_dot*cos_gamma)
+        dest_phi = self.linear_to_angular_scaler[:,1]*(dest_x_dot*cos_gamma+dest_y_dot*sin_gamma)
+        dest_theta = np.clip(dest_theta,self.tilt_limits[:,0],self.tilt_limits[:,1])
+        dest_phi = np.clip(dest_phi,self.tilt_limits[:,0],self.tilt_limits[:,1])
+        angular_errors = np.empty_like(errors)
+        angular_errors[:,0] = dest_theta-theta
+        angular_errors[:,1] = dest_phi-phi
+        angular_errors[:,2] = (self.yaw_rate_scaler*self.wrap_angle(self.yaw_targets-gamma)) - gamma_dot
+        integrators[:,3:6] += self.angular_i*angular_errors
+        if self.windup:
+            np.clip(integrators[:,3:6], -self.integral_limits[:,3:6], self.integral_limits[:,3:6], out=integrators[:,3:6])
+        x_val = self.angular_p[:,0]*angular_errors[:,0] + self.angular_d[:,0]*(-theta_dot) + integrators[:,3]
+        y_val = self.angular_p[:,1]*angular_errors[:,1] + self.angular_d[:,1]*(-phi_dot) + integrators[:,4]
+        z_val = self.angular_p[:,2]*angular_errors[:,2] + integrators[:,5]
+        z_val = np.clip(z_val,self.yaw_control_limits[:,0],self.yaw_control_limits[:,1])
+        M = np.empty((len(self.keys),4))
+        M[:,0] = throttle + x_val + z_val
+        M[:,1] = throttle + y_val - z_val
+        M[:,2] = throttle - x_val + z_val
+        M[:,3] = throttle - y_val - z_val
+        np.clip(M,self.motor_limits[:,0:1],self.motor_limits[:,1:2],out=M)
+        self.actuate_all(M)
+
+    def get_integrator_terms(self,key):
+        return self.integrators[self.index[key]].tolist()
+
+    def update_target(self,key,target):
+        self.targets[self.index[key]] = target
+
+    def update_yaw_target(self,key,target):
+        self.yaw_targets[self.index[key]] = self.wrap_angle(target)
+
+    def controller(self,key):
+        """A per-vehicle handle with the scalar controllers' interface, e.g. for Flight_Mode_Handler."""
+        return Controller_Bank_Vehicle(self,key)
+
+
+class Controller_Bank_Vehicle():
+    def __init__(self, bank, key):
+        self.bank = bank
+        self.quad_identifier = key
+        self.MOTOR_LIMITS = bank.motor_limits[bank.index[key]]
+
+    @property
+    def params(self):
+        return self.bank.params[self.quad_identifier]
+
+    def set_params(self,params):
+        self.bank.set_params(self.quad_identifier,params)
+
+    @property
+    def target(self):
+        return tuple(self.bank.targets[self.bank.index[self.quad_identifier]])
+
+    def update_target(self,target):
+        self.bank.update_target(self.quad_identifier,target)
+
+    def update_yaw_target(self,target):
+        self.bank.update_yaw_target(self.quad_identifier,target)
+
+    def get_integrator_terms(self):
+        return self.bank.get_integrator_terms(self.quad_identifier)
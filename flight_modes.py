@@ -0,0 +1,58 @@
+import mission
+import navigation
+
+MODES = ['GUIDED', 'TAKEOFF', 'LAND', 'RTL']
+
+class Flight_Mode_Handler():
+    # TAKEOFF/LAND/RTL/GUIDED state machine for one vehicle. step() is called every flight mode
+    # tick with the vehicle position and pushes the current target into the controller.
+    # It holds no sockets or threads so the same logic runs in the simulator and headless.
+    # The mission is an (M,3) float array; an array passed in is used as is, not copied.
+    # Waypoint progression and path following are in navigation.Mission_Path: 'acceptance' is
+    # the acceptance radius (m) and 'lookahead' the line of sight distance (m, 0 to fly
+    # straight at each waypoint).
+    def __init__(self, waypoints, mode='GUIDED', takeoff_altitude=2.0, home=(0, 0, 0),
+                 acceptance=navigation.DEFAULT_ACCEPTANCE_RADIUS, lookahead=navigation.DEFAULT_LOOKAHEAD):
+        self.mode = mode
+        self.set_waypoints(waypoints)
+        self.takeoff_altitude = takeoff_altitude
+        self.home = tuple(home)
+        self.acceptance = acceptance
+        self.lookahead = lookahead
+
+    def set_mode(self, mode):
+        mode = mode.upper()
+        if mode not in MODES:
+            return False
+        self.mode = mode
+        self.wp_index = 0
+        self.origin = None
+        return True
+
+    def set_waypoints(self, waypoints):
+        self.waypoints = mission.as_waypoints(waypoints)
+        self.path = navigation.Mission_Path(self.waypoints)
+        self.wp_index = 0
+        self.origin = None  # Start of the first leg: where the vehicle was when it began the mission
+
+    def mission_complete(self):
+        return self.mode == 'GUIDED' and self.wp_index >= len(self.waypoints)
+
+    def step(self, ctrl, pos):
+        # Returns True on the tick a GUIDED waypoint is reached
+        if self.mode == 'TAKEOFF':
+            ctrl.update_target((pos[0], pos[1], self.takeoff_altitude))
+        elif self.mode == 'LAND':
+            ctrl.update_target((pos[0], pos[1], 0.0))
+        elif self.mode == 'RTL':
+            ctrl.update_target(self.home)
+        elif self.mode == 'GUIDED':
+            if self.wp_index < len(self.waypoints):
+                if self.origin is None:
+                    self.origin = [float(p) for p in pos]
+                reached, target = self.path.progress(self.wp_index, pos, self.origin, self.acceptance, self.lookahead)
+                ctrl.update_target(target)
+                if reached:
+                    self.wp_index += 1
+                    return True
+        return False
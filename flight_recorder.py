@@ -0,0 +1,190 @@
+import argparse
+import csv
+import os
+import queue
+import struct
+import threading
+import time
+from datetime import datetime
+import numpy as np
+import flight_modes
+import telemetry
+
+# ===========================================================
+# ---- Flight Recorder ----
+# ===========================================================
+# Append-only binary flight logs (.qfl). A file is a 32 byte header followed by fixed-size
+# little-endian records, so a log can be memory-mapped and indexed as a NumPy array:
+#   header: magic '4s', version 'H', record size 'H', start time 'd' (epoch s), reserved '16x'
+#   record: RECORD_DTYPES[version]
+# Records are queued by the caller and written in batches by a background thread, and the
+# log is rotated to a new file once it exceeds a size or an age limit.
+
+MAGIC = b'QFLT'
+VERSION = 2
+HEADER = struct.Struct('<4sHHd16x')
+EXTENSION = '.qfl'
+
+RECORD_DTYPES = {
+    1: np.dtype([
+        ('timestamp', '<f8'),  # wall clock, epoch seconds (sub-millisecond resolution)
+        ('sim_time', '<f8'),
+        ('vehicle', 'S8'),
+        ('seq', '<u4'),
+        ('mode', 'u1'),
+        ('waypoint_index', '<u2'),
+        ('battery', '<f4'),
+        ('position', '<f4', (3,)),
+        ('orientation', '<f4', (3,)),
+        ('velocity', '<f4', (3,)),
+    ], align=False),
+    2: np.dtype([
+        ('timestamp', '<f8'),
+        ('sim_time', '<f8'),
+        ('vehicle', 'S8'),
+        ('seq', '<u4'),
+        ('mode', 'u1'),
+        ('waypoint_index', '<u2'),
+        ('battery', '<f4'),
+        ('position', '<f4', (3,)),
+        ('orientation', '<f4', (3,)),
+        ('velocity', '<f4', (3,)),
+        ('voltage', '<f4'),  # V, terminal voltage under load
+        ('current', '<f4'),  # A
+        ('energy', '<f4'),  # Wh remaining
+    ], align=False),
+}
+RECORD_DTYPE = RECORD_DTYPES[VERSION]
+
+CSV_HEADER = ["Timestamp", "Mode", "Battery", "X", "Y", "Z", "Yaw", "Vehicle"]
+
+
+class Flight_Recorder():
+    def __init__(self, directory='.', prefix='flight_log', max_bytes=64*1024*1024, max_seconds=3600.0, flush_interval=0.5):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.flush_interval = flush_interval
+        self.queue = queue.SimpleQueue()
+        self.file = None
+        self.filename = None
+        self.files = []
+        self.file_bytes = 0
+        self.file_opened = 0.0
+        self.records = 0
+        self.run = True
+        self.open_file()
+        self.thread_object = threading.Thread(target=self.thread_run, daemon=True)
+        self.thread_object.start()
+
+    def record(self, frame):
+        """Queue one decoded state frame; stamped now, written later by the writer thread."""
+        self.queue.put((time.time(), frame))
+
+    def open_file(self):
+        if self.file is not None:
+            self.file.close()
+        start = time.time()
+        stamp = datetime.fromtimestamp(start).strftime("%Y-%m-%d_%H-%M-%S")
+        self.filename = os.path.join(self.directory, f"{self.prefix}_{stamp}_{len(self.files):03d}{EXTENSION}")
+        self.file = open(self.filename, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, RECORD_DTYPE.itemsize, start))
+        self.file_bytes = HEADER.size
+        self.file_opened = start
+        self.files.append(self.filename)
+
+    def write_batch(self, items):
+        frames = [frame for timestamp, frame in items]
+        records = np.zeros(len(items), dtype=RECORD_DTYPE)
+        records['timestamp'] = [timestamp for timestamp, frame in items]
+        records['sim_time'] = [f.get('sim_time', 0.0) for f in frames]
+        records['vehicle'] = [f.get('id', telemetry.DEFAULT_VEHICLE).encode() for f in frames]
+        records['seq'] = [f.get('seq', 0) for f in frames]
+        records['mode'] = [telemetry.MODE_CODES.get(f.get('mode'), telemetry.MODE_UNKNOWN) for f in frames]
+        records['waypoint_index'] = [f.get('waypoint_index', 0) for f in frames]
+        records['battery'] = [f.get('battery', 0.0) for f in frames]
+        records['position'] = [f.get('position', (0, 0, 0)) for f in frames]
+        records['orientation'] = [f.get('orientation', (0, 0, 0)) for f in frames]
+        records['velocity'] = [f.get('velocity', (0, 0, 0)) for f in frames]
+        records['voltage'] = [f.get('voltage', 0.0) for f in frames]
+        records['current'] = [f.get('current', 0.0) for f in frames]
+        records['energy'] = [f.get('energy', 0.0) for f in frames]
+        self.file.write(records.tobytes())
+        self.file.flush()
+        self.file_bytes += records.nbytes
+        self.records += len(records)
+
+    def drain(self):
+        items = []
+        while True:
+            try:
+                items.append(self.queue.get_nowait())
+            except queue.Empty:
+                return items
+
+    def thread_run(self):
+        while self.run:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        items = self.drain()
+        if items:
+            self.write_batch(items)
+        if self.file_bytes >= self.max_bytes or time.time() - self.file_opened >= self.max_seconds:
+            self.open_file()
+
+    def close(self):
+        self.run = False
+        self.thread_object.join()
+        self.flush()
+        self.file.close()
+
+
+def read_header(path):
+    with open(path, 'rb') as f:
+        magic, version, record_size, start = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError(f'{path} is not a flight log')
+    if version not in RECORD_DTYPES or RECORD_DTYPES[version].itemsize != record_size:
+        raise ValueError(f'Unsupported flight log version {version}')
+    return version, start
+
+
+def load(path):
+    """Read a whole flight log into a structured array."""
+    version, start = read_header(path)
+    return np.fromfile(path, dtype=RECORD_DTYPES[version], offset=HEADER.size)
+
+
+def mode_name(code):
+    return flight_modes.MODES[code] if code < len(flight_modes.MODES) else 'N/A'
+
+
+def export_csv(path, csv_path=None):
+    """Convert a flight log to the GCS's original CSV layout."""
+    csv_path = csv_path or os.path.splitext(path)[0] + '.csv'
+    records = load(path)
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER)
+        for r in records:
+            writer.writerow([
+                datetime.fromtimestamp(r['timestamp']).strftime("%H:%M:%S"),
+                mode_name(r['mode']),
+                round(float(r['battery']), 2),
+                f"{r['position'][0]:.2f}", f"{r['position'][1]:.2f}", f"{r['position'][2]:.2f}",
+                f"{r['orientation'][2]:.2f}",
+                r['vehicle'].decode()
+            ])
+    return csv_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flight log tools")
+    parser.add_argument("logs", nargs="+", help="Flight logs (.qfl) to export")
+    parser.add_argument("-o", "--output", default=None, help="CSV file (only with a single log)")
+    args = parser.parse_args()
+    for log in args.logs:
+        print(f"Exported {log} -> {export_csv(log, args.output if len(args.logs) == 1 else None)}")
@@ -0,0 +1,108 @@
+import numpy as np
+
+# ===========================================================
+# ---- GCS Plotting ----
+# ===========================================================
+# Canvas items are created once and moved with coords() afterwards; nothing is deleted and
+# recreated per frame. History lives in NumPy ring buffers, and a chart only redraws when its
+# buffer or its size changed. Histories longer than the plot is wide are reduced to one
+# min/max pair per pixel column, so spikes stay visible at any zoom.
+
+
+class Ring_Buffer():
+    # Fixed-capacity history of 'fields' values per sample. Every sample is written twice,
+    # capacity apart, so the newest 'capacity' samples are always one contiguous slice.
+    def __init__(self, capacity, fields=1, fill=0.0):
+        self.capacity = capacity
+        self.data = np.full((2*capacity, fields), fill, dtype=float)
+        self.head = 0
+        self.count = 0
+        self.version = 0
+
+    def append(self, values):
+        self.data[self.head] = values
+        self.data[self.head + self.capacity] = values
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.version += 1
+
+    def values(self):
+        """Samples oldest first, as a view (count x fields)."""
+        end = self.head + self.capacity
+        return self.data[end - self.count:end]
+
+    def last(self):
+        return self.data[self.head + self.capacity - 1]
+
+
+def minmax_decimate(values, buckets):
+    """Reduce values to at most 2*buckets points, keeping each bucket's min and max.
+
+    Returns (x, y) with x the fractional sample position (0..1) of each point."""
+    n = len(values)
+    if n <= 2*buckets:
+        return np.linspace(0.0, 1.0, n) if n > 1 else np.zeros(n), values
+    size = n//buckets
+    trimmed = values[n - size*buckets:].reshape(buckets, size)
+    y = np.empty(2*buckets)
+    y[0::2] = trimmed.min(axis=1)
+    y[1::2] = trimmed.max(axis=1)
+    x = np.repeat(np.linspace(0.0, 1.0, buckets), 2)
+    return x, y
+
+
+class Strip_Chart():
+    # One scrolling plot of one or more series on its own canvas. The y range starts at
+    # (low, high) and widens to fit the data.
+    def __init__(self, canvas, title, series, low, high, units=""):
+        self.canvas = canvas
+        self.title = title
+        self.low = low
+        self.high = high
+        self.units = units
+        self.width = 0
+        self.height = 0
+        self.drawn = None
+        self.text = {}
+        self.grid = canvas.create_line(0, 0, 0, 0, fill="#333", dash=(2, 4))
+        self.lines = [canvas.create_line(0, 0, 0, 0, fill=color, width=2) for name, color in series]
+        self.lbl_title = canvas.create_text(4, 2, anchor="nw", fill="#888", font=("Segoe UI", 8), text=title)
+        self.lbl_value = canvas.create_text(0, 2, anchor="ne", fill="#ccc", font=("Consolas", 9))
+        self.lbl_high = canvas.create_text(4, 0, anchor="sw", fill="#666", font=("Consolas", 8))
+        self.lbl_low = canvas.create_text(4, 0, anchor="sw", fill="#666", font=("Consolas", 8))
+        canvas.bind("<Configure>", self.resize)
+
+    def resize(self, event):
+        self.width, self.height = event.width, event.height
+        self.canvas.coords(self.grid, 0, self.height/2, self.width, self.height/2)
+        self.canvas.coords(self.lbl_value, self.width - 4, 2)
+        self.canvas.coords(self.lbl_high, 4, 26)
+        self.canvas.coords(self.lbl_low, 4, self.height - 2)
+        self.drawn = None
+
+    def set_text(self, item, text):
+        if self.text.get(item) != text:
+            self.canvas.itemconfigure(item, text=text)
+            self.text[item] = text
+
+    def update(self, history, columns):
+        """Redraw from a Ring_Buffer, plotting its 'columns' (one per series)."""
+        if self.width < 2 or self.height < 2 or (history, history.version, self.width) == self.drawn:
+            return
+        self.drawn = (history, history.version, self.width)
+        values = history.values()[:, columns]
+        if len(values) < 2:
+            return
+        low = min(self.low, float(values.min()))
+        high = max(self.high, float(values.max()))
+        scale = (self.height - 30)/(high - low or 1.0)
+        buckets = max(1, self.width//2)
+        for line, column in zip(self.lines, range(values.shape[1])):
+            x, y = minmax_decimate(values[:, column], buckets)
+            points = np.empty(2*len(x))
+            points[0::2] = x*(self.width - 1)
+            points[1::2] = self.height - 2 - (y - low)*scale
+            self.canvas.coords(line, *points.tolist())
+        self.set_text(self.lbl_high, f"{high:.1f}")
+        self.set_text(self.lbl_low, f"{low:.1f}")
+        self.set_text(self.lbl_value, "  ".join(f"{v:.2f}" for v in values[-1]) + self.units)
@@ -1,15 +1,44 @@
 import numpy as np
 import math
 import matplotlib.pyplot as plt
-import mpl_toolkits.mplot3d.axes3d as Axes3D
 import sys
+import time
+
+def rotation_matrices(angles):
+    # Same rotation as GUI.rotation_matrix (R_z.R_y.R_x) for an (N,3) array of angles at once
+    ct, cp, cg = np.cos(angles).T
+    st, sp, sg = np.sin(angles).T
+    return np.stack([
+        np.stack([cg*cp, cg*sp*st-sg*ct, cg*sp*ct+sg*st], axis=-1),
+        np.stack([sg*cp, sg*sp*st+cg*ct, sg*sp*ct-cg*st], axis=-1),
+        np.stack([-sp, cp*st, cp*ct], axis=-1)], axis=1)
+
+def arm_points(positions, orientations, arm_lengths):
+    """World coordinates (N,5,3) of both arm ends and the hub of every quad."""
+    body = np.array([[-1,0,0], [1,0,0], [0,-1,0], [0,1,0], [0,0,0]], dtype=float)
+    body = body[None,:,:]*np.asarray(arm_lengths, dtype=float)[:,None,None]
+    return np.einsum('nij,nkj->nki', rotation_matrices(np.asarray(orientations, dtype=float)), body) + np.asarray(positions, dtype=float)[:,None,:]
+
+def segments(points):
+    # Join (N,k,3) point groups into one polyline per coordinate, NaN separated, so a
+    # single artist draws every quad
+    n, k, _ = points.shape
+    joined = np.full((n, k+1, 3), np.nan)
+    joined[:, :k] = points
+    return joined.reshape(-1, 3).T
 
 class GUI():
     # 'quad_list' is a dictionary of format: quad_list = {'quad_1_name':{'position':quad_1_position,'orientation':quad_1_orientation,'arm_span':quad_1_arm_span}, ...}
-    def __init__(self, quads):
+    # With blit=True all quads are drawn by a few shared artists over a cached background, and
+    # 'trail' keeps that many past hub positions per quad as a path layer.
+    def __init__(self, quads, blit=False, trail=0):
         self.quads = quads
+        self.keys = list(quads)
+        self.blit = blit
+        self.trail_length = trail
+        self.background = None
         self.fig = plt.figure()
-        self.ax = Axes3D.Axes3D(self.fig)
+        self.ax = self.fig.add_subplot(projection='3d')
         self.ax.set_xlim3d([-2.0, 2.0])
         self.ax.set_xlabel('X')
         self.ax.set_ylim3d([-2.0, 2.0])
@@ -17,7 +46,10 @@ class GUI():
         self.ax.set_zlim3d([0, 5.0])
         self.ax.set_zlabel('Z')
         self.ax.set_title('Quadcopter Simulation')
-        self.init_plot()
+        if blit:
+            self.init_blit()
+        else:
+            self.init_plot()
         self.fig.canvas.mpl_connect('key_press_event', self.keypress_routine)
 
     def rotation_matrix(self,angles):
@@ -39,7 +71,79 @@ class GUI():
             self.quads[key]['l2'], = self.ax.plot([],[],[],color='red',linewidth=3,antialiased=False)
             self.quads[key]['hub'], = self.ax.plot([],[],[],marker='o',color='green', markersize=6,antialiased=False)
 
+    def init_blit(self):
+        self.arm_lengths = np.array([self.quads[key]['L'] for key in self.keys])
+        self.l1, = self.ax.plot([],[],[],color='blue',linewidth=3,antialiased=False,animated=True)
+        self.l2, = self.ax.plot([],[],[],color='red',linewidth=3,antialiased=False,animated=True)
+        self.hubs, = self.ax.plot([],[],[],marker='o',linestyle='none',color='green',markersize=6,antialiased=False,animated=True)
+        self.trail, = self.ax.plot([],[],[],color='gray',linewidth=1,alpha=0.6,animated=True)
+        self.artists = [self.trail, self.l1, self.l2, self.hubs]
+        # Each hub position is written twice, trail_length apart, so the path is one slice
+        self.trail_points = np.zeros((len(self.keys), 2*max(1, self.trail_length), 3))
+        self.trail_head = 0
+        self.trail_count = 0
+        # Any full redraw (resize, rotating the view, new limits) refreshes the background
+        self.fig.canvas.mpl_connect('draw_event', self.capture_background)
+        plt.show(block=False)
+        self.fig.canvas.draw()
+
+    def capture_background(self, event):
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        for artist in self.artists:
+            self.ax.draw_artist(artist)
+
+    def draw_frame(self, positions, orientations):
+        """Draw every quad from (N,3) position and orientation arrays ordered like the quads dict."""
+        points = arm_points(positions, orientations, self.arm_lengths)
+        self.l1.set_data_3d(*segments(points[:, 0:2]))
+        self.l2.set_data_3d(*segments(points[:, 2:4]))
+        self.hubs.set_data_3d(*points[:, 4].T)
+        if self.trail_length:
+            n = self.trail_length
+            self.trail_points[:, self.trail_head] = points[:, 4]
+            self.trail_points[:, self.trail_head+n] = points[:, 4]
+            self.trail_head = (self.trail_head+1) % n
+            self.trail_count = min(self.trail_count+1, n)
+            self.trail.set_data_3d(*segments(self.trail_points[:, self.trail_head+n-self.trail_count:self.trail_head+n]))
+        canvas = self.fig.canvas
+        if self.background is None:
+            canvas.draw()
+        else:
+            canvas.restore_region(self.background)
+            for artist in self.artists:
+                self.ax.draw_artist(artist)
+            canvas.blit(self.fig.bbox)
+        canvas.flush_events()
+
+    def run(self, snapshot, fps=30, running=lambda: True, timer=None):
+        # Render at 'fps' from snapshot() -> (positions, orientations). Frames that can't be
+        # rendered in time are skipped rather than queued, so rendering never falls behind.
+        # An optional loop_timing.Loop_Timer records every frame.
+        period = 1.0/fps
+        next_frame = time.perf_counter()
+        while running() and plt.fignum_exists(self.fig.number):
+            start = timer.start() if timer is not None else None
+            positions, orientations = snapshot()
+            if self.blit:
+                self.draw_frame(positions, orientations)
+            else:
+                for key, position, orientation in zip(self.keys, positions, orientations):
+                    self.quads[key]['position'] = position
+                    self.quads[key]['orientation'] = orientation
+                self.update()
+            if timer is not None:
+                timer.stop(start)
+            next_frame = max(next_frame+period, time.perf_counter())
+            delay = max(0.0, next_frame-time.perf_counter())
+            if timer is not None:
+                timer.sleep(delay)
+            else:
+                time.sleep(delay)
+
     def update(self):
+        if self.blit:
+            self.draw_frame([self.quads[key]['position'] for key in self.keys], [self.quads[key]['orientation'] for key in self.keys])
+            return
         for key in self.quads:
             R = self.rotation_matrix(self.quads[key]['orientation'])
             L = self.quads[key]['L']
@@ -80,3 +184,5 @@ class GUI():
             x[0] -= 0.2
             x[1] -= 0.2
             self.ax.set_xlim3d(x)
+        if self.blit:
+            self.fig.canvas.draw_idle()
@@ -1,5 +1,6 @@
 import socket
 import json
+import telemetry
 
 UDP_IP = "127.0.0.1"   # same IP as in simulator
 UDP_PORT = 9000       # same port as in simulator
@@ -12,7 +13,7 @@ print(f"✅ Listening for telemetry on udp://{UDP_IP}:{UDP_PORT} ...\n")
 while True:
     data, addr = sock.recvfrom(4096)
     try:
-        telemetry = json.loads(data.decode())
-        print("📡 Telemetry:", telemetry)
-    except json.JSONDecodeError:
-        print("⚠️ Invalid JSON packet received")
+        frame = telemetry.decode(data)
+        print("📡 Telemetry:", frame)
+    except (json.JSONDecodeError, ValueError):
+        print("⚠️ Invalid telemetry packet received")
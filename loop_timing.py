@@ -0,0 +1,206 @@
+import bisect
+import json
+import sys
+import threading
+import time
+
+# ===========================================================
+# ---- Loop Timing ----
+# ===========================================================
+# Every periodic loop owns a Loop_Timer and marks the start and end of each pass. The timer
+# keeps histograms (fixed, doubling bucket edges, so recording is one bisect and an increment)
+# of the interval between passes, the time a pass took, and how late the loop woke from its
+# sleep or missed its deadline. Counters:
+#   overruns  passes that took longer than the loop's target period
+#   late      intervals longer than LATE_FACTOR target periods (missed deadlines)
+# Wake-up lateness is the GIL contention indicator: a thread that has finished sleeping still
+# has to wait for the GIL, which a busy thread only gives up every sys.getswitchinterval()
+# (5 ms by default), so lateness near that value means the threads are fighting over it.
+# Gil_Probe measures this on a thread of its own, which does nothing else.
+# A timer is only written by its own loop; other threads read it through stats().
+
+EDGES = [0.00005*2**i for i in range(17)]  # 50 us .. 3.3 s, plus an overflow bucket
+LATE_FACTOR = 1.5
+SMOOTHING = 0.05  # Weight of the newest sample in the moving averages (which start at the first)
+GIL_PROBE_INTERVAL = 0.01
+
+
+def percentile(counts, q):
+    """Upper bucket edge below which fraction q of the samples lie (inf in the overflow bucket)."""
+    total = sum(counts)
+    if not total:
+        return 0.0
+    running = 0
+    for edge, count in zip(EDGES + [float('inf')], counts):
+        running += count
+        if running >= q*total:
+            return edge
+    return float('inf')
+
+
+class Histogram():
+    def __init__(self):
+        self.counts = [0]*(len(EDGES) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(EDGES, value)] += 1
+        self.total += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def stats(self, counts=True):
+        """Summary statistics, and the bucket counts unless counts is False."""
+        buckets = list(self.counts)
+        stats = {'mean': self.total/self.count if self.count else 0.0, 'p50': percentile(buckets, 0.5),
+                 'p99': percentile(buckets, 0.99), 'max': self.max}
+        if counts:
+            stats['counts'] = buckets
+        return stats
+
+
+class Loop_Timer():
+    def __init__(self, name, period=None):
+        self.name = name
+        self.period = period  # Target period (s) in wall time, None if the loop is event driven
+        self.interval = Histogram()
+        self.execution = Histogram()
+        self.wake = Histogram()
+        self.passes = 0
+        self.overruns = 0
+        self.late = 0
+        self.last_start = None
+        self.average_interval = 0.0
+        self.average_execution = 0.0
+
+    def start(self):
+        now = time.perf_counter()
+        if self.last_start is not None:
+            interval = now - self.last_start
+            self.interval.add(interval)
+            self.average_interval += (SMOOTHING if self.average_interval else 1.0)*(interval - self.average_interval)
+            if self.period and interval > LATE_FACTOR*self.period:
+                self.late += 1
+        self.last_start = now
+        return now
+
+    def stop(self, start):
+        execution = time.perf_counter() - start
+        self.execution.add(execution)
+        self.average_execution += (SMOOTHING if self.passes else 1.0)*(execution - self.average_execution)
+        self.passes += 1
+        if self.period and execution > self.period:
+            self.overruns += 1
+        return execution
+
+    def woke(self, lateness):
+        self.wake.add(max(lateness, 0.0))
+
+    def sleep(self, delay):
+        """time.sleep(delay), recording how late the thread got going again."""
+        deadline = time.perf_counter() + delay
+        time.sleep(delay)
+        self.woke(time.perf_counter() - deadline)
+
+    def stats(self, counts=True):
+        return {
+            'period': self.period,
+            'passes': self.passes,
+            'overruns': self.overruns,
+            'late': self.late,
+            'rate': 1.0/self.average_interval if self.average_interval > 0 else 0.0,
+            'average_execution': self.average_execution,
+            'interval': self.interval.stats(counts),
+            'execution': self.execution.stats(counts),
+            'wake': self.wake.stats(counts),
+        }
+
+
+def timed(callback, timer):
+    """callback wrapped to record every call in timer, e.g. an event-driven receive handler."""
+    def call(*args):
+        start = timer.start()
+        try:
+            return callback(*args)
+        finally:
+            timer.stop(start)
+    return call
+
+
+class Gil_Probe():
+    # A thread that only sleeps GIL_PROBE_INTERVAL at a time; its wake-up lateness is how long
+    # a ready thread waits for the GIL (and the OS scheduler).
+    def __init__(self, interval=GIL_PROBE_INTERVAL):
+        self.timer = Loop_Timer('gil_probe', interval)
+        self.run = True
+        self.thread_object = None
+
+    def thread_run(self):
+        while self.run:
+            self.timer.stop(self.timer.start())
+            self.timer.sleep(self.timer.period)
+
+    def start_thread(self):
+        self.thread_object = threading.Thread(target=self.thread_run, daemon=True)
+        self.thread_object.start()
+
+    def stop_thread(self):
+        self.run = False
+
+    def stats(self, counts=True):
+        wake = self.timer.wake
+        switch = sys.getswitchinterval()
+        # Wakes at least half a switch interval late (bucket i holds EDGES[i-1] .. EDGES[i])
+        contended = sum(count for edge, count in zip(EDGES, wake.counts[1:]) if edge >= switch/2)
+        return {'switch_interval': switch, 'wake': wake.stats(counts),
+                'contended': contended/wake.count if wake.count else 0.0}
+
+
+class Loop_Monitor():
+    # The timers of one process, reported together
+    def __init__(self, gil_probe=True):
+        self.timers = {}
+        self.started = time.time()
+        self.probe = Gil_Probe() if gil_probe else None
+        if self.probe is not None:
+            self.probe.start_thread()
+
+    def timer(self, name, period=None):
+        """The timer named 'name', created on first use."""
+        if name not in self.timers:
+            self.timers[name] = Loop_Timer(name, period)
+        return self.timers[name]
+
+    def add(self, timer):
+        self.timers[timer.name] = timer
+        return timer
+
+    def report(self, counts=True):
+        """Every timer's statistics; with counts=False only the summaries, without the histograms."""
+        report = {'uptime': time.time() - self.started,
+                  'loops': {name: timer.stats(counts) for name, timer in list(self.timers.items())},
+                  'gil': self.probe.stats(counts) if self.probe is not None else None}
+        if counts:
+            report['edges'] = EDGES
+        return report
+
+    def report_parts(self, max_size):
+        """The summary report split by loops into parts of at most max_size bytes of JSON (a loop
+        is never split), for sending one datagram each. Only the first part has 'gil'."""
+        report = self.report(counts=False)
+        loops = report.pop('loops')
+        parts = [dict(report, loops={})]
+        for name, stats in loops.items():
+            part = parts[-1]
+            part['loops'][name] = stats
+            if len(part['loops']) > 1 and len(json.dumps({'diagnostics': part})) > max_size:
+                del part['loops'][name]
+                parts.append({'uptime': report['uptime'], 'loops': {name: stats}})
+        return parts
+
+    def stop(self):
+        if self.probe is not None:
+            self.probe.stop_thread()
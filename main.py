@@ -1,258 +1,725 @@
-import socket
-import json
-import threading
-import time
-import tkinter as tk
-from tkinter import ttk, messagebox
-import math
-import csv  
-from datetime import datetime
-UDP_IP = "127.0.0.1"
-UDP_PORT_RX = 9001
-UDP_PORT_TX = 9000  
-BG_COLOR = "#2e2e2e"
-FG_COLOR = "#ffffff"
-ACCENT_COLOR = "#007acc"
-PANEL_COLOR = "#3e3e3e"
-SUCCESS_COLOR = "#28a745"
-WARNING_COLOR = "#ffc107"
-DANGER_COLOR = "#dc3545"
-
-class ModernDroneGCS:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("AeroCommand GCS - Advanced Dashboard")
-        self.root.geometry("900x650")
-        self.root.configure(bg=BG_COLOR)
-        self.telemetry = {"position": [0,0,0], "orientation": [0,0,0], "battery": 100, "mode": "DISCONNECTED"}
-        self.running = True
-        self.altitude_history = [0] * 50
-        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        self.log_filename = f"flight_log_{timestamp}.csv"
-        self.log_file = open(self.log_filename, mode='w', newline='')
-        self.csv_writer = csv.writer(self.log_file)
-        self.csv_writer.writerow(["Timestamp", "Mode", "Battery", "X", "Y", "Z", "Yaw"])
-        print(f"Logging telemetry to: {self.log_filename}")
-
-        self.sock_rx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sock_rx.bind((UDP_IP, UDP_PORT_RX))
-        self.sock_rx.setblocking(False)
-        self.sock_tx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-
-        self.setup_styles()
-
-        main_container = tk.Frame(root, bg=BG_COLOR)
-        main_container.pack(fill="both", expand=True, padx=10, pady=10)
-
-        self.create_top_bar(main_container)
-
-        middle_frame = tk.Frame(main_container, bg=BG_COLOR)
-        middle_frame.pack(fill="both", expand=True, pady=10)
-
-        self.create_visuals_panel(middle_frame)
-
-        self.create_controls_panel(middle_frame)
-        self.create_bottom_bar(main_container)
-        self.thread = threading.Thread(target=self.listen_telemetry, daemon=True)
-        self.thread.start()
-        self.update_gui()
-
-    def setup_styles(self):
-        style = ttk.Style()
-        style.theme_use('clam')
-        style.configure("Card.TFrame", background=PANEL_COLOR, relief="flat")
-        style.configure("TLabel", background=PANEL_COLOR, foreground=FG_COLOR, font=("Segoe UI", 10))
-        style.configure("Header.TLabel", font=("Segoe UI", 14, "bold"), foreground=ACCENT_COLOR)
-        style.configure("Value.TLabel", font=("Consolas", 12, "bold"), foreground="#00ff00")
-        style.configure("TButton", font=("Segoe UI", 10, "bold"), padding=6, background=ACCENT_COLOR, foreground="white", borderwidth=0)
-        style.map("TButton", background=[("active", "#005f9e")])
-        style.configure("Danger.TButton", background=DANGER_COLOR)
-        style.map("Danger.TButton", background=[("active", "#a71d2a")])
-        style.configure("TEntry", fieldbackground="#505050", foreground="white", insertcolor="white")
-        style.configure("Green.Horizontal.TProgressbar", 
-                        troughcolor="#444444", 
-                        background=SUCCESS_COLOR, 
-                        lightcolor=SUCCESS_COLOR, 
-                        darkcolor=SUCCESS_COLOR,
-                        bordercolor=PANEL_COLOR,
-                        thickness=20)
-
-    def create_top_bar(self, parent):
-        frame = ttk.Frame(parent, style="Card.TFrame")
-        frame.pack(fill="x", ipady=10)
-        self.lbl_mode = ttk.Label(frame, text="MODE: WAIT", font=("Segoe UI", 16, "bold"), foreground=WARNING_COLOR)
-        self.lbl_mode.pack(side="left", padx=20)
-        self.lbl_bat_text = ttk.Label(frame, text="BATTERY: 100%", font=("Segoe UI", 12, "bold"))
-        self.lbl_bat_text.pack(side="right", padx=(10, 20))
-        self.progress_bat = ttk.Progressbar(frame, orient="horizontal", length=200, mode="determinate", style="Green.Horizontal.TProgressbar")
-        self.progress_bat.pack(side="right")
-        self.progress_bat['value'] = 100
-    def create_visuals_panel(self, parent):
-        frame = tk.Frame(parent, bg=BG_COLOR)
-        frame.pack(side="left", fill="both", expand=True, padx=(0, 10))
-
-        compass_frame = ttk.Frame(frame, style="Card.TFrame")
-        compass_frame.pack(fill="both", expand=True, pady=(0, 10)) 
-        ttk.Label(compass_frame, text="Drone Orientation (Top Down)", style="Header.TLabel").pack(pady=5)
-        
-        self.canvas_compass = tk.Canvas(compass_frame, bg="black", height=200, highlightthickness=0)
-        self.canvas_compass.pack(fill="both", expand=True, padx=10, pady=10)
-        self.draw_compass_base()
-
-        alt_frame = ttk.Frame(frame, style="Card.TFrame")
-        alt_frame.pack(fill="both", expand=True)
-        ttk.Label(alt_frame, text="Live Altitude (Z-Axis)", style="Header.TLabel").pack(pady=5)
-        
-        self.canvas_graph = tk.Canvas(alt_frame, bg="black", height=150, highlightthickness=0)
-        self.canvas_graph.pack(fill="both", expand=True, padx=10, pady=10)
-
-    def create_controls_panel(self, parent):
-        frame = tk.Frame(parent, bg=BG_COLOR, width=300)
-        frame.pack(side="right", fill="y")
-        
-        data_card = ttk.Frame(frame, style="Card.TFrame", padding=15)
-        data_card.pack(fill="x", pady=(0, 10)) 
-        ttk.Label(data_card, text="Telemetry Data", style="Header.TLabel").pack(anchor="w")
-        self.lbl_pos_x = ttk.Label(data_card, text="X: 0.00 m")
-        self.lbl_pos_x.pack(anchor="w")
-        self.lbl_pos_y = ttk.Label(data_card, text="Y: 0.00 m")
-        self.lbl_pos_y.pack(anchor="w")
-        self.lbl_pos_z = ttk.Label(data_card, text="Z: 0.00 m")
-        self.lbl_pos_z.pack(anchor="w")
-        mode_card = ttk.Frame(frame, style="Card.TFrame", padding=15)
-        mode_card.pack(fill="x", pady=(0, 10))
-        ttk.Label(mode_card, text="Quick Actions", style="Header.TLabel").pack(anchor="w", pady=(0, 5))
-        
-        grid_frame = tk.Frame(mode_card, bg=PANEL_COLOR)
-        grid_frame.pack(fill="x")
-        
-        ttk.Button(grid_frame, text="TAKEOFF", command=lambda: self.send_command("mode", "TAKEOFF")).pack(side="left", fill="x", expand=True, padx=2)
-        ttk.Button(grid_frame, text="LAND", command=lambda: self.send_command("mode", "LAND")).pack(side="left", fill="x", expand=True, padx=2)
-        ttk.Button(grid_frame, text="RTL", command=lambda: self.send_command("mode", "RTL")).pack(side="left", fill="x", expand=True, padx=2)
-        mission_card = ttk.Frame(frame, style="Card.TFrame", padding=15)
-        mission_card.pack(fill="x", pady=(0, 10))
-        ttk.Label(mission_card, text="Mission Planning", style="Header.TLabel").pack(anchor="w")
-        
-        ttk.Label(mission_card, text="Waypoints JSON:").pack(anchor="w")
-        self.entry_wp = ttk.Entry(mission_card)
-        self.entry_wp.insert(0, "[[0,0,2], [2,2,2], [-2,2,2]]")
-        self.entry_wp.pack(fill="x", pady=5)
-        
-        ttk.Button(mission_card, text="UPLOAD & FLY", command=self.upload_mission).pack(fill="x", pady=2)
-        sys_card = ttk.Frame(frame, style="Card.TFrame", padding=15)
-        sys_card.pack(fill="x")
-        ttk.Button(sys_card, text="EMERGENCY REBOOT", style="Danger.TButton", command=self.send_reboot).pack(fill="x")
-    def create_bottom_bar(self, parent):
-        self.lbl_status = tk.Label(parent, text="System Ready.", bg=BG_COLOR, fg="#888888", font=("Segoe UI", 9), anchor="w")
-        self.lbl_status.pack(fill="x", pady=(5,0))
-
-
-    def draw_compass_base(self):
-        w = 300; h = 200
-        cx = w/2; cy = h/2
-        self.canvas_compass.create_oval(cx-80, cy-80, cx+80, cy+80, outline="#444", width=2)
-        self.canvas_compass.create_text(cx, cy-90, text="N", fill="#666")
-        self.drone_arrow = self.canvas_compass.create_line(cx, cy, cx, cy-60, fill=ACCENT_COLOR, width=4, arrow=tk.LAST)
-
-    def update_compass(self, yaw_rad):
-        w = self.canvas_compass.winfo_width()
-        h = self.canvas_compass.winfo_height()
-        cx = w/2; cy = h/2
-        
-      
-        length = 60
-        end_x = cx + length * math.sin(yaw_rad)
-        end_y = cy - length * math.cos(yaw_rad)
-        
-        self.canvas_compass.coords(self.drone_arrow, cx, cy, end_x, end_y)
-
-    def update_graph(self):
-        c = self.canvas_graph
-        c.delete("all")
-        w = c.winfo_width()
-        h = c.winfo_height()
-        
-       
-        c.create_line(0, h/2, w, h/2, fill="#333", dash=(2,4))
-
-        if not w or not h: return
-
-       
-        max_h = 5.0
-        step_x = w / len(self.altitude_history)
-        
-        points = []
-        for i, alt in enumerate(self.altitude_history):
-            x = i * step_x
-            y = h - ((alt / max_h) * h)
-            points.append(x)
-            points.append(y)
-        
-        if len(points) >= 4:
-            c.create_line(points, fill=SUCCESS_COLOR, width=2, smooth=True)
-
-    
-    def listen_telemetry(self):
-        print(f"Listening on {UDP_IP}:{UDP_PORT_RX}")
-        while self.running:
-            try:
-                data, _ = self.sock_rx.recvfrom(2048)
-                self.telemetry = json.loads(data.decode())
-                
-                
-                pos = self.telemetry.get("position", [0,0,0])
-                self.altitude_history.append(pos[2])
-                self.altitude_history.pop(0)
-                ori = self.telemetry.get("orientation", [0,0,0])
-                self.csv_writer.writerow([
-                    datetime.now().strftime("%H:%M:%S"),
-                    self.telemetry.get("mode", "N/A"),
-                    self.telemetry.get("battery", 0),
-                    f"{pos[0]:.2f}", f"{pos[1]:.2f}", f"{pos[2]:.2f}",
-                    f"{ori[2]:.2f}"
-                ])
-                self.log_file.flush()
-                
-            except Exception:
-                pass
-            time.sleep(0.02)
-
-    def update_gui(self):
-        t = self.telemetry
-        mode = t.get("mode", "N/A")
-        self.lbl_mode.config(text=f"MODE: {mode}", foreground=SUCCESS_COLOR if mode == "GUIDED" else WARNING_COLOR)  
-        bat = t.get("battery", 0)
-        self.lbl_bat_text.config(text=f"BATTERY: {bat:.1f}%")
-        self.progress_bat['value'] = bat
-        pos = t.get("position", [0,0,0])
-        self.lbl_pos_x.config(text=f"X: {pos[0]:.2f} m")
-        self.lbl_pos_y.config(text=f"Y: {pos[1]:.2f} m")
-        self.lbl_pos_z.config(text=f"Z: {pos[2]:.2f} m")
-        ori = t.get("orientation", [0,0,0])
-        yaw = ori[2]
-        self.update_compass(yaw)
-        self.update_graph()
-
-        self.root.after(50, self.update_gui)
-
-    def send_command(self, key, value):
-        msg = json.dumps({key: value}).encode()
-        self.sock_tx.sendto(msg, (UDP_IP, UDP_PORT_TX))
-        self.lbl_status.config(text=f"Sent Command: {key} -> {value}")
-
-    def upload_mission(self):
-        try:
-            wps = json.loads(self.entry_wp.get())
-            self.send_command("waypoints", wps)
-            self.send_command("mode", "GUIDED")
-            messagebox.showinfo("Mission", "Waypoints uploaded & GUIDED mode started!")
-        except:
-            messagebox.showerror("Error", "Invalid JSON format for waypoints.")
-
-    def send_reboot(self):
-        self.send_command("reboot", True)
-
-if __name__ == "__main__":
-    root = tk.Tk()
-    app = ModernDroneGCS(root)
+import json
+import time
+import tkinter as tk
+from tkinter import ttk, messagebox
+import math
+import itertools
+import argparse
+from collections import deque
+import telemetry
+import udp_transport
+import flight_recorder
+import replay
+import gcs_plots
+import mission
+import loop_timing
+import shm_telemetry
+UDP_IP = "127.0.0.1"
+UDP_PORT_RX = 9001
+UDP_PORT_TX = 9000  
+TELEMETRY_FORMAT = "binary"
+STREAM_HISTORY = 500  # Datagrams of samples kept per subscribed stream
+PING_INTERVAL_MS = 1000  # Command round-trip latency probe period
+OVERVIEW_REFRESH_MS = 1000  # Fleet overview refresh period
+OVERVIEW_ROWS_PER_REFRESH = 25  # Overview rows refreshed per period, round-robin, so cost stays flat with fleet size
+GUI_REFRESH_MS = 50  # Dashboard refresh period (20 FPS)
+PLOT_HISTORY = 3000  # Samples of history per vehicle, 150 s at the default 20 Hz telemetry rate
+HISTORY_FIELDS = ["altitude", "speed", "battery", "roll", "pitch", "yaw"]
+REPLAY_TICK_MS = 20  # Replay playback period
+REPLAY_SPEEDS = ["0.25", "0.5", "1", "2", "5", "10", "50"]
+PARAMS_REFRESH_MS = 200  # Parameter window refresh period
+HEALTH_REFRESH_MS = 1000  # Health window refresh period, each refresh requests the simulator's loop timing
+RING_POLL_MS = 10  # Shared memory telemetry ring polling period
+RING_STALE_S = 2.0  # A ring with no new frames this long while UDP telemetry arrives is given up
+BG_COLOR = "#2e2e2e"
+FG_COLOR = "#ffffff"
+ACCENT_COLOR = "#007acc"
+PANEL_COLOR = "#3e3e3e"
+SUCCESS_COLOR = "#28a745"
+WARNING_COLOR = "#ffc107"
+DANGER_COLOR = "#dc3545"
+# (title, [(series, color)], history columns, initial y range, units)
+PLOTS = [
+    ("Altitude (Z)", [("z", SUCCESS_COLOR)], [0], (0.0, 5.0), " m"),
+    ("Speed", [("speed", ACCENT_COLOR)], [1], (0.0, 2.0), " m/s"),
+    ("Battery", [("battery", WARNING_COLOR)], [2], (0.0, 100.0), " %"),
+    ("Attitude (roll, pitch, yaw)", [("roll", DANGER_COLOR), ("pitch", SUCCESS_COLOR), ("yaw", ACCENT_COLOR)], [3, 4, 5], (-0.5, 0.5), " rad"),
+]
+
+class ModernDroneGCS:
+    def __init__(self, root, streams=None, replay_logs=None, replay_speed=1.0, use_ring=True):
+        self.root = root
+        self.root.title("AeroCommand GCS - Advanced Dashboard")
+        self.root.geometry("900x650")
+        self.root.configure(bg=BG_COLOR)
+        self.telemetry = {"position": [0,0,0], "orientation": [0,0,0], "battery": 100, "mode": "DISCONNECTED"}
+        self.running = True
+        # Latest telemetry and plot history per vehicle id; the dashboard shows the selected one
+        self.vehicles = {}
+        self.histories = {}
+        self.selected_vehicle = telemetry.DEFAULT_VEHICLE
+        self.history = self.vehicle_history(self.selected_vehicle)
+        self.shown = {}
+        self.overview_rows = {}
+        self.overview_cursor = 0
+        self.streams = {}
+        # Parameter values and descriptions reported by the simulator, per vehicle
+        self.parameters = {}
+        self.parameter_info = {}
+        self.parameter_errors = {}
+        self.parameters_version = 0
+        self.params_window = None
+        # Loop timing of the simulator (its last diagnostics reply) and of this GCS
+        self.diagnostics = None
+        self.health_window = None
+        self.monitor = loop_timing.Loop_Monitor()
+        self.gui_timer = self.monitor.timer("gcs_gui", GUI_REFRESH_MS/1000)
+        # Outcomes of acknowledged commands, reported by the transport thread, shown by update_gui
+        self.command_results = deque(maxlen=16)
+        # State frames received by the transport thread; update_gui ingests them, so the plot
+        # histories and vehicle table are only touched by the Tk thread
+        self.state_frames = deque(maxlen=PLOT_HISTORY)
+        self.mission_ids = itertools.count(int(time.time()) % 1000000)
+        # Telemetry read from the simulator's shared memory ring (shm_telemetry.Ring_Reader) when it
+        # runs on this host, and when state frames last came from the ring and by UDP
+        self.ring = None
+        self.ring_time = 0.0
+        self.udp_time = 0.0
+        # Replaying a flight log shows the recorded telemetry instead of a live link
+        self.player = None
+        self.recorder = None
+        self.transport = None
+        if replay_logs:
+            self.player = replay.Replay_Player(replay.Flight_Log(replay_logs), self.ingest_frame, speed=replay_speed)
+            print(f"Replaying {len(self.player.log)} records from {len(self.player.log.segments)} log(s)")
+        else:
+            self.recorder = flight_recorder.Flight_Recorder()
+            print(f"Logging telemetry to: {self.recorder.filename}")
+            self.transport = udp_transport.UDP_Transport()
+        self.root.protocol("WM_DELETE_WINDOW", self.shutdown)
+
+        self.setup_styles()
+
+        main_container = tk.Frame(root, bg=BG_COLOR)
+        main_container.pack(fill="both", expand=True, padx=10, pady=10)
+
+        self.create_top_bar(main_container)
+
+        middle_frame = tk.Frame(main_container, bg=BG_COLOR)
+        middle_frame.pack(fill="both", expand=True, pady=10)
+
+        self.create_visuals_panel(middle_frame)
+
+        self.create_controls_panel(middle_frame)
+        if self.player:
+            self.create_replay_bar(main_container)
+        self.create_bottom_bar(main_container)
+        self.update_gui()
+        self.update_overview()
+        if self.player:
+            self.update_replay()
+            return
+        self.link = self.transport.listen("telemetry", UDP_IP, UDP_PORT_RX,
+                                          loop_timing.timed(self.handle_datagram, self.monitor.timer("gcs_receive")))
+        print(f"Listening on {UDP_IP}:{UDP_PORT_RX}")
+        self.send_command("telemetry_format", TELEMETRY_FORMAT)
+        if use_ring:
+            self.connect_ring()
+        if streams:
+            self.subscribe_streams(streams)
+        self.update_link()
+
+    def setup_styles(self):
+        style = ttk.Style()
+        style.theme_use('clam')
+        style.configure("Card.TFrame", background=PANEL_COLOR, relief="flat")
+        style.configure("TLabel", background=PANEL_COLOR, foreground=FG_COLOR, font=("Segoe UI", 10))
+        style.configure("Header.TLabel", font=("Segoe UI", 14, "bold"), foreground=ACCENT_COLOR)
+        style.configure("Value.TLabel", font=("Consolas", 12, "bold"), foreground="#00ff00")
+        style.configure("TButton", font=("Segoe UI", 10, "bold"), padding=6, background=ACCENT_COLOR, foreground="white", borderwidth=0)
+        style.map("TButton", background=[("active", "#005f9e")])
+        style.configure("Danger.TButton", background=DANGER_COLOR)
+        style.map("Danger.TButton", background=[("active", "#a71d2a")])
+        style.configure("TEntry", fieldbackground="#505050", foreground="white", insertcolor="white")
+        style.configure("Green.Horizontal.TProgressbar", 
+                        troughcolor="#444444", 
+                        background=SUCCESS_COLOR, 
+                        lightcolor=SUCCESS_COLOR, 
+                        darkcolor=SUCCESS_COLOR,
+                        bordercolor=PANEL_COLOR,
+                        thickness=20)
+
+    def create_top_bar(self, parent):
+        frame = ttk.Frame(parent, style="Card.TFrame")
+        frame.pack(fill="x", ipady=10)
+        self.lbl_mode = ttk.Label(frame, text="MODE: WAIT", font=("Segoe UI", 16, "bold"), foreground=WARNING_COLOR)
+        self.lbl_mode.pack(side="left", padx=20)
+        self.lbl_bat_text = ttk.Label(frame, text="BATTERY: 100%", font=("Segoe UI", 12, "bold"))
+        self.lbl_bat_text.pack(side="right", padx=(10, 20))
+        self.progress_bat = ttk.Progressbar(frame, orient="horizontal", length=200, mode="determinate", style="Green.Horizontal.TProgressbar")
+        self.progress_bat.pack(side="right")
+        self.progress_bat['value'] = 100
+        self.vehicle_var = tk.StringVar(value=self.selected_vehicle)
+        self.combo_vehicle = ttk.Combobox(frame, textvariable=self.vehicle_var, values=[self.selected_vehicle], width=8, state="readonly")
+        self.combo_vehicle.pack(side="left", padx=(0, 10))
+        self.combo_vehicle.bind("<<ComboboxSelected>>", lambda e: self.select_vehicle(self.vehicle_var.get()))
+        self.command_all = tk.BooleanVar(value=False)
+        ttk.Checkbutton(frame, text="Command all", variable=self.command_all).pack(side="left")
+    def create_visuals_panel(self, parent):
+        frame = tk.Frame(parent, bg=BG_COLOR)
+        frame.pack(side="left", fill="both", expand=True, padx=(0, 10))
+
+        compass_frame = ttk.Frame(frame, style="Card.TFrame")
+        compass_frame.pack(fill="both", expand=True, pady=(0, 10)) 
+        ttk.Label(compass_frame, text="Drone Orientation (Top Down)", style="Header.TLabel").pack(pady=5)
+        
+        self.canvas_compass = tk.Canvas(compass_frame, bg="black", height=200, highlightthickness=0)
+        self.canvas_compass.pack(fill="both", expand=True, padx=10, pady=10)
+        self.draw_compass_base()
+
+        alt_frame = ttk.Frame(frame, style="Card.TFrame")
+        alt_frame.pack(fill="both", expand=True)
+        ttk.Label(alt_frame, text="Flight History", style="Header.TLabel").pack(pady=5)
+
+        plot_grid = tk.Frame(alt_frame, bg=PANEL_COLOR)
+        plot_grid.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+        self.charts = []
+        for i, (title, series, columns, (low, high), units) in enumerate(PLOTS):
+            canvas = tk.Canvas(plot_grid, bg="black", height=75, highlightthickness=0)
+            canvas.grid(row=i//2, column=i%2, sticky="nsew", padx=2, pady=2)
+            self.charts.append((gcs_plots.Strip_Chart(canvas, title, series, low, high, units), columns))
+        for i in range(2):
+            plot_grid.columnconfigure(i, weight=1)
+            plot_grid.rowconfigure(i, weight=1)
+
+    def create_controls_panel(self, parent):
+        frame = tk.Frame(parent, bg=BG_COLOR, width=300)
+        frame.pack(side="right", fill="y")
+        
+        data_card = ttk.Frame(frame, style="Card.TFrame", padding=15)
+        data_card.pack(fill="x", pady=(0, 10)) 
+        ttk.Label(data_card, text="Telemetry Data", style="Header.TLabel").pack(anchor="w")
+        self.lbl_pos_x = ttk.Label(data_card, text="X: 0.00 m")
+        self.lbl_pos_x.pack(anchor="w")
+        self.lbl_pos_y = ttk.Label(data_card, text="Y: 0.00 m")
+        self.lbl_pos_y.pack(anchor="w")
+        self.lbl_pos_z = ttk.Label(data_card, text="Z: 0.00 m")
+        self.lbl_pos_z.pack(anchor="w")
+        mode_card = ttk.Frame(frame, style="Card.TFrame", padding=15)
+        mode_card.pack(fill="x", pady=(0, 10))
+        ttk.Label(mode_card, text="Quick Actions", style="Header.TLabel").pack(anchor="w", pady=(0, 5))
+        
+        grid_frame = tk.Frame(mode_card, bg=PANEL_COLOR)
+        grid_frame.pack(fill="x")
+        
+        ttk.Button(grid_frame, text="TAKEOFF", command=lambda: self.send_command("mode", "TAKEOFF")).pack(side="left", fill="x", expand=True, padx=2)
+        ttk.Button(grid_frame, text="LAND", command=lambda: self.send_command("mode", "LAND")).pack(side="left", fill="x", expand=True, padx=2)
+        ttk.Button(grid_frame, text="RTL", command=lambda: self.send_command("mode", "RTL")).pack(side="left", fill="x", expand=True, padx=2)
+        mission_card = ttk.Frame(frame, style="Card.TFrame", padding=15)
+        mission_card.pack(fill="x", pady=(0, 10))
+        ttk.Label(mission_card, text="Mission Planning", style="Header.TLabel").pack(anchor="w")
+        
+        ttk.Label(mission_card, text="Waypoints JSON:").pack(anchor="w")
+        self.entry_wp = ttk.Entry(mission_card)
+        self.entry_wp.insert(0, "[[0,0,2], [2,2,2], [-2,2,2]]")
+        self.entry_wp.pack(fill="x", pady=5)
+        
+        ttk.Button(mission_card, text="UPLOAD & FLY", command=self.upload_mission).pack(fill="x", pady=2)
+        fleet_card = ttk.Frame(frame, style="Card.TFrame", padding=15)
+        fleet_card.pack(fill="x", pady=(0, 10))
+        self.lbl_fleet = ttk.Label(fleet_card, text="Fleet Overview (0 vehicles)", style="Header.TLabel")
+        self.lbl_fleet.pack(anchor="w")
+        self.tree_fleet = ttk.Treeview(fleet_card, columns=("mode", "battery", "alt"), height=4)
+        self.tree_fleet.heading("#0", text="ID")
+        self.tree_fleet.heading("mode", text="Mode")
+        self.tree_fleet.heading("battery", text="Bat %")
+        self.tree_fleet.heading("alt", text="Alt m")
+        for column, width in (("#0", 50), ("mode", 80), ("battery", 60), ("alt", 60)):
+            self.tree_fleet.column(column, width=width, anchor="w")
+        self.tree_fleet.pack(fill="x")
+        self.tree_fleet.bind("<<TreeviewSelect>>", lambda e: self.select_vehicle(self.tree_fleet.focus()))
+        sys_card = ttk.Frame(frame, style="Card.TFrame", padding=15)
+        sys_card.pack(fill="x")
+        ttk.Button(sys_card, text="PARAMETERS", command=self.open_parameters).pack(fill="x", pady=(0, 5))
+        ttk.Button(sys_card, text="HEALTH", command=self.open_health).pack(fill="x", pady=(0, 5))
+        ttk.Button(sys_card, text="EMERGENCY REBOOT", style="Danger.TButton", command=self.send_reboot).pack(fill="x")
+    def create_bottom_bar(self, parent):
+        frame = tk.Frame(parent, bg=BG_COLOR)
+        frame.pack(fill="x", pady=(5,0))
+        self.lbl_status = tk.Label(frame, text="System Ready.", bg=BG_COLOR, fg="#888888", font=("Segoe UI", 9), anchor="w")
+        self.lbl_status.pack(side="left", fill="x", expand=True)
+        self.lbl_link = tk.Label(frame, text="", bg=BG_COLOR, fg="#888888", font=("Segoe UI", 9), anchor="e")
+        self.lbl_link.pack(side="right")
+        self.lbl_commands = tk.Label(frame, text="", bg=BG_COLOR, fg=WARNING_COLOR, font=("Segoe UI", 9), anchor="e")
+        self.lbl_commands.pack(side="right", padx=10)
+    def create_replay_bar(self, parent):
+        frame = ttk.Frame(parent, style="Card.TFrame", padding=5)
+        frame.pack(fill="x", pady=(5,0))
+        self.btn_play = ttk.Button(frame, text="PAUSE", width=7, command=self.toggle_replay)
+        self.btn_play.pack(side="left", padx=2)
+        ttk.Button(frame, text="STEP", width=6, command=self.step_replay).pack(side="left", padx=2)
+        self.replay_speed = tk.StringVar(value=f"{self.player.speed:g}")
+        combo_speed = ttk.Combobox(frame, textvariable=self.replay_speed, values=REPLAY_SPEEDS, width=5)
+        combo_speed.pack(side="left", padx=(2, 10))
+        combo_speed.bind("<<ComboboxSelected>>", lambda e: self.set_replay_speed())
+        combo_speed.bind("<Return>", lambda e: self.set_replay_speed())
+        self.lbl_replay = ttk.Label(frame, text="", width=22)
+        self.lbl_replay.pack(side="right", padx=5)
+        # Moving the variable doesn't invoke the command, only dragging the slider does
+        self.replay_position = tk.DoubleVar(value=0.0)
+        ttk.Scale(frame, from_=0.0, to=1.0, variable=self.replay_position,
+                  command=lambda value: self.player.seek_fraction(float(value))).pack(side="left", fill="x", expand=True)
+
+
+    def draw_compass_base(self):
+        w = 300; h = 200
+        cx = w/2; cy = h/2
+        self.canvas_compass.create_oval(cx-80, cy-80, cx+80, cy+80, outline="#444", width=2)
+        self.canvas_compass.create_text(cx, cy-90, text="N", fill="#666")
+        self.drone_arrow = self.canvas_compass.create_line(cx, cy, cx, cy-60, fill=ACCENT_COLOR, width=4, arrow=tk.LAST)
+
+    def update_compass(self, yaw_rad):
+        w = self.canvas_compass.winfo_width()
+        h = self.canvas_compass.winfo_height()
+        if not self.changed("compass", (w, h, round(yaw_rad, 3))):
+            return
+        cx = w/2; cy = h/2
+        
+      
+        length = 60
+        end_x = cx + length * math.sin(yaw_rad)
+        end_y = cy - length * math.cos(yaw_rad)
+        
+        self.canvas_compass.coords(self.drone_arrow, cx, cy, end_x, end_y)
+
+    def update_graph(self):
+        for chart, columns in self.charts:
+            chart.update(self.history, columns)
+
+    def changed(self, key, value):
+        """True (and remembered) if value differs from what 'key' last showed."""
+        if self.shown.get(key) == value:
+            return False
+        self.shown[key] = value
+        return True
+
+    def set_label(self, label, **options):
+        if self.changed(str(label), options):
+            label.config(**options)
+
+    
+    def handle_datagram(self, data, addr=None):
+        # Runs on the transport's event loop thread for every datagram as it arrives
+        frame = telemetry.decode(data)
+        if "pong" in frame:
+            self.transport.pong_received(frame["pong"])
+            return
+        if "ack" in frame:
+            self.transport.ack_received(frame)
+            return
+        if "diagnostics" in frame:
+            # A report comes in several datagrams, each with some of the loops; merged into a new
+            # dictionary so the Tk thread never sees one being changed
+            part = frame["diagnostics"]
+            previous = self.diagnostics or {"loops": {}}
+            self.diagnostics = dict(previous, **part, loops=dict(previous["loops"], **part.get("loops", {})))
+            return
+        if "param_value" in frame:
+            vehicle = frame.get("vehicle", telemetry.DEFAULT_VEHICLE)
+            self.parameters.setdefault(vehicle, {}).update(frame["param_value"])
+            self.parameter_info.update(frame.get("param_info", {}))
+            self.parameter_errors = frame.get("param_error", {})
+            self.parameters_version += 1
+            return
+        if "seq" in frame:
+            self.link.track_sequence("stream" if "stream" in frame else "state", frame["seq"])
+        vehicle = frame.get("id", telemetry.DEFAULT_VEHICLE)
+        if "stream" in frame:
+            # Binary samples are a view of the receive buffer, so keep a copy
+            samples = frame["samples"]
+            self.streams.setdefault((vehicle, frame["stream"]), deque(maxlen=STREAM_HISTORY)).append(
+                samples.copy() if hasattr(samples, "copy") else samples)
+            return
+        if "position" not in frame:
+            return
+        if addr is not None:
+            self.udp_time = time.monotonic()
+        self.state_frames.append(frame)
+        self.recorder.record(frame)
+
+    def ingest_frame(self, frame):
+        """Show one decoded state frame, live or replayed."""
+        vehicle = frame.get("id", telemetry.DEFAULT_VEHICLE)
+        self.vehicles[vehicle] = frame
+        if vehicle == self.selected_vehicle:
+            self.telemetry = frame
+
+        pos = frame.get("position", [0,0,0])
+        vel = frame.get("velocity", [0,0,0])
+        ori = frame.get("orientation", [0,0,0])
+        speed = math.sqrt(vel[0]**2 + vel[1]**2 + vel[2]**2)
+        self.vehicle_history(vehicle).append((pos[2], speed, frame.get("battery", 0), ori[0], ori[1], ori[2]))
+
+    def vehicle_history(self, vehicle):
+        if vehicle not in self.histories:
+            self.histories[vehicle] = gcs_plots.Ring_Buffer(PLOT_HISTORY, len(HISTORY_FIELDS))
+        return self.histories[vehicle]
+
+    def select_vehicle(self, vehicle):
+        if not vehicle or vehicle == self.selected_vehicle:
+            return
+        self.selected_vehicle = vehicle
+        self.vehicle_var.set(vehicle)
+        self.history = self.vehicle_history(vehicle)
+        self.telemetry = self.vehicles.get(vehicle, self.telemetry)
+        self.lbl_status.config(text=f"Selected vehicle {vehicle}")
+
+    def update_overview(self):
+        # New vehicles are added once; existing rows are refreshed a bounded number at a time
+        ids = list(self.vehicles)
+        if len(ids) != len(self.overview_rows):
+            for vehicle in ids:
+                if vehicle not in self.overview_rows:
+                    self.tree_fleet.insert("", "end", iid=vehicle, text=vehicle)
+                    self.overview_rows[vehicle] = None
+            self.combo_vehicle.configure(values=sorted(ids, key=lambda v: (len(v), v)))
+            self.lbl_fleet.config(text=f"Fleet Overview ({len(ids)} vehicles)")
+        for _ in range(min(OVERVIEW_ROWS_PER_REFRESH, len(ids))):
+            vehicle = ids[self.overview_cursor % len(ids)]
+            self.overview_cursor += 1
+            t = self.vehicles[vehicle]
+            row = (t.get("mode", "N/A"), f"{t.get('battery', 0):.1f}", f"{t.get('position', [0,0,0])[2]:.2f}")
+            if row != self.overview_rows[vehicle]:
+                self.tree_fleet.item(vehicle, values=row)
+                self.overview_rows[vehicle] = row
+        self.root.after(OVERVIEW_REFRESH_MS, self.update_overview)
+
+    def update_gui(self):
+        start = self.gui_timer.start()
+        while self.state_frames:
+            self.ingest_frame(self.state_frames.popleft())
+        t = self.telemetry
+        mode = t.get("mode", "N/A")
+        self.set_label(self.lbl_mode, text=f"MODE: {mode}", foreground=SUCCESS_COLOR if mode == "GUIDED" else WARNING_COLOR)
+        bat = t.get("battery", 0)
+        electrical = f"  {t['voltage']:.2f} V  {t.get('current', 0):.1f} A" if "voltage" in t else ""
+        self.set_label(self.lbl_bat_text, text=f"BATTERY: {bat:.1f}%{electrical}")
+        if self.changed("progress_bat", round(bat, 1)):
+            self.progress_bat['value'] = bat
+        pos = t.get("position", [0,0,0])
+        self.set_label(self.lbl_pos_x, text=f"X: {pos[0]:.2f} m")
+        self.set_label(self.lbl_pos_y, text=f"Y: {pos[1]:.2f} m")
+        self.set_label(self.lbl_pos_z, text=f"Z: {pos[2]:.2f} m")
+        ori = t.get("orientation", [0,0,0])
+        yaw = ori[2]
+        self.update_compass(yaw)
+        self.update_graph()
+        self.update_commands()
+
+        self.gui_timer.stop(start)
+        self.root.after(GUI_REFRESH_MS, self.update_gui)
+
+    def update_link(self):
+        self.transport.send_ping((UDP_IP, UDP_PORT_TX))
+        stats = self.link.stats()
+        rtt = self.transport.rtt
+        ring = self.ring
+        shm = f"SHM {ring.received} overrun {ring.dropped}  " if ring is not None else ""
+        self.lbl_link.config(text=f"{shm}RX {stats['received']}  dropped {stats['dropped']}  malformed {stats['malformed']}  "
+                                  f"RTT {'--' if rtt is None else f'{rtt*1000:.1f} ms'}")
+        self.root.after(PING_INTERVAL_MS, self.update_link)
+
+    # ---- Shared memory telemetry ----
+    def connect_ring(self):
+        """Ask the simulator for telemetry through its ring if it runs on this host; otherwise
+        (or if it refuses) telemetry keeps coming by UDP."""
+        if not shm_telemetry.is_local_address(UDP_IP):
+            return
+        try:
+            reader = shm_telemetry.Ring_Reader(shm_telemetry.ring_path(UDP_PORT_RX))
+        except (OSError, ValueError):
+            return
+        self.transport.send_command({"telemetry_transport": "ring", "ring_token": reader.token}, (UDP_IP, UDP_PORT_TX),
+                                    callback=lambda msg, reply: self.ring_connected(reader, reply))
+
+    def ring_connected(self, reader, reply):
+        # Runs on the transport thread, which then also polls the ring
+        if reply["result"] != "ACK":
+            reader.close()
+            print(f"Telemetry by UDP: {reply.get('error', reply['result'])}")
+            return
+        print("Telemetry through shared memory")
+        self.ring = reader
+        self.ring_time = time.monotonic()
+        self.poll_ring(reader)
+
+    def poll_ring(self, reader):
+        if reader is not self.ring:
+            reader.close()
+            return
+        timer = self.monitor.timer("gcs_ring", RING_POLL_MS/1000)
+        start = timer.start()
+        now = time.monotonic()
+        frames = reader.read()
+        for data in frames:
+            try:
+                self.handle_datagram(data)
+            except udp_transport.MALFORMED_ERRORS:
+                self.link.malformed += 1
+        timer.stop(start)
+        if frames:
+            self.ring_time = now
+        elif now - self.ring_time > RING_STALE_S and now - self.udp_time < RING_STALE_S:
+            # The simulator went back to UDP (e.g. it was restarted): follow its new ring, if any
+            self.ring = None
+            reader.close()
+            self.connect_ring()
+            return
+        self.transport.loop.call_later(RING_POLL_MS/1000, self.poll_ring, reader)
+
+    def update_replay(self):
+        player = self.player
+        player.tick()
+        self.replay_position.set(player.progress())
+        elapsed = player.replay_time - player.log.start_time
+        total = player.log.end_time - player.log.start_time
+        state = "END" if player.finished() else "PAUSED" if player.paused else f"x{player.speed:g}"
+        self.lbl_replay.config(text=f"{elapsed:7.1f} / {total:.1f} s  {state}")
+        self.root.after(REPLAY_TICK_MS, self.update_replay)
+
+    def toggle_replay(self):
+        self.player.toggle_pause()
+        self.btn_play.config(text="PLAY" if self.player.paused else "PAUSE")
+
+    def step_replay(self):
+        if not self.player.paused:
+            self.toggle_replay()
+        self.player.step()
+
+    def set_replay_speed(self):
+        try:
+            self.player.speed = max(0.0, float(self.replay_speed.get()))
+        except ValueError:
+            self.replay_speed.set(f"{self.player.speed:g}")
+
+    def command_vehicle(self):
+        return "*" if self.command_all.get() else self.selected_vehicle
+
+    def send_command(self, key, value, **fields):
+        """Send {key: value, **fields} to the selected vehicle (or all), acknowledged and retried."""
+        if self.transport is None:
+            self.lbl_status.config(text=f"Replay: command {key} not sent")
+            return
+        vehicle = self.command_vehicle()
+        msg = dict({key: value}, vehicle=vehicle, **fields)
+        seq = self.transport.send_command(msg, (UDP_IP, UDP_PORT_TX), callback=self.command_done)
+        self.lbl_status.config(text=f"Sent command #{seq} to {vehicle}: {key} -> {value}")
+
+    def command_done(self, msg, reply):
+        # Runs on the transport thread; update_commands shows it
+        self.command_results.append((msg, reply["result"], reply.get("error")))
+
+    def update_commands(self):
+        while self.command_results:
+            msg, result, error = self.command_results.popleft()
+            name = next(key for key in msg if key not in ("vehicle", "cmd_seq", "cmd_session"))
+            text = f"Command #{msg['cmd_seq']} ({name}) to {msg['vehicle']}: {result}"
+            self.lbl_status.config(text=f"{text} - {error}" if error else text,
+                                   fg="#888888" if result == "ACK" else DANGER_COLOR)
+        pending = self.transport.commands_pending() if self.transport else []
+        if pending:
+            seq, attempts = pending[0]
+            text = f"CMD #{seq} " + (f"retry {attempts - 1}" if attempts > 1 else "in flight") + (f" +{len(pending) - 1} queued" if len(pending) > 1 else "")
+        else:
+            text = ""
+        self.set_label(self.lbl_commands, text=text)
+
+    def open_parameters(self):
+        if self.params_window is not None:
+            self.params_window.lift()
+            return
+        window = tk.Toplevel(self.root)
+        window.title("Parameters")
+        window.geometry("460x420")
+        window.configure(bg=BG_COLOR)
+        window.protocol("WM_DELETE_WINDOW", self.close_parameters)
+        self.params_window = window
+        self.shown.pop("params", None)
+        self.lbl_params = ttk.Label(window, text="", style="Header.TLabel")
+        self.lbl_params.pack(anchor="w", padx=10, pady=5)
+        self.tree_params = ttk.Treeview(window, columns=("value", "range"), height=12)
+        self.tree_params.heading("#0", text="Name")
+        self.tree_params.heading("value", text="Value")
+        self.tree_params.heading("range", text="Range")
+        for column, width in (("#0", 140), ("value", 110), ("range", 160)):
+            self.tree_params.column(column, width=width, anchor="w")
+        self.tree_params.pack(fill="both", expand=True, padx=10)
+        self.tree_params.bind("<<TreeviewSelect>>", lambda e: self.select_parameter(self.tree_params.focus()))
+        edit = tk.Frame(window, bg=BG_COLOR)
+        edit.pack(fill="x", padx=10, pady=5)
+        self.param_name = tk.StringVar()
+        ttk.Label(edit, textvariable=self.param_name, width=18).pack(side="left")
+        self.entry_param = ttk.Entry(edit, width=14)
+        self.entry_param.pack(side="left", padx=5)
+        self.entry_param.bind("<Return>", lambda e: self.set_parameter())
+        ttk.Button(edit, text="SET", command=self.set_parameter).pack(side="left", padx=2)
+        ttk.Button(edit, text="REFRESH", command=self.request_parameters).pack(side="right", padx=2)
+        self.request_parameters()
+        self.update_parameters()
+
+    def close_parameters(self):
+        self.params_window.destroy()
+        self.params_window = None
+
+    def request_parameters(self):
+        self.send_command("param_get", "*")
+
+    def select_parameter(self, name):
+        if not name:
+            return
+        self.param_name.set(name)
+        self.entry_param.delete(0, "end")
+        self.entry_param.insert(0, f"{self.parameters.get(self.selected_vehicle, {}).get(name, '')}")
+
+    def set_parameter(self):
+        name = self.param_name.get()
+        try:
+            value = float(self.entry_param.get())
+        except ValueError:
+            self.lbl_status.config(text=f"Invalid value for {name}")
+            return
+        if name:
+            self.send_command("param_set", {name: int(value) if self.parameter_info.get(name, {}).get("type") == "int" else value})
+
+    def update_parameters(self):
+        # Rows are refreshed only when a reply arrived or another vehicle was selected
+        if self.params_window is None:
+            return
+        if self.changed("params", (self.parameters_version, self.selected_vehicle)):
+            values = self.parameters.get(self.selected_vehicle, {})
+            self.lbl_params.config(text=f"Parameters of {self.selected_vehicle} ({len(values)})")
+            for name in sorted(values):
+                info = self.parameter_info.get(name, {})
+                row = (f"{values[name]:g}", f"{info.get('min', '')} .. {info.get('max', '')}")
+                if not self.tree_params.exists(name):
+                    self.tree_params.insert("", "end", iid=name, text=name)
+                self.tree_params.item(name, values=row)
+            if self.parameter_errors:
+                self.lbl_status.config(text="Rejected: " + "; ".join(self.parameter_errors.values()))
+        self.root.after(PARAMS_REFRESH_MS, self.update_parameters)
+
+    def open_health(self):
+        if self.health_window is not None:
+            self.health_window.lift()
+            return
+        window = tk.Toplevel(self.root)
+        window.title("Health")
+        window.geometry("720x360")
+        window.configure(bg=BG_COLOR)
+        window.protocol("WM_DELETE_WINDOW", self.close_health)
+        self.health_window = window
+        ttk.Label(window, text="Loop Timing", style="Header.TLabel").pack(anchor="w", padx=10, pady=5)
+        columns = (("rate", "Rate Hz", 110), ("exec", "Exec ms avg/p99", 120), ("interval", "Period p99 ms", 100),
+                   ("wake", "Wake p99 ms", 90), ("overruns", "Overruns", 70), ("late", "Late", 60))
+        self.tree_health = ttk.Treeview(window, columns=[c[0] for c in columns], height=12)
+        self.tree_health.heading("#0", text="Loop")
+        self.tree_health.column("#0", width=150, anchor="w")
+        for column, text, width in columns:
+            self.tree_health.heading(column, text=text)
+            self.tree_health.column(column, width=width, anchor="w")
+        self.tree_health.pack(fill="both", expand=True, padx=10)
+        self.lbl_gil = ttk.Label(window, text="")
+        self.lbl_gil.pack(anchor="w", padx=10, pady=5)
+        self.update_health()
+
+    def close_health(self):
+        self.health_window.destroy()
+        self.health_window = None
+
+    def health_rows(self, prefix, report):
+        rows = {}
+        for name, loop in report["loops"].items():
+            target = f" / {1/loop['period']:.0f}" if loop["period"] else ""
+            rows[prefix + name] = (f"{loop['rate']:.1f}{target}",
+                                   f"{loop['average_execution']*1000:.2f} / {loop['execution']['p99']*1000:.2f}",
+                                   f"{loop['interval']['p99']*1000:.2f}", f"{loop['wake']['p99']*1000:.2f}",
+                                   loop["overruns"], loop["late"])
+        return rows
+
+    def gil_text(self, name, report):
+        gil = report.get("gil")
+        if not gil:
+            return f"{name}: --"
+        return f"{name}: wake p99 {gil['wake']['p99']*1000:.1f} ms, {100*gil['contended']:.0f}% contended"
+
+    def update_health(self):
+        # Requests the simulator's report and redraws with the last one that arrived
+        if self.health_window is None:
+            return
+        if self.transport is not None:
+            self.transport.send_json({"diagnostics": True}, (UDP_IP, UDP_PORT_TX))
+        local = self.monitor.report()
+        rows = self.health_rows("gcs/", local)
+        gil = [self.gil_text("GCS", local)]
+        if self.diagnostics is not None:
+            rows.update(self.health_rows("sim/", self.diagnostics))
+            gil.insert(0, self.gil_text("Simulator", self.diagnostics))
+        for name, row in rows.items():
+            if not self.tree_health.exists(name):
+                self.tree_health.insert("", "end", iid=name, text=name)
+            self.tree_health.item(name, values=row)
+        self.lbl_gil.config(text="GIL  " + "    ".join(gil))
+        self.root.after(HEALTH_REFRESH_MS, self.update_health)
+
+    def upload_mission(self):
+        try:
+            wps = json.loads(self.entry_wp.get())
+            upload = mission.Mission_Upload(next(self.mission_ids), wps, mode="GUIDED")
+        except ValueError as e:
+            messagebox.showerror("Error", f"Invalid waypoints: {e}")
+            return
+        if self.transport is None:
+            self.lbl_status.config(text="Replay: mission not sent")
+            return
+        # Sent in chunks; the vehicle switches to GUIDED only once the whole mission has arrived
+        vehicle = self.command_vehicle()
+        upload.send(self.transport, (UDP_IP, UDP_PORT_TX), {"vehicle": vehicle}, callback=self.command_done)
+        self.lbl_status.config(text=f"Uploading mission {upload.id} to {vehicle}: {len(upload.waypoints)} waypoints in {upload.chunks} chunks")
+
+    def send_reboot(self):
+        self.send_command("reboot", True)
+
+    def shutdown(self):
+        self.running = False
+        self.monitor.stop()
+        if self.ring is not None:
+            # Hand telemetry back to UDP for whichever receiver comes next
+            self.transport.send_json({"telemetry_transport": "udp"}, (UDP_IP, UDP_PORT_TX))
+        if self.recorder:
+            self.recorder.close()
+        if self.transport:
+            self.transport.close()
+        self.root.destroy()
+
+    def subscribe_streams(self, rates):
+        """Subscribe to high-rate telemetry streams, e.g. {"attitude": 250, "motors": 100}."""
+        self.send_command("subscribe", rates)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="AeroCommand GCS")
+    parser.add_argument("--stream", action="append", default=[], metavar="NAME=HZ",
+                        help=f"Subscribe to a telemetry stream ({', '.join(telemetry.STREAM_NAMES)}), may be repeated")
+    parser.add_argument("--replay", nargs="+", default=None, metavar="LOG",
+                        help="Replay flight logs (.qfl) instead of connecting to the simulator")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed")
+    parser.add_argument("--udp", action="store_true",
+                        help="Receive telemetry by UDP even when the simulator runs on this host")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    streams = {name: float(rate) for name, rate in (item.split("=") for item in args.stream)}
+    root = tk.Tk()
+    app = ModernDroneGCS(root, streams=streams, replay_logs=args.replay, replay_speed=args.speed, use_ring=not args.udp)
     root.mainloop()
\ No newline at end of file
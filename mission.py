@@ -0,0 +1,169 @@
+import json
+import zlib
+import numpy as np
+import udp_transport
+
+# ===========================================================
+# ---- Chunked Mission Upload ----
+# ===========================================================
+# Missions of any length are uploaded in sequenced chunks that each fit in one datagram:
+#   {"mission_start": {"id", "count", "chunks", "crc"}}   acknowledged command
+#   {"mission_chunk": {"id", "index", "waypoints"}}       CHUNK_WAYPOINTS waypoints, unacknowledged
+#   {"mission_end": {"id", "mode"}}                        acknowledged command
+# The receiver reassembles chunks in any order into one (count,3) array. mission_end is
+# NACKed with the indexes of the chunks that haven't arrived ("missing" in the reply), and
+# the sender resends only those and ends again. Once complete, the mission is checked
+# (count, CRC-32 of the float64 array, coordinate range) and replaces the vehicles' mission.
+# The sender rounds coordinates to COORDINATE_DECIMALS, so every waypoint in range has a
+# bounded JSON length, and CHUNK_WAYPOINTS is as many as fit one datagram in the worst case
+# (chunks that fragment on a real link are lost whenever any fragment is).
+
+MAX_WAYPOINTS = 100000
+MAX_COORDINATE = 10000.0  # m, from the origin on any axis
+COORDINATE_DECIMALS = 3  # Waypoints are uploaded to the millimetre
+MAX_UPLOADS = 8  # Unfinished uploads kept by a receiver; the oldest is dropped
+MAX_RESENDS = 5  # Rounds of resending missing chunks before an upload fails
+
+
+def chunk_waypoints():
+    """Waypoints per chunk message that fit a datagram (udp_transport.MAX_DATAGRAM) whatever the
+    coordinates, id and vehicle."""
+    worst = -(MAX_COORDINATE - 10.0**-COORDINATE_DECIMALS)  # The longest coordinate, e.g. -9999.999
+    waypoint = len(json.dumps([[worst]*3]*2)) - len(json.dumps([[worst]*3]))  # With its ', ' separator
+    empty = {'mission_chunk': {'id': -2**63, 'index': MAX_WAYPOINTS, 'waypoints': []}, 'vehicle': 'x'*udp_transport.MAX_VEHICLE_ID}
+    return (udp_transport.MAX_DATAGRAM - len(json.dumps(empty)))//waypoint
+
+
+CHUNK_WAYPOINTS = chunk_waypoints()
+
+
+def mission_crc(waypoints):
+    return zlib.crc32(np.ascontiguousarray(waypoints, dtype='<f8').tobytes())
+
+
+def as_waypoints(waypoints):
+    """waypoints as a (count,3) float array (an array is not copied); ValueError unless it is a
+    list of [x, y, z] or empty."""
+    try:
+        array = np.asarray(waypoints, dtype=float)
+    except (ValueError, TypeError):
+        raise ValueError("Waypoints must be [x, y, z]")
+    if array.size == 0:
+        return array.reshape(0, 3)
+    if array.ndim != 2 or array.shape[1] != 3:
+        raise ValueError("Waypoints must be [x, y, z]")
+    return array
+
+
+def validate(waypoints):
+    """Reasons the mission can't be flown, empty if it can."""
+    errors = []
+    if waypoints.ndim != 2 or waypoints.shape[1] != 3:
+        errors.append("Waypoints must be [x, y, z]")
+    elif not np.all(np.isfinite(waypoints)):
+        errors.append("Waypoints must be finite")
+    elif np.any(np.abs(waypoints) > MAX_COORDINATE):
+        errors.append(f"Waypoints must be within {MAX_COORDINATE:g} m of the origin")
+    return errors
+
+
+class Mission_Upload():
+    # Sending side: splits a waypoint list into the start, chunk and end messages, and runs the
+    # upload over a udp_transport.UDP_Transport. Every step runs in the transport's callbacks,
+    # so send() returns immediately.
+    def __init__(self, mission_id, waypoints, chunk_size=CHUNK_WAYPOINTS, mode=None):
+        self.id = mission_id
+        self.waypoints = np.round(as_waypoints(waypoints), COORDINATE_DECIMALS)
+        self.chunk_size = chunk_size
+        self.chunks = max(1, -(-len(self.waypoints)//chunk_size))
+        self.mode = mode
+        self.resent = 0
+
+    def start_message(self):
+        return {'mission_start': {'id': self.id, 'count': len(self.waypoints), 'chunks': self.chunks,
+                                  'chunk_size': self.chunk_size, 'crc': mission_crc(self.waypoints)}}
+
+    def chunk_message(self, index):
+        rows = self.waypoints[index*self.chunk_size:(index + 1)*self.chunk_size]
+        return {'mission_chunk': {'id': self.id, 'index': index, 'waypoints': rows.tolist()}}
+
+    def end_message(self):
+        return {'mission_end': {'id': self.id, 'mode': self.mode}}
+
+    # ---- Upload over a UDP_Transport ----
+    def send(self, transport, addr, fields=None, callback=None):
+        """Upload to addr; fields (e.g. the vehicle) are added to every message, and callback(msg, reply)
+        gets the reply to mission_end, or to mission_start if that is rejected."""
+        self.transport = transport
+        self.addr = addr
+        self.fields = fields or {}
+        self.callback = callback
+        transport.send_command(dict(self.start_message(), **self.fields), addr, callback=self.started)
+
+    def started(self, msg, reply):
+        if reply['result'] != 'ACK':
+            return self.done(msg, reply)
+        self.send_chunks(range(self.chunks))
+
+    def send_chunks(self, indexes):
+        for index in indexes:
+            self.transport.send_json(dict(self.chunk_message(index), **self.fields), self.addr)
+        self.transport.send_command(dict(self.end_message(), **self.fields), self.addr, callback=self.ended)
+
+    def ended(self, msg, reply):
+        if reply['result'] == 'NACK' and reply.get('missing') and self.resent < MAX_RESENDS:
+            self.resent += 1
+            return self.send_chunks(reply['missing'])
+        self.done(msg, reply)
+
+    def done(self, msg, reply):
+        if self.callback is not None:
+            self.callback(msg, reply)
+
+
+class Mission_Assembly():
+    # Receiving side: collects the chunks of one upload into a preallocated array.
+    def __init__(self, mission_id, count, chunks, crc, chunk_size=CHUNK_WAYPOINTS):
+        for name, value in [('count', count), ('chunks', chunks), ('chunk_size', chunk_size)]:
+            if isinstance(value, bool) or not isinstance(value, int):
+                raise ValueError(f"Mission {name} must be an integer")
+        if chunk_size <= 0:
+            raise ValueError("Mission chunk_size must be positive")
+        if not 0 <= count <= MAX_WAYPOINTS:
+            raise ValueError(f"Missions are limited to {MAX_WAYPOINTS} waypoints")
+        if chunks != max(1, -(-count//chunk_size)):
+            raise ValueError(f"{count} waypoints don't make {chunks} chunks of {chunk_size}")
+        self.id = mission_id
+        self.count = count
+        self.chunk_size = chunk_size
+        self.crc = crc
+        self.waypoints = np.zeros((count, 3))
+        self.received = np.zeros(chunks, dtype=bool)
+
+    def add_chunk(self, index, waypoints):
+        if not 0 <= index < len(self.received):
+            raise ValueError(f"Chunk {index} of mission {self.id} out of range")
+        rows = np.asarray(waypoints, dtype=float)
+        if rows.size == 0:
+            rows = rows.reshape(0, 3)
+        start = index*self.chunk_size
+        expected = min(self.chunk_size, self.count - start)
+        if rows.shape != (expected, 3):
+            raise ValueError(f"Chunk {index} of mission {self.id} must have {expected} waypoints [x, y, z]")
+        self.waypoints[start:start + expected] = rows
+        self.received[index] = True
+
+    def missing(self):
+        return np.flatnonzero(~self.received).tolist()
+
+    def finish(self):
+        """The complete, checked mission array; ValueError if chunks are missing or it is invalid."""
+        missing = self.missing()
+        if missing:
+            raise ValueError(f"Mission {self.id} is missing {len(missing)} of {len(self.received)} chunks")
+        if mission_crc(self.waypoints) != self.crc:
+            raise ValueError(f"Mission {self.id} failed its CRC check")
+        errors = validate(self.waypoints)
+        if errors:
+            raise ValueError(errors[0])
+        return self.waypoints
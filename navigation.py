@@ -0,0 +1,222 @@
+import math
+import numpy as np
+
+# ===========================================================
+# ---- Navigation ----
+# ===========================================================
+# Waypoint progression and geofencing for Flight_Mode_Handler.
+# Mission_Path precomputes the direction and length of every leg when a mission is set, so a
+# tick only looks at the active leg whatever the mission length. A waypoint counts as reached
+# inside its acceptance radius, or once the vehicle has passed the plane through the waypoint
+# perpendicular to the leg (so a fast vehicle that misses the sphere doesn't circle back).
+# With a lookahead distance the controller is given a point that far ahead along the leg
+# from the vehicle's closest point on it (line of sight following), clamped to the waypoint.
+# Geofence holds polygon (prism) and cylinder fences, either inclusion (stay inside) or
+# exclusion (stay out), on a uniform grid. When the fences are set only the cells polygon
+# edges pass through are found, by walking each edge across the grid, so building costs the
+# fences' perimeter in cells rather than their area. A cell is filled in the first time a
+# vehicle is in it: the fences whose bounds overlap it, and for a polygon whether the cell's
+# center is inside and the polygon edges crossing the cell. A point is then classified from
+# the center by counting edge crossings along the short segment between them (a cell no edge
+# crosses is wholly inside or outside). A check therefore only touches the fences and edges
+# near the vehicle, however many fences and vertices there are. Cells are CELL_SIZE, or larger
+# for fences spanning more than MAX_GRID_CELLS of them or with edges crossing more than
+# MAX_EDGE_CELLS, which bounds the time taken to set the fences.
+
+DEFAULT_ACCEPTANCE_RADIUS = 0.1
+DEFAULT_LOOKAHEAD = 1.0
+CELL_SIZE = 10.0
+MAX_GRID_CELLS = 1000  # Cells across the fences' extent at most; larger fences get larger cells
+MAX_EDGE_CELLS = 200000  # Cells crossed by polygon edges, in total, at most
+GRID_MARGIN = 1e-9  # Relative; edges this close to a cell are listed in it too
+
+
+class Mission_Path():
+    def __init__(self, waypoints):
+        waypoints = np.asarray(waypoints, dtype=float).reshape(-1, 3)
+        deltas = np.diff(waypoints, axis=0)
+        lengths = np.sqrt(np.sum(deltas*deltas, axis=1))
+        directions = deltas/np.where(lengths > 0, lengths, 1.0)[:, None]
+        # Leg i ends at waypoint i; leg 0 starts wherever the vehicle was when the mission started
+        self.points = waypoints.tolist()
+        self.directions = [None] + directions.tolist()
+        self.lengths = [None] + lengths.tolist()
+
+    def __len__(self):
+        return len(self.points)
+
+    def leg(self, index, origin):
+        if index > 0:
+            return self.points[index - 1], self.directions[index], self.lengths[index]
+        end = self.points[0]
+        delta = [end[0] - origin[0], end[1] - origin[1], end[2] - origin[2]]
+        length = math.sqrt(delta[0]*delta[0] + delta[1]*delta[1] + delta[2]*delta[2])
+        return origin, [d/length for d in delta] if length > 0 else [0.0, 0.0, 0.0], length
+
+    def progress(self, index, pos, origin, radius=DEFAULT_ACCEPTANCE_RADIUS, lookahead=0.0):
+        """(reached, target) for the leg into waypoint 'index' with the vehicle at pos."""
+        end = self.points[index]
+        dx, dy, dz = pos[0] - end[0], pos[1] - end[1], pos[2] - end[2]
+        if dx*dx + dy*dy + dz*dz <= radius*radius:
+            return True, end
+        start, direction, length = self.leg(index, origin)
+        along = (pos[0] - start[0])*direction[0] + (pos[1] - start[1])*direction[1] + (pos[2] - start[2])*direction[2]
+        if length > 0 and along >= length:
+            return True, end
+        if lookahead <= 0 or length <= 0:
+            return False, end
+        distance = min(max(along, 0.0) + lookahead, length)
+        return False, [start[0] + direction[0]*distance, start[1] + direction[1]*distance, start[2] + direction[2]*distance]
+
+# ===========================================================
+# ---- Geofences ----
+# ===========================================================
+def segments_cross(p, q, a, b):
+    """True if segment p-q properly crosses segment a-b (2D)."""
+    d1 = (b[0] - a[0])*(p[1] - a[1]) - (b[1] - a[1])*(p[0] - a[0])
+    d2 = (b[0] - a[0])*(q[1] - a[1]) - (b[1] - a[1])*(q[0] - a[0])
+    d3 = (q[0] - p[0])*(a[1] - p[1]) - (q[1] - p[1])*(a[0] - p[0])
+    d4 = (q[0] - p[0])*(b[1] - p[1]) - (q[1] - p[1])*(b[0] - p[0])
+    return (d1 > 0) != (d2 > 0) and (d3 > 0) != (d4 > 0)
+
+
+class Polygon_Fence():
+    # A vertical prism: a polygon of (x,y) vertices between floor and ceiling altitudes
+    def __init__(self, points, floor=-math.inf, ceiling=math.inf, inclusion=True):
+        self.points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if len(self.points) < 3:
+            raise ValueError("A polygon fence needs at least 3 points")
+        self.floor = floor
+        self.ceiling = ceiling
+        self.inclusion = inclusion
+        self.edges = np.hstack([self.points, np.roll(self.points, -1, axis=0)])  # x1 y1 x2 y2
+
+    def bounds(self):
+        low, high = self.points.min(axis=0), self.points.max(axis=0)
+        return low[0], low[1], high[0], high[1]
+
+    def contains_xy(self, x, y):
+        """Ray casting over every edge; used when the grid is built, not per tick."""
+        x1, y1, x2, y2 = self.edges.T
+        straddle = (y1 > y) != (y2 > y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            crossing = x1 + (y - y1)*(x2 - x1)/(y2 - y1)
+        return bool(np.count_nonzero(straddle & (x < crossing)) % 2)
+
+
+class Cylinder_Fence():
+    def __init__(self, center, radius, floor=-math.inf, ceiling=math.inf, inclusion=True):
+        self.center = (float(center[0]), float(center[1]))
+        self.radius = float(radius)
+        self.floor = floor
+        self.ceiling = ceiling
+        self.inclusion = inclusion
+
+    def bounds(self):
+        return self.center[0] - self.radius, self.center[1] - self.radius, self.center[0] + self.radius, self.center[1] + self.radius
+
+    def contains_xy(self, x, y):
+        dx, dy = x - self.center[0], y - self.center[1]
+        return dx*dx + dy*dy <= self.radius*self.radius
+
+
+def make_fence(spec):
+    """A fence from its message/JSON form, e.g. {"type": "polygon", "points": [[x, y], ...],
+    "floor": 0, "ceiling": 50, "inclusion": true} or {"type": "cylinder", "center": [x, y], "radius": r}."""
+    options = {'floor': float(spec.get('floor', -math.inf)), 'ceiling': float(spec.get('ceiling', math.inf)),
+               'inclusion': bool(spec.get('inclusion', True))}
+    if spec.get('type') == 'polygon':
+        return Polygon_Fence(spec['points'], **options)
+    if spec.get('type') == 'cylinder':
+        return Cylinder_Fence(spec['center'], spec['radius'], **options)
+    raise ValueError(f"Unknown fence type {spec.get('type')}")
+
+
+def segment_cells(a, b, size):
+    """The (ix, iy) grid cells segment a-b passes through (and cells it only just misses)."""
+    (x1, y1), (x2, y2) = (a, b) if a[0] <= b[0] else (b, a)
+    margin = GRID_MARGIN*max(size, abs(x1), abs(x2), abs(y1), abs(y2))
+    cells = []
+    for ix in range(int(math.floor((x1 - margin)/size)), int(math.floor((x2 + margin)/size)) + 1):
+        # The part of the segment within this column of cells
+        xa, xb = max(x1, ix*size), min(x2, (ix + 1)*size)
+        if x2 > x1:
+            ya, yb = y1 + (xa - x1)*(y2 - y1)/(x2 - x1), y1 + (xb - x1)*(y2 - y1)/(x2 - x1)
+        else:
+            ya, yb = y1, y2
+        for iy in range(int(math.floor((min(ya, yb) - margin)/size)), int(math.floor((max(ya, yb) + margin)/size)) + 1):
+            cells.append((ix, iy))
+    return cells
+
+
+class Geofence():
+    def __init__(self, fences, cell_size=None):
+        self.fences = list(fences)
+        self.inclusion = any(fence.inclusion for fence in self.fences)
+        self.bounds = np.array([fence.bounds() for fence in self.fences], dtype=float).reshape(-1, 4)
+        if cell_size is None:
+            extent = float(np.max(self.bounds[:, 2:] - self.bounds[:, :2])) if len(self.fences) else 0.0
+            # An edge of length l crosses about l/cell_size cells along its longer axis
+            perimeter = sum(float(np.sum(np.max(np.abs(fence.edges[:, 2:] - fence.edges[:, :2]), axis=1)))
+                            for fence in self.fences if isinstance(fence, Polygon_Fence))
+            cell_size = max(CELL_SIZE, extent/MAX_GRID_CELLS, perimeter/MAX_EDGE_CELLS)
+        self.cell_size = cell_size
+        # (ix, iy) -> {fence number: polygon edges crossing the cell}, only for cells edges cross
+        self.edge_cells = {}
+        for number, fence in enumerate(self.fences):
+            if isinstance(fence, Polygon_Fence):
+                for a, b, c, d in fence.edges.tolist():
+                    for cell in segment_cells((a, b), (c, d), cell_size):
+                        self.edge_cells.setdefault(cell, {}).setdefault(number, []).append(((a, b), (c, d)))
+        # (ix, iy) -> [(fence number, fence, center inside, center, local edges)] for every fence
+        # that may hold part of the cell, filled in by cell() on first use; the last three only
+        # for polygons (center and edges None when no edge crosses the cell)
+        self.cells = {}
+
+    def cell(self, key):
+        entries = self.cells.get(key)
+        if entries is not None:
+            return entries
+        size = self.cell_size
+        x0, y0 = key[0]*size, key[1]*size
+        b = self.bounds
+        overlap = np.flatnonzero((b[:, 0] <= x0 + size) & (b[:, 2] >= x0) & (b[:, 1] <= y0 + size) & (b[:, 3] >= y0))
+        crossing = self.edge_cells.get(key, {})
+        cx, cy = x0 + 0.5*size, y0 + 0.5*size
+        entries = []
+        for number in overlap.tolist():
+            fence = self.fences[number]
+            if not isinstance(fence, Polygon_Fence):
+                entries.append((number, fence, None, None, None))
+            elif number in crossing:
+                entries.append((number, fence, fence.contains_xy(cx, cy), (cx, cy), crossing[number]))
+            elif fence.contains_xy(cx, cy):
+                entries.append((number, fence, True, None, None))
+            # else the whole cell is outside this polygon
+        self.cells[key] = entries
+        return entries
+
+    def inside(self, entry, pos):
+        number, fence, center_inside, center, edges = entry
+        if not fence.floor <= pos[2] <= fence.ceiling:
+            return False
+        if center_inside is None:
+            return fence.contains_xy(pos[0], pos[1])
+        if center is None:
+            return center_inside
+        crossings = sum(segments_cross(center, pos, a, b) for a, b in edges)
+        return center_inside != (crossings % 2 == 1)
+
+    def breach(self, pos):
+        """Why pos violates the fences (inside an exclusion fence, or outside every inclusion
+        fence if there are any), or None if it doesn't."""
+        entries = self.cell((int(math.floor(pos[0]/self.cell_size)), int(math.floor(pos[1]/self.cell_size))))
+        included = False
+        for entry in entries:
+            if self.inside(entry, pos):
+                if not entry[1].inclusion:
+                    return f"inside exclusion fence {entry[0]}"
+                included = True
+        if self.inclusion and not included:
+            return "outside the inclusion fences"
+        return None
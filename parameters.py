@@ -0,0 +1,171 @@
+import threading
+
+# ===========================================================
+# ---- Parameter Service ----
+# ===========================================================
+# A typed, validated table of named runtime parameters, like MAVLink PARAM_SET/PARAM_VALUE.
+# Every parameter reads and writes its value through a getter and a setter, so one table can
+# hold controller gains (entries of a controller parameter dictionary) and simulator settings
+# (module globals) alike. set requests are validated when they arrive and queued; the owner
+# calls apply_pending() between control ticks, which applies every queued value together and
+# then calls on_change once, so a controller never runs with half of a new gain set. Checks
+# between parameters (e.g. MOT_MIN <= MOT_MAX) are made on the values the parameters will have
+# once every queued set is applied, so a set that would break one is rejected on arrival.
+
+TYPES = {'float': float, 'int': int}
+GAIN_MAX = 1.0e6
+AXES = ['X', 'Y', 'Z']
+
+# (name, path in the controller parameter dictionary, type, min, max, description)
+CONTROLLER_PARAMETERS = [
+    ('MOT_MIN', ('Motor_limits', 0), 'float', 0, 20000, 'Minimum motor speed (RPM)'),
+    ('MOT_MAX', ('Motor_limits', 1), 'float', 0, 20000, 'Maximum motor speed (RPM)'),
+    ('TILT_MIN', ('Tilt_limits', 0), 'float', -90, 0, 'Minimum tilt angle (deg)'),
+    ('TILT_MAX', ('Tilt_limits', 1), 'float', 0, 90, 'Maximum tilt angle (deg)'),
+    ('YAW_CTL_MIN', ('Yaw_Control_Limits', 0), 'float', -20000, 0, 'Minimum yaw control output'),
+    ('YAW_CTL_MAX', ('Yaw_Control_Limits', 1), 'float', 0, 20000, 'Maximum yaw control output'),
+    ('Z_XY_OFFSET', ('Z_XY_offset',), 'float', 0, 10000, 'Throttle margin left for attitude control'),
+    ('YAW_RATE_SCALER', ('Yaw_Rate_Scaler',), 'float', 0, 100, 'Yaw error to yaw rate gain'),
+]
+for i, axis in enumerate(AXES):
+    for term in 'PID':
+        CONTROLLER_PARAMETERS.append((f'LIN_{term}_{axis}', ('Linear_PID', term, i), 'float', 0, GAIN_MAX, f'Linear PID {term} gain, {axis}'))
+        CONTROLLER_PARAMETERS.append((f'ANG_{term}_{axis}', ('Angular_PID', term, i), 'float', 0, GAIN_MAX, f'Angular PID {term} gain, {axis}'))
+    CONTROLLER_PARAMETERS.append((f'LIN_ANG_{axis}', ('Linear_To_Angular_Scaler', i), 'float', 0, 100, f'Linear to angular scaler, {axis}'))
+# (low, high): pairs whose ranges overlap, so low <= high is checked between them
+CONTROLLER_CHECKS = [('MOT_MIN', 'MOT_MAX')]
+
+
+class Parameter():
+    def __init__(self, name, type, get, set, low=None, high=None, description=''):
+        if type not in TYPES:
+            raise ValueError(f'Unknown parameter type {type}')
+        self.name = name
+        self.type = type
+        self.get = get
+        self.set = set
+        self.low = low
+        self.high = high
+        self.description = description
+
+    def validate(self, value):
+        """The value converted to the parameter's type; ValueError if it can't be or is out of range."""
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f'{self.name} must be a number')
+        converted = TYPES[self.type](value)
+        if converted != value:
+            raise ValueError(f'{self.name} must be an {self.type}')
+        if self.low is not None and converted < self.low:
+            raise ValueError(f'{self.name} must be >= {self.low}')
+        if self.high is not None and converted > self.high:
+            raise ValueError(f'{self.name} must be <= {self.high}')
+        return converted
+
+    def info(self):
+        return {'type': self.type, 'min': self.low, 'max': self.high, 'description': self.description}
+
+
+class Parameter_Table():
+    def __init__(self, on_change=None):
+        self.parameters = {}
+        self.pending = {}
+        self.checks = []
+        self.lock = threading.Lock()
+        self.on_change = on_change
+
+    def __contains__(self, name):
+        return name in self.parameters
+
+    def add(self, name, type, get, set, low=None, high=None, description=''):
+        self.parameters[name] = Parameter(name, type, get, set, low, high, description)
+
+    def add_check(self, low, high):
+        """Require parameter 'low' <= parameter 'high'."""
+        self.checks.append((low, high))
+
+    def add_controller(self, params):
+        """Expose the entries of a controller parameter dictionary, see CONTROLLER_PARAMETERS."""
+        for name, path, type, low, high, description in CONTROLLER_PARAMETERS:
+            container = params
+            for key in path[:-1]:
+                container = container[key]
+            index = path[-1]
+            self.add(name, type, lambda c=container, k=index: c[k], lambda value, c=container, k=index: c.__setitem__(k, value),
+                     low, high, description)
+        for low, high in CONTROLLER_CHECKS:
+            self.add_check(low, high)
+
+    def values(self, names=None):
+        names = self.parameters if names is None else names
+        return {name: self.parameters[name].get() for name in names if name in self.parameters}
+
+    def info(self):
+        return {name: parameter.info() for name, parameter in self.parameters.items()}
+
+    def request(self, name, value):
+        """Validate and queue one set; returns the converted value. KeyError/ValueError if rejected."""
+        accepted, errors = self.request_all({name: value})
+        if name in errors:
+            raise errors[name]
+        return accepted[name]
+
+    def request_all(self, sets):
+        """Validate and queue sets that arrived together, so both parameters of a check can be moved
+        in one request. Returns {name: converted value} of the queued sets and {name: KeyError or
+        ValueError} of the rejected ones."""
+        accepted = {}
+        errors = {}
+        for name, value in sets.items():
+            try:
+                if name not in self.parameters:
+                    raise KeyError(f'Unknown parameter {name}')
+                accepted[name] = self.parameters[name].validate(value)
+            except (KeyError, ValueError) as e:
+                errors[name] = e
+        with self.lock:
+            for low, high in self.checks:
+                if low not in accepted and high not in accepted:
+                    continue
+                values = dict(self.pending, **accepted)
+                low_value = values[low] if low in values else self.parameters[low].get()
+                high_value = values[high] if high in values else self.parameters[high].get()
+                if low_value > high_value:
+                    for name in (low, high):
+                        if name in accepted:
+                            del accepted[name]
+                            errors[name] = ValueError(f'{low} ({low_value}) must be <= {high} ({high_value})')
+            self.pending.update(accepted)
+        return accepted, errors
+
+    def apply_pending(self):
+        """Apply every queued set. Call from the thread that uses the parameters, between ticks."""
+        # Set under the lock, so a request never checks against half applied values
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            for name, value in pending.items():
+                self.parameters[name].set(value)
+        if pending and self.on_change is not None:
+            self.on_change()
+        return pending
+
+
+def lookup(container, path):
+    for key in path:
+        try:
+            container = container[key]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return container
+
+
+def controller_sets(updates):
+    """Translate a nested controller parameter update, e.g. {'Angular_PID': {'P': [..]}} or the
+    Linear_PID shorthand {'P': [..]}, into {parameter name: value}."""
+    sets = {}
+    for name, path, type, low, high, description in CONTROLLER_PARAMETERS:
+        value = lookup(updates, path)
+        if value is None and path[0] == 'Linear_PID':
+            value = lookup(updates, path[1:])
+        if value is not None:
+            sets[name] = value
+    return sets
@@ -0,0 +1,81 @@
+import math
+import numpy as np
+
+# ===========================================================
+# ---- Propulsion ----
+# ===========================================================
+# Motors of every vehicle as (N,4) arrays. Commanded speeds (RPM) reach the motors through a
+# first-order lag, thrust is coeff*speed^2 with propeller_thrust_coefficient folded once per
+# vehicle, and the pack current is the electrical power of the rotors (ideal induced power
+# from momentum theory over an overall efficiency) divided by the pack voltage, plus the
+# motors' no-load current.
+# Per-vehicle parameters are read from the quadcopter dictionary when present:
+#   'motor_time_constant' (s, 0 means instantaneous), 'motor_efficiency', 'idle_current' (A per motor)
+
+AIR_DENSITY = 1.225
+DEFAULT_MOTOR_TIME_CONSTANT = 0.0
+DEFAULT_MOTOR_EFFICIENCY = 0.5  # Induced power / electrical power, motor, ESC and propeller together
+DEFAULT_IDLE_CURRENT = 0.3
+DEFAULT_VOLTAGE = 11.1
+
+
+def propeller_thrust_coefficient(prop_dia,prop_pitch):
+    # From http://www.electricrcaircraftguy.com/2013/09/propeller-static-dynamic-thrust-equation.html
+    # thrust = 4.392e-8*speed*dia^3.5/sqrt(pitch)*4.23e-4*speed*pitch = coeff*speed^2 (in N)
+    return 4.392e-8*math.pow(prop_dia,3.5)/math.sqrt(prop_pitch)*4.23e-4*prop_pitch
+
+
+def induced_power_coefficient(prop_dia):
+    """P = coeff*T^1.5 (W, T in N) for a rotor of prop_dia inches, from momentum theory."""
+    disk_area = math.pi*(prop_dia*0.0254/2)**2
+    return 1.0/math.sqrt(2*AIR_DENSITY*disk_area)
+
+
+class Propulsion():
+    def __init__(self, quads):
+        self.keys = list(quads)
+        n = len(self.keys)
+        self.commands = np.zeros((n,4))
+        self.speeds = np.zeros((n,4))
+        self.thrusts = np.zeros((n,4))
+        self.currents = np.zeros(n)
+        self.voltage = np.full(n, DEFAULT_VOLTAGE)
+        self.thrust_coeff = np.zeros(n)
+        self.power_coeff = np.zeros(n)
+        self.time_constant = np.zeros(n)
+        self.idle_current = np.zeros(n)
+        for i,key in enumerate(self.keys):
+            quad = quads[key]
+            self.thrust_coeff[i] = propeller_thrust_coefficient(quad['prop_size'][0],quad['prop_size'][1])
+            self.power_coeff[i] = induced_power_coefficient(quad['prop_size'][0])/quad.get('motor_efficiency',DEFAULT_MOTOR_EFFICIENCY)
+            self.time_constant[i] = quad.get('motor_time_constant',DEFAULT_MOTOR_TIME_CONSTANT)
+            self.idle_current[i] = 4*quad.get('idle_current',DEFAULT_IDLE_CURRENT)
+        self.instant = self.time_constant <= 0
+        self.lagged = not np.all(self.instant)
+        self.gain_dt = None
+
+    def command(self, i, speeds):
+        self.commands[i] = speeds
+        if self.instant[i]:
+            self.speeds[i] = speeds
+            self.thrusts[i] = self.thrust_coeff[i]*self.speeds[i]*self.speeds[i]
+
+    def command_all(self, speeds):
+        self.commands[:] = speeds
+        if not self.lagged:
+            self.speeds[:] = speeds
+            self.thrusts[:] = self.thrust_coeff[:,None]*self.speeds*self.speeds
+
+    def step(self, dt):
+        """Advance the motor lag by dt and update thrusts and pack currents of all vehicles."""
+        if self.lagged:
+            if self.gain_dt != dt:
+                # Exact discretization of the first-order lag, recomputed only if dt changes
+                with np.errstate(divide='ignore'):
+                    self.gain = np.where(self.instant, 1.0, -np.expm1(-dt/self.time_constant))[:,None]
+                self.gain_dt = dt
+            self.speeds += self.gain*(self.commands - self.speeds)
+            np.multiply(self.thrust_coeff[:,None], self.speeds*self.speeds, out=self.thrusts)
+        power = self.power_coeff*np.sum(self.thrusts*np.sqrt(self.thrusts), axis=1)
+        np.add(power/self.voltage, self.idle_current, out=self.currents)
+        return self.currents
@@ -1,51 +1,43 @@
 import numpy as np
 import math
 import scipy.integrate
-import time
 import datetime
-import threading
-
-class Propeller():
-    def __init__(self, prop_dia, prop_pitch, thrust_unit='N'):
-        self.dia = prop_dia
-        self.pitch = prop_pitch
-        self.thrust_unit = thrust_unit
-        self.speed = 0 #RPM
-        self.thrust = 0
-
-    def set_speed(self,speed):
-        self.speed = speed
-        # From http://www.electricrcaircraftguy.com/2013/09/propeller-static-dynamic-thrust-equation.html
-        self.thrust = 4.392e-8 * self.speed * math.pow(self.dia,3.5)/(math.sqrt(self.pitch))
-        self.thrust = self.thrust*(4.23e-4 * self.speed * self.pitch)
-        if self.thrust_unit == 'Kg':
-            self.thrust = self.thrust*0.101972
+import propulsion
 
 class Quadcopter():
     # State space representation: [x y z x_dot y_dot z_dot theta phi gamma theta_dot phi_dot gamma_dot]
     # From Quadcopter Dynamics, Simulation, and Control by Andrew Gibiansky
-    def __init__(self,quads,gravity=9.81,b=0.0245):
+    # Motors are a propulsion.Propulsion bank stepped at the start of each update(dt), and
+    # their thrusts are held constant over the step; 'integrator' is one of INTEGRATORS
+    INTEGRATORS = ['rk4','semi_implicit','rk45','vode']
+
+    def __init__(self,quads,gravity=9.81,b=0.0245,integrator='rk4'):
+        if integrator not in self.INTEGRATORS:
+            raise ValueError('Unknown integrator %s, expected one of %s'%(integrator,self.INTEGRATORS))
         self.quads = quads
         self.g = gravity
         self.b = b
-        self.thread_object = None
-        self.ode =  scipy.integrate.ode(self.state_dot).set_integrator('vode',nsteps=500,method='bdf')
+        self.integrator = integrator
+        self.step_size = {}
+        self.ode = None
+        if integrator == 'vode':
+            self.ode = scipy.integrate.ode(self.state_dot).set_integrator('vode',nsteps=500,method='bdf')
         self.time = datetime.datetime.now()
+        self.keys = list(self.quads.keys())
+        self.index = {key:i for i,key in enumerate(self.keys)}
+        self.propulsion = propulsion.Propulsion(self.quads)
         for key in self.quads:
             self.quads[key]['state'] = np.zeros(12)
             self.quads[key]['state'][0:3] = self.quads[key]['position']
             self.quads[key]['state'][6:9] = self.quads[key]['orientation']
-            self.quads[key]['m1'] = Propeller(self.quads[key]['prop_size'][0],self.quads[key]['prop_size'][1])
-            self.quads[key]['m2'] = Propeller(self.quads[key]['prop_size'][0],self.quads[key]['prop_size'][1])
-            self.quads[key]['m3'] = Propeller(self.quads[key]['prop_size'][0],self.quads[key]['prop_size'][1])
-            self.quads[key]['m4'] = Propeller(self.quads[key]['prop_size'][0],self.quads[key]['prop_size'][1])
             # From Quadrotor Dynamics and Control by Randal Beard
             ixx=((2*self.quads[key]['weight']*self.quads[key]['r']**2)/5)+(2*self.quads[key]['weight']*self.quads[key]['L']**2)
             iyy=ixx
             izz=((2*self.quads[key]['weight']*self.quads[key]['r']**2)/5)+(4*self.quads[key]['weight']*self.quads[key]['L']**2)
             self.quads[key]['I'] = np.array([[ixx,0,0],[0,iyy,0],[0,0,izz]])
             self.quads[key]['invI'] = np.linalg.inv(self.quads[key]['I'])
-        self.run = True
+            # Constants of state_dot, looked up once per evaluation
+            self.quads[key]['dynamics'] = (1.0/self.quads[key]['weight'],self.quads[key]['L'],ixx,iyy,izz)
 
     def rotation_matrix(self,angles):
         ct = math.cos(angles[0])
@@ -64,41 +56,51 @@ class Quadcopter():
         return( ( val + np.pi) % (2 * np.pi ) - np.pi )
 
     def state_dot(self, time, state, key):
-        state_dot = np.zeros(12)
-        # The velocities(t+1 x_dots equal the t x_dots)
-        state_dot[0] = self.quads[key]['state'][3]
-        state_dot[1] = self.quads[key]['state'][4]
-        state_dot[2] = self.quads[key]['state'][5]
-        # The acceleration
-        x_dotdot = np.array([0,0,-self.quads[key]['weight']*self.g]) + np.dot(self.rotation_matrix(self.quads[key]['state'][6:9]),np.array([0,0,(self.quads[key]['m1'].thrust + self.quads[key]['m2'].thrust + self.quads[key]['m3'].thrust + self.quads[key]['m4'].thrust)]))/self.quads[key]['weight']
-        state_dot[3] = x_dotdot[0]
-        state_dot[4] = x_dotdot[1]
-        state_dot[5] = x_dotdot[2]
-        # The angular rates(t+1 theta_dots equal the t theta_dots)
-        state_dot[6] = self.quads[key]['state'][9]
-        state_dot[7] = self.quads[key]['state'][10]
-        state_dot[8] = self.quads[key]['state'][11]
-        # The angular accelerations
-        omega = self.quads[key]['state'][9:12]
-        tau = np.array([self.quads[key]['L']*(self.quads[key]['m1'].thrust-self.quads[key]['m3'].thrust), self.quads[key]['L']*(self.quads[key]['m2'].thrust-self.quads[key]['m4'].thrust), self.b*(self.quads[key]['m1'].thrust-self.quads[key]['m2'].thrust+self.quads[key]['m3'].thrust-self.quads[key]['m4'].thrust)])
-        omega_dot = np.dot(self.quads[key]['invI'], (tau - np.cross(omega, np.dot(self.quads[key]['I'],omega))))
-        state_dot[9] = omega_dot[0]
-        state_dot[10] = omega_dot[1]
-        state_dot[11] = omega_dot[2]
-        return state_dot
+        quad = self.quads[key]
+        inv_weight,L,ixx,iyy,izz = quad['dynamics']
+        t1,t2,t3,t4 = self.propulsion.thrusts[self.index[key]].tolist()
+        ct,cp,cg = math.cos(state[6]),math.cos(state[7]),math.cos(state[8])
+        st,sp,sg = math.sin(state[6]),math.sin(state[7]),math.sin(state[8])
+        # The acceleration: gravity plus the body thrust [0,0,T] rotated by R = R_z.R_y.R_x
+        accel = (t1+t2+t3+t4)*inv_weight
+        # The angular accelerations: invI.(tau - omega x I.omega), with I diagonal
+        wx,wy,wz = state[9],state[10],state[11]
+        tau_x = L*(t1-t3)
+        tau_y = L*(t2-t4)
+        tau_z = self.b*(t1-t2+t3-t4)
+        return np.array([state[3],state[4],state[5],
+                         accel*(cg*sp*ct+sg*st),accel*(sg*sp*ct-cg*st),accel*cp*ct-self.g,
+                         wx,wy,wz,
+                         (tau_x-(wy*izz*wz-wz*iyy*wy))/ixx,
+                         (tau_y-(wz*ixx*wx-wx*izz*wz))/iyy,
+                         (tau_z-(wx*iyy*wy-wy*ixx*wx))/izz])
+
+    def integrate(self, f, state, dt, key):
+        """Advance state (one vehicle's (12,) or a fleet's (N,12)) by dt under the derivative f."""
+        if self.integrator == 'rk4':
+            return rk4_step(f,state,dt)
+        if self.integrator == 'semi_implicit':
+            return semi_implicit_step(f,state,dt)
+        state,self.step_size[key] = rk45_step(f,state,dt,self.step_size.get(key,dt))
+        return state
 
     def update(self, dt):
+        self.propulsion.step(dt)
         for key in self.quads:
-            self.ode.set_initial_value(self.quads[key]['state'],0).set_f_params(key)
-            self.quads[key]['state'] = self.ode.integrate(self.ode.t + dt)
-            self.quads[key]['state'][6:9] = self.wrap_angle(self.quads[key]['state'][6:9])
-            self.quads[key]['state'][2] = max(0,self.quads[key]['state'][2])
+            state = self.quads[key]['state']
+            if self.integrator == 'vode':
+                self.ode.set_initial_value(state,0).set_f_params(key)
+                state[:] = self.ode.integrate(self.ode.t + dt)
+            else:
+                state[:] = self.integrate(lambda s,key=key: self.state_dot(0,s,key),state,dt,key)
+            state[6:9] = self.wrap_angle(state[6:9])
+            state[2] = max(0,state[2])
 
     def set_motor_speeds(self,quad_name,speeds):
-        self.quads[quad_name]['m1'].set_speed(speeds[0])
-        self.quads[quad_name]['m2'].set_speed(speeds[1])
-        self.quads[quad_name]['m3'].set_speed(speeds[2])
-        self.quads[quad_name]['m4'].set_speed(speeds[3])
+        self.propulsion.command(self.index[quad_name],speeds)
+
+    def get_motor_speeds(self,quad_name):
+        return self.propulsion.speeds[self.index[quad_name]]
 
     def get_position(self,quad_name):
         return self.quads[quad_name]['state'][0:3]
@@ -124,19 +126,148 @@ class Quadcopter():
     def get_time(self):
         return self.time
 
-    def thread_run(self,dt,time_scaling):
-        rate = time_scaling*dt
-        last_update = self.time
-        while(self.run==True):
-            time.sleep(0)
-            self.time = datetime.datetime.now()
-            if (self.time-last_update).total_seconds() > rate:
-                self.update(dt)
-                last_update = self.time
-
-    def start_thread(self,dt=0.002,time_scaling=1):
-        self.thread_object = threading.Thread(target=self.thread_run,args=(dt,time_scaling))
-        self.thread_object.start()
-
-    def stop_thread(self):
-        self.run = False
+    def set_time(self,time):
+        self.time = time
+
+class Quadcopter_Fleet(Quadcopter):
+    # Batched dynamics for swarms: the states of all N vehicles live in one (N,12) array
+    # and the whole fleet is advanced by a single fixed-step integrator using NumPy
+    # broadcasting. self.quads[key]['state'] is a row view into that array, so the per-key
+    # API (get_state, get_position, set_motor_speeds, ...) keeps working unchanged.
+    INTEGRATORS = ['rk4','semi_implicit','rk45']
+
+    def __init__(self,quads,gravity=9.81,b=0.0245,integrator='rk4'):
+        if integrator not in self.INTEGRATORS:
+            raise ValueError('Unknown integrator %s, expected one of %s'%(integrator,self.INTEGRATORS))
+        self.quads = quads
+        self.g = gravity
+        self.b = b
+        self.integrator = integrator
+        self.step_size = {}
+        self.time = datetime.datetime.now()
+        self.keys = list(self.quads.keys())
+        self.index = {key:i for i,key in enumerate(self.keys)}
+        n = len(self.keys)
+        self.states = np.zeros((n,12))
+        self.propulsion = propulsion.Propulsion(self.quads)
+        # Actual motor speeds and thrusts, shared with the propulsion bank
+        self.speeds = self.propulsion.speeds
+        self.thrusts = self.propulsion.thrusts
+        self.weight = np.zeros(n)
+        self.L = np.zeros(n)
+        self.I_diag = np.zeros((n,3))
+        for i,key in enumerate(self.keys):
+            quad = self.quads[key]
+            self.states[i,0:3] = quad['position']
+            self.states[i,6:9] = quad['orientation']
+            self.weight[i] = quad['weight']
+            self.L[i] = quad['L']
+            ixx=((2*quad['weight']*quad['r']**2)/5)+(2*quad['weight']*quad['L']**2)
+            izz=((2*quad['weight']*quad['r']**2)/5)+(4*quad['weight']*quad['L']**2)
+            self.I_diag[i] = [ixx,ixx,izz]
+            quad['I'] = np.diag(self.I_diag[i])
+            quad['invI'] = np.diag(1.0/self.I_diag[i])
+            quad['state'] = self.states[i]
+            quad['speeds'] = self.speeds[i]
+        self.invI_diag = 1.0/self.I_diag
+
+    def batch_state_dot(self, states):
+        # Only the third column of R = R_z.R_y.R_x is needed to rotate the body thrust [0,0,T]
+        ct,cp,cg = np.cos(states[:,6]),np.cos(states[:,7]),np.cos(states[:,8])
+        st,sp,sg = np.sin(states[:,6]),np.sin(states[:,7]),np.sin(states[:,8])
+        t = self.thrusts
+        accel = (t[:,0]+t[:,1]+t[:,2]+t[:,3])/self.weight
+        omega = states[:,9:12]
+        tau = np.empty_like(omega)
+        tau[:,0] = self.L*(t[:,0]-t[:,2])
+        tau[:,1] = self.L*(t[:,1]-t[:,3])
+        tau[:,2] = self.b*(t[:,0]-t[:,1]+t[:,2]-t[:,3])
+        state_dot = np.empty_like(states)
+        state_dot[:,0:3] = states[:,3:6]
+        state_dot[:,3] = accel*(cg*sp*ct + sg*st)
+        state_dot[:,4] = accel*(sg*sp*ct - cg*st)
+        state_dot[:,5] = accel*(cp*ct) - self.g
+        state_dot[:,6:9] = omega
+        # I is diagonal, so invI.(tau - omega x I.omega) reduces to element-wise products.
+        # The cross product is written out: np.cross costs more than the rest of this function.
+        Iw = self.I_diag*omega
+        tau[:,0] -= omega[:,1]*Iw[:,2] - omega[:,2]*Iw[:,1]
+        tau[:,1] -= omega[:,2]*Iw[:,0] - omega[:,0]*Iw[:,2]
+        tau[:,2] -= omega[:,0]*Iw[:,1] - omega[:,1]*Iw[:,0]
+        state_dot[:,9:12] = self.invI_diag*tau
+        return state_dot
+
+    def update(self, dt):
+        self.propulsion.step(dt)
+        s = self.states
+        # Written in place: self.quads[key]['state'] are views of self.states
+        s[:] = self.integrate(self.batch_state_dot,s,dt,None)
+        s[:,6:9] = self.wrap_angle(s[:,6:9])
+        np.maximum(s[:,2],0,out=s[:,2])
+
+    def set_motor_speeds(self,quad_name,speeds):
+        self.propulsion.command(self.index[quad_name],speeds)
+
+    def get_motor_speeds(self,quad_name):
+        return self.speeds[self.index[quad_name]]
+
+    def set_all_motor_speeds(self,speeds):
+        # speeds is an (N,4) array ordered like self.keys
+        self.propulsion.command_all(speeds)
+
+# ===========================================================
+# ---- Integrators ----
+# ===========================================================
+# Steppers for state_dot(state) -> derivative, on one vehicle's (12,) state or a (N,12) fleet.
+
+def rk4_step(f,s,dt):
+    k1 = f(s)
+    k2 = f(s + 0.5*dt*k1)
+    k3 = f(s + 0.5*dt*k2)
+    k4 = f(s + dt*k3)
+    return s + (dt/6.0)*(k1 + 2*k2 + 2*k3 + k4)
+
+def semi_implicit_step(f,s,dt):
+    # Semi-implicit (symplectic) Euler: rates first, then positions/angles from the new rates
+    d = f(s)
+    s = s.copy()
+    s[...,3:6] += dt*d[...,3:6]
+    s[...,9:12] += dt*d[...,9:12]
+    s[...,0:3] += dt*s[...,3:6]
+    s[...,6:9] += dt*s[...,9:12]
+    return s
+
+# Dormand-Prince 5(4) tableau
+DP_C = [0,1/5,3/10,4/5,8/9,1]
+DP_A = [[],
+        [1/5],
+        [3/40,9/40],
+        [44/45,-56/15,32/9],
+        [19372/6561,-25360/2187,64448/6561,-212/729],
+        [9017/3168,-355/33,46732/5247,49/176,-5103/18656],
+        [35/384,0,500/1113,125/192,-2187/6784,11/84]]
+DP_E = [71/57600,0,-71/16695,71/1920,-17253/339200,22/525,-1/40]
+
+def rk45_step(f,s,dt,h,rtol=1e-6,atol=1e-8):
+    # Adaptive Dormand-Prince over [0,dt] in substeps of at most h. The error norm is taken
+    # over the whole array, so a fleet shares one step size. Returns (state, next step size).
+    t = 0.0
+    k1 = f(s)
+    while dt - t > 1e-12:
+        step = min(h,dt - t)
+        k = [k1]
+        for i in range(1,7):
+            k.append(f(s + step*sum(a*ki for a,ki in zip(DP_A[i],k) if a)))
+        new = s + step*sum(a*ki for a,ki in zip(DP_A[6],k) if a)
+        error = step*sum(e*ki for e,ki in zip(DP_E,k) if e)
+        scale = atol + rtol*np.maximum(np.abs(s),np.abs(new))
+        norm = math.sqrt(np.mean((error/scale)**2))
+        factor = min(5.0,max(0.2,0.9*norm**-0.2)) if norm > 0 else 5.0
+        if norm <= 1.0:
+            # First-same-as-last: the last stage is the derivative at the new state
+            t += step
+            s,k1 = new,k[6]
+            h = step*factor if step == h else max(h,step*factor)
+        else:
+            h = step*factor
+    return s,h
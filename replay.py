@@ -0,0 +1,164 @@
+import argparse
+import bisect
+import os
+import time
+import numpy as np
+import flight_recorder
+
+# ===========================================================
+# ---- Flight Log Replay ----
+# ===========================================================
+# Flight logs are memory-mapped, never read whole: the record timestamps (written in append
+# order, so sorted) are the time index, and a seek is a binary search that touches only a
+# handful of pages. bisect is used rather than np.searchsorted, which would first copy the
+# strided timestamp column out of the map. A rotated series of logs is replayed as one timeline.
+
+MAX_FRAMES_PER_TICK = 1000  # At high replay speeds only the newest frames of a tick are emitted
+
+
+def record_to_frame(record):
+    """Convert one log record back to the telemetry dictionary layout."""
+    frame = {
+        'id': record['vehicle'].decode(),
+        'seq': int(record['seq']),
+        'sim_time': float(record['sim_time']),
+        'timestamp': float(record['timestamp']),
+        'position': record['position'].tolist(),
+        'orientation': record['orientation'].tolist(),
+        'velocity': record['velocity'].tolist(),
+        'battery': float(record['battery']),
+        'mode': flight_recorder.mode_name(record['mode']),
+        'waypoint_index': int(record['waypoint_index']),
+    }
+    # Version 1 logs have no electrical fields
+    for name in ('voltage', 'current', 'energy'):
+        if name in record.dtype.names:
+            frame[name] = float(record[name])
+    return frame
+
+
+class Flight_Log():
+    def __init__(self, paths):
+        if isinstance(paths, str):
+            paths = [paths]
+        self.segments = []
+        for path in sorted(paths):
+            version, start = flight_recorder.read_header(path)
+            dtype = flight_recorder.RECORD_DTYPES[version]
+            # A log still being written may end in a partial record; ignore it
+            count = (os.path.getsize(path) - flight_recorder.HEADER.size)//dtype.itemsize
+            if count == 0:
+                continue
+            records = np.memmap(path, dtype=dtype, mode='r', offset=flight_recorder.HEADER.size, shape=(count,))
+            self.segments.append(records)
+        if not self.segments:
+            raise ValueError('Flight log is empty')
+        self.offsets = np.cumsum([0] + [len(records) for records in self.segments])
+        self.segment_start = np.array([records['timestamp'][0] for records in self.segments])
+        self.start_time = float(self.segment_start[0])
+        self.end_time = float(self.segments[-1]['timestamp'][-1])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def record(self, i):
+        segment = int(np.searchsorted(self.offsets, i, side='right')) - 1
+        return self.segments[segment][i - self.offsets[segment]]
+
+    def index_at(self, timestamp):
+        """Index of the first record at or after timestamp."""
+        segment = max(0, int(np.searchsorted(self.segment_start, timestamp, side='right')) - 1)
+        i = bisect.bisect_left(self.segments[segment]['timestamp'], timestamp)
+        return int(self.offsets[segment]) + i
+
+    def frames(self, start, stop):
+        for i in range(max(0, start), min(stop, len(self))):
+            yield record_to_frame(self.record(i))
+
+
+class Replay_Player():
+    # Plays a Flight_Log into a callback at 'speed' times real time, with seeking and frame
+    # stepping. Call tick() periodically (e.g. from the Tk loop); it is cheap when paused.
+    def __init__(self, log, callback, speed=1.0):
+        self.log = log
+        self.callback = callback
+        self.speed = speed
+        self.paused = False
+        self.position = 0
+        self.replay_time = log.start_time
+        self.last_tick = None
+
+    def seek(self, timestamp):
+        timestamp = min(max(timestamp, self.log.start_time), self.log.end_time)
+        self.replay_time = timestamp
+        self.position = self.log.index_at(timestamp)
+        self.last_tick = None
+        # Show the state at the new position immediately
+        if self.position > 0:
+            self.callback(record_to_frame(self.log.record(self.position - 1)))
+
+    def seek_fraction(self, fraction):
+        self.seek(self.log.start_time + fraction*(self.log.end_time - self.log.start_time))
+
+    def step(self, frames=1):
+        """Emit the next 'frames' frames regardless of their timestamps (while paused)."""
+        stop = min(self.position + frames, len(self.log))
+        for frame in self.log.frames(self.position, stop):
+            self.callback(frame)
+            self.replay_time = frame['timestamp']
+        self.position = stop
+
+    def toggle_pause(self):
+        self.paused = not self.paused
+        self.last_tick = None
+
+    def finished(self):
+        return self.position >= len(self.log)
+
+    def tick(self):
+        now = time.perf_counter()
+        if self.paused or self.finished():
+            self.last_tick = now
+            return
+        if self.last_tick is not None:
+            self.replay_time += (now - self.last_tick)*self.speed
+        self.last_tick = now
+        stop = self.log.index_at(self.replay_time + 1e-9)
+        start = max(self.position, stop - MAX_FRAMES_PER_TICK)
+        for frame in self.log.frames(start, stop):
+            self.callback(frame)
+        self.position = max(self.position, stop)
+
+    def progress(self):
+        span = self.log.end_time - self.log.start_time
+        return (self.replay_time - self.log.start_time)/span if span > 0 else 1.0
+
+# ===========================================================
+# ---- 3D Replay (matplotlib) ----
+# ===========================================================
+def replay_gui(paths, speed=1.0, arm_length=0.3):
+    import gui
+    log = Flight_Log(paths)
+    # Every vehicle reports within the first frames of a log
+    vehicles = np.unique(log.segments[0]['vehicle'][:1000])
+    quads = {v.decode(): {'position': [0, 0, 0], 'orientation': [0, 0, 0], 'L': arm_length} for v in vehicles}
+    gui_object = gui.GUI(quads=quads)
+
+    def show(frame):
+        if frame['id'] in quads:
+            quads[frame['id']]['position'] = frame['position']
+            quads[frame['id']]['orientation'] = frame['orientation']
+
+    player = Replay_Player(log, show, speed=speed)
+    while not player.finished():
+        player.tick()
+        gui_object.update()
+        time.sleep(0.02)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a recorded flight in the 3D view (use main.py --replay for the GCS)")
+    parser.add_argument("logs", nargs="+", help="Flight log (.qfl) files, a rotated series is replayed in order")
+    parser.add_argument("--speed", type=float, default=1.0)
+    args = parser.parse_args()
+    replay_gui(args.logs, speed=args.speed)
@@ -0,0 +1,78 @@
+import time
+import datetime
+import threading
+import loop_timing
+
+class Lockstep_Scheduler():
+    # Advances physics, controllers and any other periodic task from one simulated clock.
+    # In real-time mode the loop sleeps until the wall-clock deadline of the next tick
+    # (time_scaling seconds of wall time per simulated second, so 1.0 is real time and
+    # smaller is faster); time_scaling=0 free-runs as fast as the processor allows.
+    # Tasks that are due on the same tick run in the order they were added.
+    # Every task has a loop_timing.Loop_Timer (target period in wall time, none when free
+    # running), and 'timer' records the loop itself: how late it woke for each tick.
+    def __init__(self,time_scaling=1.0,start_time=None):
+        self.time_scaling = time_scaling
+        self.start_time = start_time if start_time is not None else datetime.datetime.now()
+        self.sim_time = 0.0
+        self.tasks = []
+        self.thread_object = None
+        self.run = True
+        self.timer = loop_timing.Loop_Timer('scheduler')
+
+    def add_task(self,callback,period,name=None):
+        # Tick counts are kept as integers so long runs don't accumulate floating point drift
+        name = name or callback.__name__
+        timer = loop_timing.Loop_Timer(name,period*self.time_scaling if self.time_scaling > 0 else None)
+        self.tasks.append({'callback':callback,'period':period,'ticks':0,'next':0.0,'name':name,'timer':timer})
+        if self.timer.period is None or (timer.period is not None and timer.period < self.timer.period):
+            self.timer.period = timer.period
+
+    def get_time(self):
+        return self.start_time + datetime.timedelta(seconds=self.sim_time)
+
+    def get_sim_time(self):
+        return self.sim_time
+
+    def next_tick(self):
+        return min(task['next'] for task in self.tasks)
+
+    def step(self):
+        now = self.next_tick()
+        self.sim_time = now
+        for task in self.tasks:
+            if task['next'] <= now + 1e-9:
+                timer = task['timer']
+                start = timer.start()
+                task['callback']()
+                timer.stop(start)
+                task['ticks'] += 1
+                task['next'] = task['ticks']*task['period']
+
+    def run_until(self,sim_time):
+        # Free-running advance, used for headless and batch simulations
+        while self.run and self.next_tick() <= sim_time:
+            self.step()
+
+    def thread_run(self):
+        wall_start = time.perf_counter()
+        while self.run:
+            if self.time_scaling > 0:
+                deadline = wall_start + self.next_tick()*self.time_scaling
+                delay = deadline - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                self.timer.woke(time.perf_counter() - deadline)
+            start = self.timer.start()
+            self.step()
+            self.timer.stop(start)
+
+    def start_thread(self):
+        self.thread_object = threading.Thread(target=self.thread_run,daemon=True)
+        self.thread_object.start()
+
+    def timers(self):
+        return [self.timer] + [task['timer'] for task in self.tasks]
+
+    def stop_thread(self):
+        self.run = False
@@ -0,0 +1,142 @@
+import multiprocessing
+import signal
+import threading
+from multiprocessing import shared_memory
+import numpy as np
+
+# ===========================================================
+# ---- Sharded Fleet ----
+# ===========================================================
+# The fleet split across worker processes, each flying a contiguous block of vehicles (its
+# shard) on its own simulated clock. Every SYNC period of simulated time all shards write their
+# rows of the published state into one shared memory block and meet at a barrier with the
+# aggregator (the parent process), so every frame the aggregator reads holds all vehicles at
+# the same simulated time. Frames are double buffered by tick parity: shards write frame k+1
+# into the other buffer while the aggregator reads frame k, and can't come back to frame k's
+# buffer before the aggregator has joined the next barrier, so neither side ever waits on a
+# lock. Commands go to a shard through a queue that it drains right after a barrier, and
+# replies come back the same way; queued before the same barrier, a command takes effect on
+# the same tick in every shard.
+
+BARRIER_TIMEOUT = 30.0  # s, a shard that doesn't reach the barrier in this time is taken as dead
+# (field, columns) of one vehicle's row in a frame; 0 columns is a 1-D field
+FIELDS = [('state', 12), ('battery', 0), ('voltage', 0), ('current', 0), ('energy', 0), ('mode', 0), ('waypoint_index', 0)]
+ROW_SIZE = sum(max(1, columns) for field, columns in FIELDS)
+
+
+class Shared_Frames():
+    # Two frames of 'count' vehicles in one shared memory block: a sim time and one float64 row
+    # per vehicle, viewed as the FIELDS arrays. Created by the aggregator, attached by name in the shards.
+    def __init__(self, count, name=None):
+        self.count = count
+        self.owner = name is None
+        self.memory = shared_memory.SharedMemory(name=name, create=self.owner, size=2*(1 + count*ROW_SIZE)*8)
+        self.name = self.memory.name
+        block = np.ndarray((2, 1 + count*ROW_SIZE), dtype=float, buffer=self.memory.buf)
+        if self.owner:
+            block[:] = 0.0
+        self.frames = []
+        for buffer in block:
+            rows = buffer[1:].reshape(count, ROW_SIZE)
+            frame = {'sim_time': buffer[0:1]}
+            offset = 0
+            for field, columns in FIELDS:
+                frame[field] = rows[:, offset:offset + columns] if columns else rows[:, offset]
+                offset += max(1, columns)
+            self.frames.append(frame)
+
+    def close(self):
+        # The views must go before the mapping can be closed
+        self.frames = []
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+class Reply_Queue():
+    # Stands in for the UDP transport inside a shard: datagrams it is asked to send are passed
+    # to the aggregator, which sends them.
+    def __init__(self, replies):
+        self.replies = replies
+
+    def send_json(self, msg, addr):
+        self.replies.put(('send', msg, addr))
+
+
+class Shard_Pool():
+    # Aggregator side. target(index, keys, row, count, frames name, barrier, commands, replies,
+    # stop, *args) runs in each worker process and must follow the protocol above, see
+    # udp_quad.shard_worker.
+    def __init__(self, keys, shards, target, args=()):
+        context = multiprocessing.get_context('spawn')
+        self.keys = list(keys)
+        shards = max(1, min(shards, len(self.keys)))
+        bounds = np.linspace(0, len(self.keys), shards + 1).astype(int)
+        self.shards = [self.keys[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+        self.owner = {key: i for i, shard in enumerate(self.shards) for key in shard}
+        self.frames = Shared_Frames(len(self.keys))
+        self.barrier = context.Barrier(shards + 1)
+        self.stop_event = context.Event()
+        self.commands = [context.SimpleQueue() for shard in self.shards]
+        self.replies = context.SimpleQueue()
+        self.processes = [context.Process(target=target, daemon=True, name=f'shard-{i}',
+                                          args=(i, shard, int(bounds[i]), len(self.keys), self.frames.name, self.barrier,
+                                                self.commands[i], self.replies, self.stop_event) + tuple(args))
+                          for i, shard in enumerate(self.shards)]
+        self.tick = 0
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+
+    def send(self, shard, item):
+        self.commands[shard].put(item)
+
+    def sync(self, timeout=BARRIER_TIMEOUT):
+        """Wait for every shard to publish the next frame and return it. The frame's arrays are
+        only valid until the next sync(); threading.BrokenBarrierError if a shard died."""
+        self.barrier.wait(timeout)
+        frame = self.frames.frames[self.tick % 2]
+        self.tick += 1
+        return frame
+
+    def drain(self):
+        """Replies the shards sent since the last call."""
+        items = []
+        while not self.replies.empty():
+            items.append(self.replies.get())
+        return items
+
+    def abort(self):
+        """Make every shard exit at its next barrier."""
+        self.stop_event.set()
+        self.barrier.abort()
+
+    def stop(self, timeout=5.0):
+        """Stop the shards and free the shared memory; no frame from sync() may still be in use."""
+        self.abort()
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self.frames.close()
+
+
+def shard_loop(clock, frames, publish, barrier, commands, stop, execute, period):
+    """Worker side: advance clock by 'period' per frame, publish(frame) each frame, meet the
+    others at the barrier, then execute(item) for every queued command."""
+    # Ctrl+C reaches the whole process group; the aggregator stops the shards
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    tick = 0
+    try:
+        while True:
+            clock.run_until(tick*period)
+            publish(frames.frames[tick % 2])
+            barrier.wait(BARRIER_TIMEOUT)
+            if stop.is_set():
+                return
+            while not commands.empty():
+                execute(commands.get())
+            tick += 1
+    except threading.BrokenBarrierError:
+        return
@@ -0,0 +1,150 @@
+import mmap
+import os
+import socket
+import struct
+import tempfile
+import threading
+
+# ===========================================================
+# ---- Shared Memory Telemetry Ring ----
+# ===========================================================
+# Telemetry frames (the same bytes as the datagrams, see telemetry.py) written by the simulator
+# into a ring buffer in a memory-mapped file, for receivers on the same host. Writing or reading
+# a frame is a copy in memory, with no system call per frame.
+#
+# Header (64 bytes): magic '4s', version 'I', slot count 'I', slot size 'I', token '16s' (random
+# per ring, a receiver proves it sees this ring by echoing it), head 'Q' (frames written so far).
+# Slot i % slots holds frame i (numbered from 1): stamp 'Q', length 'I', 4 pad bytes, then the
+# frame. The writer zeroes the stamp, copies the frame, sets the stamp to i and then advances
+# the head. A reader copies a frame out and checks its stamp before and after, so a frame the
+# writer overwrote while it was being read (the reader fell more than a ring behind) is counted
+# as dropped, never returned torn. Any number of readers can follow one ring; the writer's
+# threads (telemetry_sender and stream_sender) take turns under its lock.
+
+MAGIC = b'QTRB'
+VERSION = 1
+RING_SLOTS = 4096
+SLOT_SIZE = 1472  # Largest UDP payload, so any telemetry datagram fits in a slot
+HEADER = struct.Struct('<4sIII16sQ')
+HEAD_OFFSET = HEADER.size - 8
+HEADER_SIZE = 64
+STAMP = struct.Struct('<Q')
+SLOT = struct.Struct('<QI4x')
+
+
+def ring_path(port):
+    """Where the ring for telemetry sent to 'port' lives; /dev/shm keeps it in memory on Linux."""
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(directory, f'quad_telemetry_{port}.ring')
+
+
+def is_local_address(host):
+    """True if host is an address of this machine (a socket can be bound to it)."""
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.bind((host, 0))
+        return True
+    except OSError:
+        return False
+
+
+class Ring_Writer():
+    def __init__(self, path, slots=RING_SLOTS, slot_size=SLOT_SIZE):
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        self.stride = SLOT.size + slot_size
+        self.token = os.urandom(8).hex()
+        self.head = 0
+        self.lock = threading.Lock()
+        # A new file each time, so readers of a previous ring never see this one's frames
+        if os.path.exists(path):
+            os.unlink(path)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            os.ftruncate(fd, HEADER_SIZE + slots*self.stride)
+            self.memory = mmap.mmap(fd, 0)
+        finally:
+            os.close(fd)
+        HEADER.pack_into(self.memory, 0, MAGIC, VERSION, slots, slot_size, self.token.encode(), 0)
+
+    def write(self, data):
+        size = len(data)
+        if size > self.slot_size:
+            raise ValueError(f'Frame of {size} bytes does not fit a {self.slot_size} byte ring slot')
+        with self.lock:
+            index = self.head + 1
+            offset = HEADER_SIZE + (index % self.slots)*self.stride
+            STAMP.pack_into(self.memory, offset, 0)
+            self.memory[offset + SLOT.size:offset + SLOT.size + size] = data
+            SLOT.pack_into(self.memory, offset, index, size)
+            STAMP.pack_into(self.memory, HEAD_OFFSET, index)
+            self.head = index
+
+    def unlink(self):
+        """Remove the ring file; readers still mapping it just see no new frames."""
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class Ring_Reader():
+    # Follows a ring from its head at the time it was opened
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.memory = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.slots, self.slot_size, token, head = HEADER.unpack_from(self.memory)
+        if magic != MAGIC or version != VERSION:
+            self.memory.close()
+            raise ValueError(f'{path} is not a version {VERSION} telemetry ring')
+        self.stride = SLOT.size + self.slot_size
+        self.token = token.decode()
+        self.cursor = head
+        self.received = 0
+        self.dropped = 0
+
+    def head(self):
+        return STAMP.unpack_from(self.memory, HEAD_OFFSET)[0]
+
+    def frame(self, index):
+        """Frame 'index' as bytes, or None if the writer has overwritten it."""
+        offset = HEADER_SIZE + (index % self.slots)*self.stride
+        stamp, size = SLOT.unpack_from(self.memory, offset)
+        if stamp != index or size > self.slot_size:
+            return None
+        data = self.memory[offset + SLOT.size:offset + SLOT.size + size]
+        if STAMP.unpack_from(self.memory, offset)[0] != index:
+            return None
+        return data
+
+    def read(self):
+        """Every frame written since the last read (or latest), oldest first; frames the writer
+        has already overwritten are counted in 'dropped'."""
+        head = self.head()
+        first = max(self.cursor + 1, head - self.slots + 1)
+        self.dropped += first - self.cursor - 1
+        frames = []
+        for index in range(first, head + 1):
+            data = self.frame(index)
+            if data is None:
+                self.dropped += 1
+            else:
+                frames.append(data)
+        self.cursor = head
+        self.received += len(frames)
+        return frames
+
+    def latest(self):
+        """Only the newest frame (None if nothing new was written), skipping any others."""
+        head = self.head()
+        if head == self.cursor:
+            return None
+        self.cursor = head
+        data = self.frame(head)
+        if data is not None:
+            self.received += 1
+        return data
+
+    def close(self):
+        self.memory.close()
@@ -0,0 +1,93 @@
+import threading
+import time
+import numpy as np
+import flight_modes
+
+# ===========================================================
+# ---- Shared Vehicle State ----
+# ===========================================================
+# The physics thread publishes a complete frame of every vehicle's state after each step;
+# telemetry, the GUI and any other thread read snapshots of it. Frames are double buffered:
+# the writer fills the idle buffer and then makes it current, and readers copy the current
+# one. Each buffer has a lock, which the writer only ever tries to take: if a slow reader is
+# still copying the idle buffer, that publish is skipped (counted in 'skipped') instead of
+# waiting, so the physics thread never blocks and readers never see a half-written frame.
+# A pure seqlock (readers retry) livelocks under the GIL when the writer runs free, because
+# the writer laps the reader on every thread switch. There must be a single writer.
+
+STATE_SIZE = 12
+
+
+class State_Store():
+    def __init__(self, keys):
+        self.keys = list(keys)
+        self.index = {key: i for i, key in enumerate(self.keys)}
+        self.buffers = [self.empty_frame(), self.empty_frame()]
+        self.locks = [threading.Lock(), threading.Lock()]
+        self.current = 0
+        self.published = 0
+        self.skipped = 0
+
+    def empty_frame(self):
+        n = len(self.keys)
+        return {
+            'tick': 0,
+            'sim_time': 0.0,
+            'timestamp': 0.0,
+            'state': np.zeros((n, STATE_SIZE)),
+            'battery': np.zeros(n),
+            'voltage': np.zeros(n),
+            'current': np.zeros(n),
+            'energy': np.zeros(n),
+            'mode': np.zeros(n, dtype=np.uint8),
+            'waypoint_index': np.zeros(n, dtype=np.uint16),
+        }
+
+    def publish(self, sim_time, states, batteries, modes, waypoint_indexes, voltages=0.0, currents=0.0, energies=0.0):
+        """Publish one frame. states is (N,12); modes are flight_modes.MODES names, or an array of their indexes."""
+        i = 1 - self.current
+        if not self.locks[i].acquire(blocking=False):
+            self.skipped += 1
+            return False
+        buffer = self.buffers[i]
+        buffer['tick'] = self.published + 1
+        buffer['sim_time'] = sim_time
+        buffer['timestamp'] = time.time()
+        buffer['state'][:] = states
+        buffer['battery'][:] = batteries
+        buffer['voltage'][:] = voltages
+        buffer['current'][:] = currents
+        buffer['energy'][:] = energies
+        buffer['mode'][:] = modes if isinstance(modes, np.ndarray) else [flight_modes.MODES.index(mode) for mode in modes]
+        buffer['waypoint_index'][:] = waypoint_indexes
+        self.locks[i].release()
+        self.current = i
+        self.published += 1
+        return True
+
+    def snapshot(self):
+        """A consistent copy of the latest frame, or None before the first publish."""
+        if not self.published:
+            return None
+        i = self.current
+        with self.locks[i]:
+            return {name: value.copy() if isinstance(value, np.ndarray) else value for name, value in self.buffers[i].items()}
+
+    def vehicle(self, frame, key):
+        """The state of one vehicle in a snapshot, in the telemetry dictionary layout."""
+        i = self.index[key]
+        state = frame['state'][i]
+        return {
+            'id': key,
+            'sim_time': frame['sim_time'],
+            'position': state[0:3],
+            'velocity': state[3:6],
+            'orientation': state[6:9],
+            'angular_rate': state[9:12],
+            'battery': float(frame['battery'][i]),
+            'voltage': float(frame['voltage'][i]),
+            'current': float(frame['current'][i]),
+            'energy': float(frame['energy'][i]),
+            'mode': flight_modes.MODES[frame['mode'][i]],
+            'waypoint_index': int(frame['waypoint_index'][i]),
+        }
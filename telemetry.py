@@ -0,0 +1,245 @@
+import struct
+import json
+import threading
+import numpy as np
+import flight_modes
+import udp_transport
+
+# ===========================================================
+# ---- Telemetry Wire Format ----
+# ===========================================================
+# Frames are either JSON objects (the original format, still the default so listener.py and
+# older tools keep working) or fixed-layout little-endian binary frames. Every binary frame
+# starts with the 2 byte magic, a schema version and a frame type, so receivers can tell the
+# two formats apart from the first byte and reject versions they don't know.
+#
+# Version 1 state frame (59 bytes):
+#   magic '2s', version 'B', frame type 'B', sequence 'I', sim time 'd',
+#   position '3f', orientation '3f', velocity '3f', battery 'f', mode 'B', waypoint index 'H'
+#
+# Version 1 stream frame (12 byte header + samples):
+#   magic '2s', version 'B', frame type 'B', sequence 'I', stream id 'B', field count 'B',
+#   sample count 'H', then per sample: sim time 'd' followed by one 'f' per stream field
+#
+# Version 2 adds an 8 byte, NUL padded vehicle id '8s' after the sequence number of both
+# frame types (67 byte state frame, 20 byte stream header). Version 1 frames and JSON
+# frames without an 'id' are attributed to DEFAULT_VEHICLE.
+#
+# Version 3 appends battery voltage (V), current (A) and remaining energy (Wh), 'fff', to
+# the state frame (79 bytes). Its stream frame is unchanged from version 2.
+
+MAGIC = b'QT'
+VERSION = 3
+FORMATS = ['json', 'binary']
+
+FRAME_STATE = 1
+FRAME_STREAM = 2
+
+HEADER = struct.Struct('<2sBB')
+SEQ = struct.Struct('<I')
+STATE_FRAMES = {
+    1: struct.Struct('<2sBBIdffffffffffBH'),
+    2: struct.Struct('<2sBBI8sdffffffffffBH'),
+    3: struct.Struct('<2sBBI8sdffffffffffBHfff'),
+}
+STREAM_HEADERS = {
+    1: struct.Struct('<2sBBIBBH'),
+    2: struct.Struct('<2sBBI8sBBH'),
+    3: struct.Struct('<2sBBI8sBBH'),
+}
+STREAM_HEADER = STREAM_HEADERS[VERSION]
+DEFAULT_VEHICLE = 'q1'
+
+# High-rate streams a receiver can subscribe to, and the fields of each sample
+STREAMS = {
+    'attitude': ['theta', 'phi', 'gamma', 'theta_dot', 'phi_dot', 'gamma_dot'],
+    'position': ['x', 'y', 'z', 'x_dot', 'y_dot', 'z_dot'],
+    'motors': ['m1', 'm2', 'm3', 'm4'],
+    'integrators': ['xi', 'yi', 'zi', 'thetai', 'phii', 'gammai'],
+}
+STREAM_NAMES = list(STREAMS)
+JSON_NUMBER = 24  # Longest repr of a float, e.g. -1.2345678901234567e-308
+
+MODE_CODES = {mode: i for i, mode in enumerate(flight_modes.MODES)}
+MODE_UNKNOWN = 255
+
+
+def encode_state(seq, vehicle_id, sim_time, position, orientation, velocity, battery, mode, waypoint_index,
+                 voltage=0.0, current=0.0, energy=0.0):
+    """Pack one vehicle state into a binary frame of the current schema version."""
+    return STATE_FRAMES[VERSION].pack(MAGIC, VERSION, FRAME_STATE, seq & 0xFFFFFFFF, vehicle_id.encode(), sim_time,
+                                      position[0], position[1], position[2],
+                                      orientation[0], orientation[1], orientation[2],
+                                      velocity[0], velocity[1], velocity[2],
+                                      battery, MODE_CODES.get(mode, MODE_UNKNOWN), min(waypoint_index, 0xFFFF),
+                                      voltage, current, energy)
+
+
+def encode_state_json(seq, vehicle_id, sim_time, position, orientation, velocity, battery, mode, waypoint_index,
+                      voltage=0.0, current=0.0, energy=0.0):
+    """Serialize one vehicle state in the original JSON layout (with the extra binary fields)."""
+    return json.dumps({
+        'id': vehicle_id,
+        'position': [float(v) for v in position],
+        'orientation': [float(v) for v in orientation],
+        'velocity': [float(v) for v in velocity],
+        'battery': round(battery, 2),
+        'voltage': round(float(voltage), 3),
+        'current': round(float(current), 3),
+        'energy': round(float(energy), 3),
+        'mode': mode,
+        'waypoint_index': waypoint_index,
+        'seq': seq,
+        'sim_time': sim_time,
+    }).encode()
+
+
+def is_binary(data):
+    return data[:2] == MAGIC
+
+
+def decode_state(buf):
+    """Unpack a binary state frame. buf may be bytes, bytearray or a memoryview; nothing is copied."""
+    magic, version, frame_type = HEADER.unpack_from(buf)
+    if magic != MAGIC or frame_type != FRAME_STATE:
+        raise ValueError('Not a telemetry state frame')
+    if version not in STATE_FRAMES:
+        raise ValueError(f'Unsupported telemetry schema version {version}')
+    v = STATE_FRAMES[version].unpack_from(buf)
+    if version >= 2:
+        vehicle_id, v = v[4].rstrip(b'\0').decode(), v[5:]
+    else:
+        vehicle_id, v = DEFAULT_VEHICLE, v[4:]
+    mode = flight_modes.MODES[v[11]] if v[11] < len(flight_modes.MODES) else 'UNKNOWN'
+    frame = {
+        'id': vehicle_id,
+        'seq': seq_of(buf),
+        'sim_time': v[0],
+        'position': [v[1], v[2], v[3]],
+        'orientation': [v[4], v[5], v[6]],
+        'velocity': [v[7], v[8], v[9]],
+        'battery': v[10],
+        'mode': mode,
+        'waypoint_index': v[12],
+    }
+    if version >= 3:
+        frame['voltage'], frame['current'], frame['energy'] = v[13], v[14], v[15]
+    return frame
+
+
+def seq_of(buf):
+    return SEQ.unpack_from(buf, HEADER.size)[0]
+
+
+def stream_dtype(name):
+    return np.dtype([('sim_time', '<f8'), ('values', '<f4', (len(STREAMS[name]),))])
+
+
+def samples_per_datagram(name):
+    return (udp_transport.MAX_DATAGRAM-STREAM_HEADER.size)//stream_dtype(name).itemsize
+
+
+def json_samples_per_datagram(name):
+    """Samples per JSON stream frame: each number is written out as text, so this is sized for the
+    longest numbers, vehicle id and sequence number rather than from the binary sample size."""
+    header = len(encode_stream_json(2**64, 'x'*udp_transport.MAX_VEHICLE_ID, name, np.zeros(0, dtype=stream_dtype(name))))
+    # '[' and ']' around each sample, ', ' after each of its numbers and between samples
+    sample = 2 + (len(STREAMS[name]) + 1)*(JSON_NUMBER + 2)
+    return max(1, (udp_transport.MAX_DATAGRAM-header)//sample)
+
+
+def encode_stream(seq, vehicle_id, name, samples):
+    """Pack a batch of stream samples (a stream_dtype array) into one binary frame."""
+    header = STREAM_HEADER.pack(MAGIC, VERSION, FRAME_STREAM, seq & 0xFFFFFFFF, vehicle_id.encode(),
+                                STREAM_NAMES.index(name), len(STREAMS[name]), len(samples))
+    return header + samples.tobytes()
+
+
+def encode_stream_json(seq, vehicle_id, name, samples):
+    return json.dumps({
+        'id': vehicle_id,
+        'stream': name,
+        'seq': seq,
+        'fields': STREAMS[name],
+        'samples': [[float(t)] + v.tolist() for t, v in zip(samples['sim_time'], samples['values'])],
+    }).encode()
+
+
+def decode_stream(buf):
+    """Unpack a binary stream frame; the samples are a read-only NumPy view of buf."""
+    version = HEADER.unpack_from(buf)[1]
+    if version not in STREAM_HEADERS:
+        raise ValueError(f'Unsupported telemetry schema version {version}')
+    header = STREAM_HEADERS[version]
+    v = header.unpack_from(buf)
+    if version >= 2:
+        vehicle_id, (stream_id, field_count, count) = v[4].rstrip(b'\0').decode(), v[5:]
+    else:
+        vehicle_id, (stream_id, field_count, count) = DEFAULT_VEHICLE, v[4:]
+    name = STREAM_NAMES[stream_id]
+    samples = np.frombuffer(buf, dtype=stream_dtype(name), count=count, offset=header.size)
+    return {'id': vehicle_id, 'stream': name, 'seq': v[3], 'fields': STREAMS[name], 'samples': samples}
+
+
+def decode(data):
+    """Decode a telemetry datagram in either format into the JSON dictionary layout."""
+    if is_binary(data):
+        if HEADER.unpack_from(data)[2] == FRAME_STREAM:
+            return decode_stream(data)
+        return decode_state(data)
+    return json.loads(bytes(data).decode())
+
+# ===========================================================
+# ---- Stream Sampling ----
+# ===========================================================
+class Stream_Sampler():
+    # Samples subscribed streams on the physics tick with per-stream decimation, and hands
+    # batches of samples to the sender thread. 'sources' maps each stream name to a callable
+    # returning that stream's fields; sample() is cheap when nothing is subscribed.
+    def __init__(self, sources, base_rate, capacity=4096):
+        self.sources = sources
+        self.base_rate = base_rate
+        self.capacity = capacity
+        self.subscriptions = {}
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    def subscribe(self, name, rate):
+        """Sample 'name' at 'rate' Hz (0 unsubscribes). Returns the achievable rate."""
+        if name not in STREAMS or name not in self.sources:
+            raise ValueError(f'Unknown telemetry stream {name}')
+        with self.lock:
+            if rate <= 0:
+                self.subscriptions.pop(name, None)
+                return 0.0
+            decimation = max(1, int(round(self.base_rate/rate)))
+            self.subscriptions[name] = {'decimation': decimation, 'countdown': 0, 'count': 0,
+                                        'buffer': np.zeros(self.capacity, dtype=stream_dtype(name))}
+            return self.base_rate/decimation
+
+    def sample(self, sim_time):
+        if not self.subscriptions:
+            return
+        with self.lock:
+            for name, sub in self.subscriptions.items():
+                sub['countdown'] -= 1
+                if sub['countdown'] > 0:
+                    continue
+                sub['countdown'] = sub['decimation']
+                if sub['count'] == self.capacity:
+                    self.dropped += 1
+                    continue
+                row = sub['buffer'][sub['count']]
+                row['sim_time'] = sim_time
+                row['values'] = self.sources[name]()
+                sub['count'] += 1
+
+    def drain(self):
+        """Return {stream name: samples} gathered since the last drain."""
+        batches = {}
+        with self.lock:
+            for name, sub in self.subscriptions.items():
+                if sub['count']:
+                    batches[name] = sub['buffer'][:sub['count']].copy()
+                    sub['count'] = 0
+        return batches
@@ -0,0 +1,30 @@
+import numpy as np
+import batch
+
+# A mission flown in a group must give the metrics it gives when flown alone
+
+MISSIONS = [
+    {'name': 'complete', 'waypoints': [[1, 1, 2]], 'timeout': 10.0},
+    {'name': 'timeout', 'waypoints': [[2, 2, 2], [0, 0, 2]], 'timeout': 1.5},
+    {'name': 'offset', 'waypoints': [[1, -1, 1], [1.5, -1, 1]], 'initial_state': {'position': [1.0, -1.0, 0.0]},
+     'lookahead': 0.0, 'timeout': 2.5},
+    {'name': 'empty', 'waypoints': [], 'timeout': 1.0},
+]
+
+
+def test_group_matches_missions_flown_alone():
+    grouped = batch.fly_missions(MISSIONS)
+    assert [result['name'] for result in grouped] == [mission['name'] for mission in MISSIONS]
+    assert grouped[0]['completed'] and grouped[0]['flight_time'] < 10.0
+    assert not grouped[1]['completed'] and grouped[1]['flight_time'] == 1.5
+    for mission, result in zip(MISSIONS, grouped):
+        alone = batch.run_mission(mission)
+        for key in ('completed', 'flight_time', 'waypoint_times', 'battery_used', 'motor_saturation', 'final_position'):
+            assert result[key] == alone[key], (mission['name'], key)
+        np.testing.assert_allclose(result['energy'], alone['energy'], rtol=1e-12)
+        np.testing.assert_allclose(result['overshoot'], alone['overshoot'], rtol=1e-9, atol=1e-12)
+
+
+def test_run_missions_keeps_mission_order():
+    results = batch.run_missions(MISSIONS, processes=1, group_size=3)
+    assert [result['name'] for result in results] == [mission['name'] for mission in MISSIONS]
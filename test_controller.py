@@ -0,0 +1,85 @@
+import copy
+import numpy as np
+import controller, quadcopter, udp_quad
+
+# Controller_Bank must compute exactly what the per-vehicle controllers compute. Both are
+# run on the same states every tick of a closed-loop flight, the bank's commands fly the fleet.
+
+DT = udp_quad.CONTROLLER_DYNAMICS_UPDATE
+TICKS = 600  # 3 s of flight
+
+
+def make_fleet(count):
+    quads = {}
+    for i in range(count):
+        quad = copy.deepcopy(udp_quad.QUADCOPTER['q1'])
+        quad['position'] = [i, 0.0, 1.0]
+        quads[f'q{i+1}'] = quad
+    return quadcopter.Quadcopter_Fleet(quads)
+
+
+def vehicle_params(i, i_limit=None):
+    """The default gains, scaled differently per vehicle, optionally with integrator limits."""
+    params = copy.deepcopy(udp_quad.CONTROLLER_PARAMETERS)
+    params['Linear_PID']['P'] = [p*(1 + 0.1*i) for p in params['Linear_PID']['P']]
+    params['Angular_PID']['I'] = [0.5*i, 0.5*i, 1.2]
+    if i_limit is not None:
+        params['Linear_PID']['I_limit'] = i_limit
+        params['Angular_PID']['I_limit'] = i_limit
+    return params
+
+
+def fly(params, velocity, targets, yaw_targets, ticks=TICKS):
+    """Fly the fleet with the bank, checking every scalar controller against it each tick.
+    Returns the bank and the scalar controllers at the end."""
+    fleet = make_fleet(len(params))
+    keys = fleet.keys
+    commands = {}
+    bank = controller.Controller_Bank(lambda: fleet.states, lambda M: commands.__setitem__('bank', M.copy()),
+                                      params, keys, velocity=velocity)
+    scalars = {}
+    for key in keys:
+        kind = controller.Controller_PID_Velocity if velocity[key] else controller.Controller_PID_Point2Point
+        scalars[key] = kind(fleet.get_state, fleet.get_time, lambda key, M: commands.__setitem__(key, np.array(M)),
+                            params[key], key)
+    for key in keys:
+        bank.update_target(key, targets[key])
+        bank.update_yaw_target(key, yaw_targets[key])
+        scalars[key].update_target(targets[key])
+        scalars[key].update_yaw_target(yaw_targets[key])
+    for tick in range(ticks):
+        bank.update()
+        for key in keys:
+            scalars[key].update()
+        np.testing.assert_array_equal(commands['bank'], np.array([commands[key] for key in keys]), err_msg=f'tick {tick}')
+        fleet.set_all_motor_speeds(commands['bank'])
+        fleet.update(DT)
+    for key in keys:
+        np.testing.assert_array_equal(bank.get_integrator_terms(key), scalars[key].get_integrator_terms())
+    return bank, scalars
+
+
+def test_bank_matches_scalar_controllers():
+    keys = ['q1', 'q2', 'q3', 'q4']
+    params = {key: vehicle_params(i) for i, key in enumerate(keys)}
+    velocity = {'q1': False, 'q2': False, 'q3': True, 'q4': True}
+    targets = {'q1': (1.0, 1.0, 2.0), 'q2': (2.0, -1.0, 3.0), 'q3': (0.5, 0.0, 2.0), 'q4': (0.0, -0.5, 1.5)}
+    yaw_targets = {'q1': 0.0, 'q2': 1.0, 'q3': -2.0, 'q4': 3.5}
+    bank, scalars = fly(params, velocity, targets, yaw_targets)
+    # The flight went somewhere: the vehicles climbed towards their targets
+    assert all(scalars[key].get_state(key)[2] > 1.2 for key in keys)
+
+
+def test_integrator_limit_clamps_integrators():
+    keys = ['q1', 'q2']
+    limit = 50.0
+    # q1 is limited, q2 isn't; both fly far from a target that keeps the integrators growing
+    params = {'q1': vehicle_params(3, i_limit=limit), 'q2': vehicle_params(3)}
+    velocity = {key: False for key in keys}
+    targets = {key: (20.0, -20.0, 8.0) for key in keys}
+    yaw_targets = {key: 0.0 for key in keys}
+    bank, scalars = fly(params, velocity, targets, yaw_targets, ticks=300)
+    limited = np.abs(bank.get_integrator_terms('q1'))
+    assert np.all(limited <= limit)
+    assert np.any(limited == limit)
+    assert np.any(np.abs(bank.get_integrator_terms('q2')) > limit)
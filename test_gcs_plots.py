@@ -0,0 +1,11 @@
+import numpy as np
+import gcs_plots
+
+
+def test_ring_buffer_keeps_newest_samples_in_order():
+    ring = gcs_plots.Ring_Buffer(4, 2)
+    assert ring.values().shape == (0, 2)
+    for i in range(6):
+        ring.append((i, -i))
+    np.testing.assert_array_equal(ring.values()[:, 0], [2, 3, 4, 5])
+    np.testing.assert_array_equal(ring.last(), [5, -5])
@@ -0,0 +1,19 @@
+import json
+import loop_timing, udp_transport
+
+
+def test_report_parts_fit_a_datagram():
+    monitor = loop_timing.Loop_Monitor(gil_probe=False)
+    for i in range(20):
+        timer = monitor.timer(f'loop_{i}', 0.01)
+        for _ in range(50):
+            timer.stop(timer.start())
+            timer.woke(0.001*i)
+    parts = monitor.report_parts(udp_transport.MAX_DATAGRAM)
+    assert len(parts) > 1
+    assert all(len(json.dumps({'diagnostics': part})) <= udp_transport.MAX_DATAGRAM for part in parts)
+    # Every loop is in exactly one part, with its summary but not the histogram counts
+    loops = [name for part in parts for name in part['loops']]
+    assert sorted(loops) == sorted(monitor.timers)
+    assert all('counts' not in part['loops'][name]['wake'] for part in parts for name in part['loops'])
+    assert 'counts' in monitor.report()['loops']['loop_0']['wake']
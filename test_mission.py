@@ -0,0 +1,47 @@
+import json
+import numpy as np
+import pytest
+import mission, udp_transport
+
+
+def test_chunks_fit_a_datagram():
+    worst = -(mission.MAX_COORDINATE - 10.0**-mission.COORDINATE_DECIMALS)
+    waypoints = np.random.default_rng(0).uniform(-mission.MAX_COORDINATE, mission.MAX_COORDINATE, (500, 3))
+    waypoints[:mission.CHUNK_WAYPOINTS] = worst
+    upload = mission.Mission_Upload(2**62, waypoints)
+    for index in range(upload.chunks):
+        message = dict(upload.chunk_message(index), vehicle='x'*udp_transport.MAX_VEHICLE_ID)
+        assert len(json.dumps(message)) <= udp_transport.MAX_DATAGRAM
+
+
+def test_upload_reassembles_with_crc():
+    waypoints = np.random.default_rng(1).uniform(-100, 100, (100, 3))
+    upload = mission.Mission_Upload(7, waypoints)
+    start = upload.start_message()['mission_start']
+    assembly = mission.Mission_Assembly(start['id'], start['count'], start['chunks'], start['crc'], start['chunk_size'])
+    for index in reversed(range(upload.chunks)):
+        # Through JSON, as on the wire
+        assembly.add_chunk(index, json.loads(json.dumps(upload.chunk_message(index)))['mission_chunk']['waypoints'])
+    np.testing.assert_allclose(assembly.finish(), waypoints, atol=10.0**-mission.COORDINATE_DECIMALS)
+
+
+@pytest.mark.parametrize('count, chunks, chunk_size', [
+    (10, 1, 0), (10, 1, -5), (10, 1, 2.5), (-1, 1, 10), ('10', 1, 10), (10.0, 1, 10), (True, 1, 10),
+    (mission.MAX_WAYPOINTS + 1, 1, mission.MAX_WAYPOINTS + 1), (10, 3, 10),
+])
+def test_assembly_rejects_bad_start(count, chunks, chunk_size):
+    with pytest.raises(ValueError):
+        mission.Mission_Assembly(1, count, chunks, 0, chunk_size)
+
+
+@pytest.mark.parametrize('waypoints', [[[1, 2], [3, 4], [5, 6]], [1, 2, 3], [[1, 2, 3], [4, 5]], [[1, 2, 3, 4]], 'abc'])
+def test_waypoints_must_be_xyz(waypoints):
+    with pytest.raises(ValueError):
+        mission.as_waypoints(waypoints)
+    with pytest.raises(ValueError):
+        mission.Mission_Upload(1, waypoints)
+
+
+def test_waypoints_accepts_xyz_and_empty():
+    assert mission.as_waypoints([[1, 2, 3], [4, 5, 6]]).shape == (2, 3)
+    assert mission.as_waypoints([]).shape == (0, 3)
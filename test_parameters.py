@@ -0,0 +1,43 @@
+import copy
+import pytest
+import parameters, udp_quad
+
+
+def make_table():
+    params = copy.deepcopy(udp_quad.CONTROLLER_PARAMETERS)
+    table = parameters.Parameter_Table()
+    table.add_controller(params)
+    return table, params
+
+
+def test_motor_limits_must_stay_ordered():
+    table, params = make_table()
+    low, high = params['Motor_limits']
+    with pytest.raises(ValueError):
+        table.request('MOT_MIN', high + 1)
+    with pytest.raises(ValueError):
+        table.request('MOT_MAX', low - 1)
+    accepted, errors = table.request_all({'MOT_MIN': 500, 'MOT_MAX': 400, 'LIN_P_X': 1.0})
+    assert set(errors) == {'MOT_MIN', 'MOT_MAX'} and accepted == {'LIN_P_X': 1.0}
+    table.apply_pending()
+    assert params['Motor_limits'] == [low, high]
+
+
+def test_motor_limits_move_together():
+    table, params = make_table()
+    high = params['Motor_limits'][1]
+    # Raising both past the old maximum only works as one request
+    accepted, errors = table.request_all({'MOT_MIN': high + 100, 'MOT_MAX': high + 200})
+    assert not errors
+    # Checked against the queued values, not the ones still in use
+    with pytest.raises(ValueError):
+        table.request('MOT_MAX', high + 50)
+    table.apply_pending()
+    assert params['Motor_limits'] == [high + 100, high + 200]
+
+
+def test_unknown_and_out_of_range_sets_are_rejected():
+    table, params = make_table()
+    accepted, errors = table.request_all({'NOPE': 1, 'MOT_MAX': 30000, 'TILT_MAX': 10})
+    assert isinstance(errors['NOPE'], KeyError) and isinstance(errors['MOT_MAX'], ValueError)
+    assert accepted == {'TILT_MAX': 10.0}
@@ -0,0 +1,35 @@
+import threading
+import shm_telemetry
+
+
+def test_reader_counts_overwritten_frames(tmp_path):
+    writer = shm_telemetry.Ring_Writer(str(tmp_path/'test.ring'), slots=8)
+    reader = shm_telemetry.Ring_Reader(writer.path)
+    for i in range(5):
+        writer.write(b'%d' % i)
+    assert reader.read() == [b'0', b'1', b'2', b'3', b'4']
+    for i in range(5, 20):
+        writer.write(b'%d' % i)
+    assert reader.read() == [b'%d' % i for i in range(12, 20)]
+    assert reader.dropped == 7
+    assert reader.latest() is None
+
+
+def test_writer_threads_never_share_a_slot(tmp_path):
+    writer = shm_telemetry.Ring_Writer(str(tmp_path/'test.ring'), slots=100000)
+    reader = shm_telemetry.Ring_Reader(writer.path)
+
+    def write(tag):
+        for i in range(20000):
+            writer.write(tag*(1 + i % 50))
+    threads = [threading.Thread(target=write, args=(tag,)) for tag in (b'a', b'b', b'c')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    frames = reader.read()
+    assert len(frames) == 60000 and reader.dropped == 0
+    # Every frame is one writer's, whole, and each writer's frames are all there in order
+    assert all(len(set(frame)) == 1 for frame in frames)
+    for tag in (b'a', b'b', b'c'):
+        assert [len(frame) for frame in frames if frame[:1] == tag] == [1 + i % 50 for i in range(20000)]
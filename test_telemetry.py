@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+import telemetry, udp_transport
+
+
+@pytest.mark.parametrize('name', telemetry.STREAM_NAMES)
+def test_stream_frames_fit_a_datagram(name):
+    # float32 values whose float repr is as long as it gets, and a long sim time
+    samples = np.zeros(telemetry.json_samples_per_datagram(name), dtype=telemetry.stream_dtype(name))
+    samples['sim_time'] = -1.2345678901234567e-300
+    samples['values'] = np.float32(-1.1754944e-38)
+    frame = telemetry.encode_stream_json(2**64, 'x'*udp_transport.MAX_VEHICLE_ID, name, samples)
+    assert len(frame) <= udp_transport.MAX_DATAGRAM
+    samples = np.zeros(telemetry.samples_per_datagram(name), dtype=telemetry.stream_dtype(name))
+    assert len(telemetry.encode_stream(2**32 - 1, 'x'*udp_transport.MAX_VEHICLE_ID, name, samples)) <= udp_transport.MAX_DATAGRAM
+
+
+def test_json_stream_round_trip():
+    samples = np.zeros(3, dtype=telemetry.stream_dtype('motors'))
+    samples['sim_time'] = [0.1, 0.2, 0.3]
+    samples['values'] = np.arange(12).reshape(3, 4)
+    frame = telemetry.decode(telemetry.encode_stream_json(5, 'q2', 'motors', samples))
+    assert frame['id'] == 'q2' and frame['stream'] == 'motors' and frame['seq'] == 5
+    assert frame['samples'] == [[0.1, 0.0, 1.0, 2.0, 3.0], [0.2, 4.0, 5.0, 6.0, 7.0], [0.3, 8.0, 9.0, 10.0, 11.0]]
@@ -0,0 +1,28 @@
+import pytest
+import mission, udp_quad
+
+
+@pytest.mark.parametrize('msg', [
+    {'mode': 5}, {'subscribe': ['attitude']}, {'param_set': [1]}, {'pid': 'P'}, {'geofence': {}},
+    {'mission_end': [1]}, {'mission_start': 3}, {'mission_chunk': None},
+])
+def test_commands_with_mistyped_fields_are_rejected(msg):
+    # Rejected before anything runs, so no simulator state is needed
+    errors = udp_quad.execute_command(dict(msg, cmd_seq=1), {})
+    assert errors == [f"'{next(iter(msg))}' must be {udp_quad.TYPE_NAMES[udp_quad.COMMAND_TYPES[next(iter(msg))]]}"]
+
+
+def test_mission_end_with_unknown_mode_is_rejected():
+    upload = mission.Mission_Upload(42, [[1, 1, 2], [0, 0, 2]])
+    assert udp_quad.handle_mission(upload.start_message(), [], {}) is None
+    assert udp_quad.handle_mission(upload.chunk_message(0), [], {}) is None
+    errors = []
+    end = upload.end_message()
+    end['mission_end']['mode'] = 'FLY'
+    assert udp_quad.handle_mission(end, errors, {}) is None
+    assert errors == ['Unknown mode FLY']
+    # The upload is kept, so the mission_end can be sent again with a mode that exists
+    end['mission_end']['mode'] = 'guided'
+    errors = []
+    waypoints = udp_quad.handle_mission(end, errors, {})
+    assert not errors and waypoints.shape == (2, 3)
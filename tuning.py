@@ -0,0 +1,218 @@
+import quadcopter, controller, scheduler, udp_quad
+import argparse, copy, itertools, json, multiprocessing, os, socket, time
+import numpy as np
+
+# ===========================================================
+# ---- PID Gain Auto-Tuning ----
+# ===========================================================
+# Every tunable gain is an entry (name, path, low, high). The path indexes into
+# CONTROLLER_PARAMETERS, e.g. ('Linear_PID', 'P', [0, 1]) sets the X and Y linear P gains
+# together. Candidates are scored by short closed-loop step-response simulations flown
+# headless in worker processes; lower cost is better.
+
+SEARCH_SPACE = [
+    ('linear_p_xy', ('Linear_PID', 'P', [0, 1]), 100, 900),
+    ('linear_d_xy', ('Linear_PID', 'D', [0, 1]), 150, 1350),
+    ('linear_p_z', ('Linear_PID', 'P', [2]), 2000, 20000),
+    ('linear_d_z', ('Linear_PID', 'D', [2]), 1500, 15000),
+    ('angular_p_xy', ('Angular_PID', 'P', [0, 1]), 7000, 66000),
+    ('angular_d_xy', ('Angular_PID', 'D', [0, 1]), 4000, 36000),
+    ('yaw_rate_scaler', ('Yaw_Rate_Scaler',), 0.05, 0.5),
+]
+
+STEP_START = [0, 0, 1]
+STEP_TARGET = [1, 1, 2]
+STEP_DURATION = 10.0
+SETTLING_BAND = 0.1
+OVERSHOOT_WEIGHT = 10.0
+SATURATION_WEIGHT = 2.0
+
+
+def apply_gains(params, gains, space=SEARCH_SPACE):
+    """Return a copy of the controller parameters with the named gains applied."""
+    params = copy.deepcopy(params)
+    for name, path, low, high in space:
+        if name not in gains:
+            continue
+        if len(path) == 1:
+            params[path[0]] = gains[name]
+        else:
+            for axis in path[2]:
+                params[path[0]][path[1]][axis] = gains[name]
+    return params
+
+
+def step_response(gains, base_params=None, start=STEP_START, target=STEP_TARGET, duration=STEP_DURATION):
+    """Fly one closed-loop step response and score its settling time, overshoot and motor saturation."""
+    params = apply_gains(base_params or udp_quad.CONTROLLER_PARAMETERS, gains)
+    quad_params = copy.deepcopy(udp_quad.QUADCOPTER['q1'])
+    quad_params['position'] = list(start)
+    quad = quadcopter.Quadcopter_Fleet({'q1': quad_params})
+    ctrl = controller.Controller_PID_Point2Point(quad.get_state, quad.get_time, quad.set_motor_speeds,
+                                                 params=params, quad_identifier='q1')
+    ctrl.update_target(tuple(target))
+    sim_clock = scheduler.Lockstep_Scheduler(time_scaling=0)
+    start, target = np.array(start, dtype=float), np.array(target, dtype=float)
+    direction = (target-start)/np.linalg.norm(target-start)
+    result = {'settled_at': 0.0, 'overshoot': 0.0, 'saturated': 0, 'ticks': 0, 'diverged': False}
+
+    def control_tick():
+        ctrl.update()
+        pos = quad.get_position('q1')
+        speeds = quad.propulsion.commands[0]
+        result['ticks'] += 1
+        if np.any(speeds <= ctrl.MOTOR_LIMITS[0]) or np.any(speeds >= ctrl.MOTOR_LIMITS[1]):
+            result['saturated'] += 1
+        result['overshoot'] = max(result['overshoot'], np.dot(pos-target, direction))
+        if np.linalg.norm(pos-target) > SETTLING_BAND:
+            result['settled_at'] = None
+        elif result['settled_at'] is None:
+            result['settled_at'] = sim_clock.get_sim_time()
+        if not np.all(np.isfinite(pos)) or np.linalg.norm(pos-target) > 100:
+            result['diverged'] = True
+            sim_clock.stop_thread()
+
+    sim_clock.add_task(control_tick, udp_quad.CONTROLLER_DYNAMICS_UPDATE, name='controller')
+    sim_clock.add_task(lambda: quad.update(udp_quad.QUAD_DYNAMICS_UPDATE), udp_quad.QUAD_DYNAMICS_UPDATE, name='physics')
+    sim_clock.run_until(duration)
+
+    settling_time = duration if result['settled_at'] is None or result['diverged'] else result['settled_at']
+    saturation = result['saturated']/max(1, result['ticks'])
+    cost = settling_time + OVERSHOOT_WEIGHT*result['overshoot'] + SATURATION_WEIGHT*saturation
+    if result['diverged']:
+        cost += 10*duration
+    elif result['settled_at'] is None:
+        # Still rank candidates that did not settle by how close they finished
+        cost += float(np.linalg.norm(quad.get_position('q1')-target))
+    return {'gains': gains, 'cost': float(cost), 'settling_time': settling_time,
+            'overshoot': float(result['overshoot']), 'saturation': saturation, 'diverged': result['diverged']}
+
+# ===========================================================
+# ---- Search Strategies ----
+# ===========================================================
+# Candidates are generated in the unit cube and mapped log-uniformly onto [low, high].
+
+def to_gains(unit, space=SEARCH_SPACE):
+    unit = np.clip(unit, 0, 1)
+    return {name: float(low*(high/low)**u) for (name, path, low, high), u in zip(space, unit)}
+
+
+class Tuner():
+    def __init__(self, space=SEARCH_SPACE, base_params=None, processes=None):
+        self.space = space
+        self.base_params = base_params
+        self.processes = processes or os.cpu_count()
+        self.results = []
+        self.simulations = 0
+        self.elapsed = 0.0
+
+    def evaluate(self, pool, units):
+        start = time.perf_counter()
+        candidates = [to_gains(unit, self.space) for unit in units]
+        results = pool.starmap(step_response, [(gains, self.base_params) for gains in candidates], chunksize=1)
+        self.elapsed += time.perf_counter()-start
+        self.simulations += len(results)
+        self.results.extend(results)
+        return results
+
+    def grid(self, pool, levels=3):
+        axis = np.linspace(0, 1, levels)
+        return self.evaluate(pool, [np.array(unit) for unit in itertools.product(axis, repeat=len(self.space))])
+
+    def random(self, pool, samples=64, seed=None):
+        rng = np.random.default_rng(seed)
+        return self.evaluate(pool, list(rng.random((samples, len(self.space)))))
+
+    def cma(self, pool, generations=10, population=None, sigma=0.3, seed=None):
+        # Simplified CMA-ES: weighted recombination, rank-mu covariance update and
+        # cumulative step-size adaptation, all in the unit cube
+        rng = np.random.default_rng(seed)
+        n = len(self.space)
+        lam = population or 4+int(3*np.log(n))
+        mu = lam//2
+        weights = np.log(mu+0.5)-np.log(np.arange(1, mu+1))
+        weights /= weights.sum()
+        mu_eff = 1/np.sum(weights**2)
+        c_sigma = (mu_eff+2)/(n+mu_eff+5)
+        d_sigma = 1+c_sigma+2*max(0, np.sqrt((mu_eff-1)/(n+1))-1)
+        c_mu = min(1.0, mu_eff/n**2)
+        chi_n = np.sqrt(n)*(1-1/(4*n)+1/(21*n**2))
+        mean = np.full(n, 0.5)
+        cov = np.eye(n)
+        path = np.zeros(n)
+        for generation in range(generations):
+            eigvals, eigvecs = np.linalg.eigh(cov)
+            sqrt_cov = eigvecs @ np.diag(np.sqrt(np.maximum(eigvals, 1e-12))) @ eigvecs.T
+            inv_sqrt_cov = eigvecs @ np.diag(1/np.sqrt(np.maximum(eigvals, 1e-12))) @ eigvecs.T
+            steps = rng.standard_normal((lam, n)) @ sqrt_cov.T
+            units = np.clip(mean+sigma*steps, 0, 1)
+            results = self.evaluate(pool, list(units))
+            order = np.argsort([r['cost'] for r in results])[:mu]
+            selected = (units[order]-mean)/sigma
+            mean = mean+sigma*(weights @ selected)
+            path = (1-c_sigma)*path+np.sqrt(c_sigma*(2-c_sigma)*mu_eff)*(inv_sqrt_cov @ (weights @ selected))
+            cov = (1-c_mu)*cov+c_mu*(selected.T @ np.diag(weights) @ selected)
+            sigma *= np.exp((c_sigma/d_sigma)*(np.linalg.norm(path)/chi_n-1))
+            best = min(self.results, key=lambda r: r['cost'])
+            print(f"[TUNE] Generation {generation+1}/{generations}: best cost {best['cost']:.3f}, sigma {sigma:.3f}")
+        return self.results
+
+    def best(self):
+        return min(self.results, key=lambda r: r['cost'])
+
+    def throughput(self):
+        """Simulations per second overall and per worker process."""
+        rate = self.simulations/self.elapsed if self.elapsed else 0.0
+        return rate, rate/self.processes
+
+    def run(self, method='random', **kwargs):
+        with multiprocessing.Pool(self.processes) as pool:
+            getattr(self, method)(pool, **kwargs)
+        return self.best()
+
+
+def push_gains(gains, base_params=None, ip=udp_quad.UDP_IP, port=udp_quad.UDP_PORT_RX):
+    """Send the tuned gains to a running simulator with the 'pid' command message."""
+    params = apply_gains(base_params or udp_quad.CONTROLLER_PARAMETERS, gains)
+    msg = {'pid': {key: params[key] for key in ('Linear_PID', 'Angular_PID', 'Yaw_Rate_Scaler')}}
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.sendto(json.dumps(msg).encode(), (ip, port))
+    sock.close()
+    return msg
+
+# ===========================================================
+# ---- CLI ----
+# ===========================================================
+def parse_args():
+    parser = argparse.ArgumentParser(description="Parallel PID gain auto-tuning")
+    parser.add_argument("--method", choices=['grid', 'random', 'cma'], default='cma')
+    parser.add_argument("--samples", type=int, default=64, help="Random search samples")
+    parser.add_argument("--levels", type=int, default=2, help="Grid search levels per gain")
+    parser.add_argument("--generations", type=int, default=10, help="CMA generations")
+    parser.add_argument("-j", "--processes", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--push", action="store_true", help="Send the winning gains to the running simulator")
+    parser.add_argument("-o", "--output", default=None, help="Write all scored candidates to this JSON file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    tuner = Tuner(processes=args.processes)
+    if args.method == 'grid':
+        best = tuner.run('grid', levels=args.levels)
+    elif args.method == 'random':
+        best = tuner.run('random', samples=args.samples, seed=args.seed)
+    else:
+        best = tuner.run('cma', generations=args.generations, seed=args.seed)
+    rate, per_core = tuner.throughput()
+    print(f"[TUNE] {tuner.simulations} simulations in {tuner.elapsed:.1f}s: {rate:.2f} sims/s, {per_core:.2f} sims/s per core")
+    print(f"[TUNE] Best cost {best['cost']:.3f} (settling {best['settling_time']:.2f}s, overshoot {best['overshoot']:.3f}m, "
+          f"saturation {100*best['saturation']:.1f}%)")
+    print(json.dumps(best['gains'], indent=2))
+    if args.push:
+        push_gains(best['gains'])
+        print(f"[TUNE] Pushed gains to {udp_quad.UDP_IP}:{udp_quad.UDP_PORT_RX}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(tuner.results, f, indent=2)
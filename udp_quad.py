@@ -1,5 +1,5 @@
-import quadcopter, gui, controller
-import signal, sys, argparse, threading, time, socket, json, os
+import quadcopter, gui, controller, scheduler, flight_modes, telemetry, udp_transport, state_store, battery, parameters, mission, navigation, loop_timing, shards, shm_telemetry
+import signal, sys, argparse, threading, time, json, os, copy, math
 import numpy as np
 
 # ===========================================================
@@ -8,204 +8,839 @@ import numpy as np
 TIME_SCALING = 1.0
 QUAD_DYNAMICS_UPDATE = 0.002
 CONTROLLER_DYNAMICS_UPDATE = 0.005
+FLIGHT_MODE_UPDATE = 0.05
+BATCHED_DYNAMICS = False
+INTEGRATOR = 'rk4'  # See quadcopter.Quadcopter.INTEGRATORS
+NUM_VEHICLES = 1
+VEHICLE_SPACING = 1.0  # m, grid spacing of the vehicles' start positions
+SHARDS = 0  # Worker processes the fleet is split across, 0 to fly it in this process (see shards.py)
+SHARD_SYNC_PERIOD = 0.01  # s of simulated time between the frames all shards publish together
+GUI_BLIT = False  # Blitted visualizer, see gui.GUI
+GUI_FPS = 30.0
+GUI_TRAIL = 0  # Past positions drawn per vehicle (blitted visualizer only)
 run = True
 
 # UDP Configuration
 UDP_IP = "127.0.0.1"
 UDP_PORT_RX = 9000  # Receive commands (from GCS)
 UDP_PORT_TX = 9001  # Send telemetry (to GCS)
+TELEMETRY_FORMAT = 'json'  # 'json' or 'binary', see telemetry.py
+TELEMETRY_RATE = 20.0  # Hz, state frames
+STREAM_FLUSH_PERIOD = 0.02  # Subscribed stream samples are batched into datagrams at this period
+TELEMETRY_RING = False  # Also offer telemetry through a shared memory ring to a GCS on this host (see shm_telemetry.py)
+TELEMETRY_TRANSPORT = 'udp'  # 'udp', or 'ring' once a receiver on this host has asked for it
 
 # Flight modes
-MODES = ['GUIDED', 'TAKEOFF', 'LAND', 'RTL']
-current_mode = 'GUIDED'
+MODES = flight_modes.MODES
 
-# Battery Simulation
-BATTERY_DRAIN_RATE = 0.01
-battery = 100.0
+# Battery failsafe: state of charge (%) at which a vehicle is sent home, and at which it lands
+BATTERY_RTL_PERCENT = 25.0
+BATTERY_LAND_PERCENT = 10.0
 
-# Waypoints
+# Geofence breach action: the mode a vehicle is switched to when it leaves the fences
+GEOFENCE_ACTION = 'RTL'
+
+# Default waypoints of every vehicle
 WAYPOINTS = [(1, 1, 2), (0, 0, 0), (-1, -1, 2), (-1, 1, 4)]
-current_wp_index = 0
+
+# Settings copied into every shard process
+SHARD_SETTINGS = ['QUAD_DYNAMICS_UPDATE', 'CONTROLLER_DYNAMICS_UPDATE', 'FLIGHT_MODE_UPDATE', 'INTEGRATOR', 'SHARD_SYNC_PERIOD',
+                  'BATTERY_RTL_PERCENT', 'BATTERY_LAND_PERCENT', 'GEOFENCE_ACTION', 'WAYPOINTS', 'geofence']
+# Command entries the shards execute; the rest run in the aggregator
+SHARD_COMMANDS = ['mode', 'param_set', 'param_get', 'pid', 'geofence']
+# Command fields used as a given type (e.g. mode.upper(), subscribe.items()); a command with a field
+# of another type is rejected as a whole before any of it runs
+COMMAND_TYPES = {'mode': str, 'subscribe': dict, 'param_set': dict, 'pid': dict, 'geofence': list,
+                 'mission_start': dict, 'mission_chunk': dict, 'mission_end': dict}
+TYPE_NAMES = {str: 'a string', dict: 'an object', list: 'a list'}
+
+# Per-vehicle state: id -> {'ctrl', 'mode_handler', 'sampler', 'params'}, filled by create_vehicles()
+vehicles = {}
+# Simulator-wide runtime parameters (parameters.Parameter_Table); per-vehicle ones are in vehicles[id]['params']
+sim_parameters = None
+# Set when a parameter set is queued, cleared when the control loop applies them
+parameters_requested = threading.Event()
+# Battery packs of all vehicles (battery.Battery_Bank), discharged by the motors' current draw
+batteries = None
+# Vectorized controllers of all vehicles (controller.Controller_Bank), with the batched dynamics
+controllers = None
+# Timing of every loop (loop_timing.Loop_Monitor), reported by the diagnostics command
+monitor = None
+# Active geofence (navigation.Geofence) or None, and the vehicles currently breaching it
+geofence = None
+fence_breaches = set()
+# Counts geofence commands, so only the newest one's grid is installed (see set_geofence)
+geofence_generation = 0
+# With SHARDS: the worker processes (shards.Shard_Pool), the (shard, item) commands waiting for
+# the next barrier, and the acknowledged commands waiting for their shards, by command token
+shard_pool = None
+shard_queue = []
+shard_pending = {}
+shard_lock = threading.Lock()
+
+# Vehicle and controller definitions (also used by the headless batch runner)
+QUADCOPTER = {'q1': {
+    'position': [0, 0, 0],
+    'orientation': [0, 0, 0],
+    'L': 0.3,
+    'r': 0.1,
+    'prop_size': [10, 4.5],
+    'weight': 1.2,
+    'motor_time_constant': 0.02,
+    'battery_capacity': 2200,
+    'battery_cells': 3
+}}
+
+CONTROLLER_PARAMETERS = {
+    'Motor_limits': [4000, 9000],
+    'Tilt_limits': [-10, 10],
+    'Yaw_Control_Limits': [-900, 900],
+    'Z_XY_offset': 500,
+    'Linear_PID': {'P': [300, 300, 7000], 'I': [0.04, 0.04, 4.5], 'D': [450, 450, 5000]},
+    'Linear_To_Angular_Scaler': [1, 1, 0],
+    'Yaw_Rate_Scaler': 0.18,
+    'Angular_PID': {'P': [22000, 22000, 1500], 'I': [0, 0, 1.2], 'D': [12000, 12000, 0]},
+}
 
 # Thread lock
 lock = threading.Lock()
 
-# UDP Sockets
-sock_rx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-sock_rx.bind((UDP_IP, UDP_PORT_RX))
-sock_rx.setblocking(False)
+# Consistent snapshots of every vehicle's state, published by the physics thread (see state_store.py)
+store = None
+
+# UDP transport (opened by open_transport() so the module can be imported headless)
+transport = None
+# Shared memory telemetry ring (shm_telemetry.Ring_Writer), with TELEMETRY_RING
+telemetry_ring = None
+# Replies to acknowledged commands, to suppress retransmitted duplicates
+command_acks = udp_transport.Command_Acks()
+# Chunked mission uploads in progress: (vehicle field, mission id) -> mission.Mission_Assembly
+mission_uploads = {}
+
+
+def open_transport():
+    global transport, telemetry_ring
+    transport = udp_transport.UDP_Transport()
+    handler = handle_command if monitor is None else loop_timing.timed(handle_command, monitor.timer('udp_commands'))
+    transport.listen('commands', UDP_IP, UDP_PORT_RX, handler)
+    print(f"[UDP] Listening for incoming GCS commands on {UDP_IP}:{UDP_PORT_RX} ...")
+    if TELEMETRY_RING:
+        telemetry_ring = shm_telemetry.Ring_Writer(shm_telemetry.ring_path(UDP_PORT_TX))
+        print(f"[SHM] Telemetry ring at {telemetry_ring.path}")
+
+
+def send_telemetry(frame):
+    """Send one telemetry frame to the GCS, through the ring if it asked for it, else by UDP."""
+    if TELEMETRY_TRANSPORT == 'ring':
+        telemetry_ring.write(frame)
+    else:
+        transport.sendto(frame, (UDP_IP, UDP_PORT_TX))
 
-sock_tx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+# ===========================================================
+# ---- Vehicles ----
+# ===========================================================
+def make_quadcopters(count):
+    """Copies of the QUADCOPTER definition for 'count' vehicles, started on a square grid."""
+    if count == 1:
+        return copy.deepcopy(QUADCOPTER)
+    base = QUADCOPTER['q1']
+    side = int(math.ceil(math.sqrt(count)))
+    quads = {}
+    for i in range(count):
+        quad = copy.deepcopy(base)
+        quad['position'] = [base['position'][0] + VEHICLE_SPACING*(i % side),
+                            base['position'][1] + VEHICLE_SPACING*(i // side),
+                            base['position'][2]]
+        quads[f'q{i+1}'] = quad
+    return quads
+
+
+def create_vehicles(quad, quads):
+    """Give every vehicle its own controller, mode state machine, battery, stream sampler and parameters."""
+    global batteries, controllers
+    vehicles.clear()
+    batteries = battery.Battery_Bank(quads)
+    ctrl_params = {key: copy.deepcopy(CONTROLLER_PARAMETERS) for key in quads}
+    controllers = None
+    if isinstance(quad, quadcopter.Quadcopter_Fleet):
+        controllers = controller.Controller_Bank(lambda: quad.states, quad.set_all_motor_speeds, ctrl_params, quads)
+    for key in quads:
+        if controllers is not None:
+            ctrl = controllers.controller(key)
+        else:
+            ctrl = controller.Controller_PID_Point2Point(
+                quad.get_state, quad.get_time, quad.set_motor_speeds,
+                params=ctrl_params[key], quad_identifier=key
+            )
+        home = tuple(quads[key]['position'])
+        handler = flight_modes.Flight_Mode_Handler(WAYPOINTS, home=home)
+        sampler = telemetry.Stream_Sampler({
+            'attitude': lambda key=key: quad.get_state(key)[6:12],
+            'position': lambda key=key: quad.get_state(key)[0:6],
+            'motors': lambda key=key: quad.get_motor_speeds(key),
+            'integrators': ctrl.get_integrator_terms,
+        }, base_rate=1.0/QUAD_DYNAMICS_UPDATE)
+        vehicles[key] = {
+            'ctrl': ctrl,
+            'mode_handler': handler,
+            'sampler': sampler,
+            'params': vehicle_parameters(ctrl, ctrl_params[key], handler),
+        }
+
+
+def vehicle_parameters(ctrl, ctrl_params, handler):
+    """Runtime parameters of one vehicle: its controller gains and flight mode settings."""
+    table = parameters.Parameter_Table(on_change=lambda: ctrl.set_params(ctrl_params))
+    table.add_controller(ctrl_params)
+    table.add('TAKEOFF_ALT', 'float', lambda: handler.takeoff_altitude, lambda value: setattr(handler, 'takeoff_altitude', value),
+              0.1, 100.0, 'TAKEOFF mode altitude (m)')
+    table.add('WP_RADIUS', 'float', lambda: handler.acceptance, lambda value: setattr(handler, 'acceptance', value),
+              0.01, 100.0, 'Waypoint acceptance radius (m)')
+    table.add('WP_LOOKAHEAD', 'float', lambda: handler.lookahead, lambda value: setattr(handler, 'lookahead', value),
+              0.0, 100.0, 'Path following lookahead distance, 0 to fly straight at waypoints (m)')
+    return table
+
+
+def global_parameter(name):
+    return (lambda: globals()[name]), (lambda value: globals().__setitem__(name, value))
+
+
+def create_sim_parameters():
+    """Runtime parameters of the simulator itself, shared by all vehicles."""
+    global sim_parameters
+    sim_parameters = parameters.Parameter_Table()
+    sim_parameters.add('TELEMETRY_RATE', 'float', *global_parameter('TELEMETRY_RATE'), 0.1, 1000.0, 'State telemetry rate (Hz)')
+    sim_parameters.add('BATTERY_RTL_PERCENT', 'float', *global_parameter('BATTERY_RTL_PERCENT'), 0.0, 100.0, 'Battery failsafe RTL level (%)')
+    sim_parameters.add('BATTERY_LAND_PERCENT', 'float', *global_parameter('BATTERY_LAND_PERCENT'), 0.0, 100.0, 'Battery failsafe LAND level (%)')
+    return sim_parameters
+
+
+def parameter_table(key, name):
+    """The table holding parameter 'name' for vehicle 'key'; the simulator's table for shared parameters."""
+    return sim_parameters if name in sim_parameters else vehicles[key]['params']
+
+
+def apply_parameters():
+    """Apply queued parameter sets. Runs on the simulation thread between control ticks."""
+    if not parameters_requested.is_set():
+        return
+    parameters_requested.clear()
+    applied = sim_parameters.apply_pending()
+    count = 0
+    for vehicle in vehicles.values():
+        changed = vehicle['params'].apply_pending()
+        if changed:
+            applied.update(changed)
+            count += 1
+    if applied:
+        print(f"[PARAM] Applied {applied} ({count} vehicles)")
+
+
+def publish_state(quad, sim_time):
+    """Publish every vehicle's state to the store. Only the physics thread may call this."""
+    keys = store.keys
+    if isinstance(quad, quadcopter.Quadcopter_Fleet):
+        states = quad.states
+    else:
+        states = [quad.get_state(key) for key in keys]
+    handlers = [vehicles[key]['mode_handler'] for key in keys]
+    store.publish(sim_time, states, batteries.percent(),
+                  [handler.mode for handler in handlers], [handler.wp_index for handler in handlers],
+                  batteries.voltage(), batteries.current, batteries.energy_remaining())
+
+
+def target_vehicles(msg, errors=None):
+    """Vehicles a command is addressed to: msg['vehicle'] is an id or '*'; without it the first vehicle."""
+    vehicle = msg.get('vehicle')
+    known = shard_pool.owner if shard_pool is not None else vehicles
+    if vehicle is None:
+        return [next(iter(known))]
+    if vehicle == '*':
+        return list(known)
+    if vehicle not in known:
+        print(f"[UDP] Unknown vehicle {vehicle}")
+        if errors is not None:
+            errors.append(f"Unknown vehicle {vehicle}")
+        return []
+    return [vehicle]
 
 # ===========================================================
 # ---- UDP Communication Threads ----
 # ===========================================================
 
-def udp_listener(ctrl):
-    """Receive control commands (mode, PID, waypoints, reboot)."""
-    global current_mode, WAYPOINTS, current_wp_index, run
-    print(f"[UDP] Listening for incoming GCS commands on {UDP_IP}:{UDP_PORT_RX} ...")
-    while run:
+def handle_command(data, addr):
+    """Apply one control command. Commands with a 'cmd_seq' are acknowledged (see udp_transport),
+    and a retransmitted one is only acknowledged again."""
+    msg = json.loads(data.decode())
+    if 'cmd_seq' not in msg:
+        execute_command(msg, {})
+    elif command_token(msg) not in shard_pending:  # else the shards are still running it
+        reply = command_acks.duplicate(msg)
+        if reply is None:
+            fields = {}
+            try:
+                errors = execute_command(msg, fields)
+            except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+                errors = [f"Invalid command: {e}"]
+            if command_token(msg) in shard_pending:
+                return  # Acknowledged by shard_reply() once every shard has run it
+            reply = command_acks.reply(msg, errors, fields)
+            if errors:
+                print(f"[UDP] Command {msg['cmd_seq']} rejected: {reply['error']}")
+        transport.send_json(reply, (UDP_IP, UDP_PORT_TX))
+
+    # ---- Reboot Command (after the acknowledgement) ----
+    if msg.get('reboot') and transport is not None:
+        print("[SIM] Reboot command received. Restarting simulation...")
+        if shard_pool is not None:
+            shard_pool.abort()
+        transport.send_json({"status": "rebooting"}, (UDP_IP, UDP_PORT_TX))
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+
+def execute_command(msg, reply):
+    """Apply a command (mode, parameters, waypoints, mission upload, telemetry format/rate/subscriptions,
+    ping). Returns the reasons it was (partly) rejected; entries put in reply go back with the ACK."""
+    global TELEMETRY_FORMAT, TELEMETRY_RATE, TELEMETRY_TRANSPORT
+    errors = [f"'{name}' must be {TYPE_NAMES[kind]}" for name, kind in COMMAND_TYPES.items()
+              if name in msg and not isinstance(msg[name], kind)]
+    if errors:
+        return errors
+
+    # ---- Latency Probe ----
+    if 'ping' in msg:
+        transport.send_json({'pong': msg['ping']}, (UDP_IP, UDP_PORT_TX))
+
+    # ---- Link Statistics ----
+    if msg.get('link_stats'):
+        transport.send_json({'link_stats': transport.stats()}, (UDP_IP, UDP_PORT_TX))
+
+    # ---- Loop Timing Diagnostics ----
+    if msg.get('diagnostics'):
+        if monitor is None:
+            errors.append("Loop timing is not running")
+        else:
+            for part in monitor.report_parts(udp_transport.MAX_DATAGRAM):
+                transport.send_json({'diagnostics': part}, (UDP_IP, UDP_PORT_TX))
+
+    waypoints = None
+    if 'waypoints' in msg:
         try:
-            data, addr = sock_rx.recvfrom(2048)
-            msg = json.loads(data.decode())
-
-            # ---- Update PID ----
-            if 'pid' in msg:
-                with lock:
-                    print("[UDP] Updating PID parameters...")
-                    for key in msg['pid']:
-                        if key in ctrl.params:
-                            ctrl.params[key].update(msg['pid'][key])
-                        elif key in ctrl.params.get('Linear_PID', {}):
-                            ctrl.params['Linear_PID'][key] = msg['pid'][key]
-
-            # ---- Change Flight Mode ----
-            if 'mode' in msg:
-                with lock:
-                    mode = msg['mode'].upper()
-                    if mode in MODES:
-                        current_mode = mode
-                        current_wp_index = 0
-                        print(f"[MODE] Switched to {current_mode}")
-
-            # ---- Update Waypoints ----
-            if 'waypoints' in msg:
-                with lock:
-                    WAYPOINTS = msg['waypoints']
-                    current_wp_index = 0
-                    print(f"[UDP] Received new waypoints: {WAYPOINTS}")
-
-            # ---- Reboot Command ----
-            if 'reboot' in msg and msg['reboot']:
-                print("[SIM] Reboot command received. Restarting simulation...")
-                sock_tx.sendto(json.dumps({"status": "rebooting"}).encode(), (UDP_IP, UDP_PORT_TX))
-                os.execv(sys.executable, [sys.executable] + sys.argv)
-
-        except BlockingIOError:
-            pass
-        except Exception as e:
-            print(f"[UDP] Error: {e}")
-        time.sleep(0.01)
-
-
-def telemetry_sender(quad):
-    """Send live telemetry to GCS."""
-    global battery
+            waypoints = mission.as_waypoints(msg['waypoints'])
+        except ValueError as e:
+            errors.append(e.args[0])
+            return errors
+        errors.extend(mission.validate(waypoints))
+        if errors:
+            return errors
+
+    # ---- Geofence ----
+    if 'geofence' in msg:
+        try:
+            set_geofence(msg['geofence'])
+        except (ValueError, KeyError, TypeError) as e:
+            errors.append(f"Invalid geofence: {e}")
+            return errors
+
+    # ---- Chunked Mission Upload ----
+    mission_mode = None
+    if 'mission_start' in msg or 'mission_chunk' in msg or 'mission_end' in msg:
+        waypoints = handle_mission(msg, errors, reply)
+        if waypoints is None:
+            return errors
+        mission_mode = msg['mission_end'].get('mode')
+
+    targets = target_vehicles(msg, errors)
+    if shard_pool is not None:
+        forward_to_shards(msg, targets, waypoints, mission_mode, errors, reply)
+        targets = []
+    for key in targets:
+        vehicle = vehicles[key]
+
+        # ---- Parameters (PARAM_SET / PARAM_GET, 'pid' is the nested controller dictionary form) ----
+        if 'param_set' in msg or 'param_get' in msg or 'pid' in msg:
+            for name, reason in handle_parameters(key, msg).items():
+                if reason not in errors:
+                    errors.append(reason)
+
+        # ---- Change Flight Mode ----
+        if 'mode' in msg:
+            with lock:
+                if vehicle['mode_handler'].set_mode(msg['mode']):
+                    print(f"[MODE] {key} switched to {vehicle['mode_handler'].mode}")
+                elif f"Unknown mode {msg['mode']}" not in errors:
+                    errors.append(f"Unknown mode {msg['mode']}")
+
+        # ---- Update Waypoints ----
+        if waypoints is not None:
+            with lock:
+                vehicle['mode_handler'].set_waypoints(waypoints)
+                if mission_mode:
+                    vehicle['mode_handler'].set_mode(mission_mode)
+            print(f"[UDP] {key} received a mission of {len(waypoints)} waypoints")
+
+        # ---- Stream Subscriptions ----
+        if 'subscribe' in msg:
+            for name, rate in msg['subscribe'].items():
+                actual = vehicle['sampler'].subscribe(name, float(rate))
+                print(f"[UDP] Stream '{name}' of {key} subscribed at {actual:.1f} Hz")
+
+    # ---- Telemetry Format Negotiation ----
+    if 'telemetry_format' in msg:
+        if msg['telemetry_format'] in telemetry.FORMATS:
+            TELEMETRY_FORMAT = msg['telemetry_format']
+            print(f"[UDP] Telemetry format set to {TELEMETRY_FORMAT}")
+        else:
+            errors.append(f"Unknown telemetry format {msg['telemetry_format']}")
+
+    # ---- Telemetry Transport ----
+    # The receiver proves it is on this host by echoing the token it read from the ring
+    if 'telemetry_transport' in msg:
+        if msg['telemetry_transport'] == 'udp':
+            TELEMETRY_TRANSPORT = 'udp'
+            print("[SHM] Telemetry sent by UDP")
+        elif msg['telemetry_transport'] != 'ring':
+            errors.append(f"Unknown telemetry transport {msg['telemetry_transport']}")
+        elif telemetry_ring is None:
+            errors.append("Telemetry ring is not enabled (--telemetry_ring)")
+        elif msg.get('ring_token') != telemetry_ring.token:
+            errors.append("Telemetry ring token mismatch, the receiver is not on this host")
+        else:
+            TELEMETRY_TRANSPORT = 'ring'
+            print(f"[SHM] Telemetry sent through {telemetry_ring.path}")
+
+    # ---- Telemetry Rate ----
+    if 'telemetry_rate' in msg:
+        if msg['telemetry_rate'] > 0:
+            TELEMETRY_RATE = float(msg['telemetry_rate'])
+            print(f"[UDP] Telemetry rate set to {TELEMETRY_RATE:.1f} Hz")
+        else:
+            errors.append("Telemetry rate must be positive")
+    return errors
+
+
+def set_geofence(specs):
+    """Replace the geofence with the fences in specs (see navigation.make_fence); an empty list removes it.
+    The fences are checked here, and their grid is built on a thread of its own so the command
+    handler (the transport's event loop, or a shard between barriers) never waits for it."""
+    global geofence_generation
+    fences = [navigation.make_fence(spec) for spec in specs]
+    with lock:
+        geofence_generation += 1
+        generation = geofence_generation
+    threading.Thread(target=install_geofence, args=(fences, generation), daemon=True).start()
+
+
+def install_geofence(fences, generation):
+    global geofence
+    fence = navigation.Geofence(fences) if fences else None
+    with lock:
+        if generation != geofence_generation:
+            return  # A newer geofence command came in while this one was being built
+        geofence = fence
+        fence_breaches.clear()
+    print(f"[FENCE] {len(fences) or 'No'} geofences active")
+
+
+def command_token(msg):
+    return (msg.get('cmd_session'), msg.get('cmd_seq'))
+
+
+def forward_to_shards(msg, targets, waypoints, mission_mode, errors, fields):
+    """Queue the vehicle part of a command for the shards flying 'targets'. An acknowledged command
+    is registered in shard_pending, with its errors and reply fields, until they have all run it."""
+    if 'subscribe' in msg:
+        errors.append("Streams are not available with --shards")
+    part = {name: msg[name] for name in SHARD_COMMANDS if name in msg}
+    if waypoints is not None:
+        part['waypoints'] = waypoints
+        if mission_mode:
+            part['mode'] = mission_mode
+    # Simulator-wide parameters also apply here (TELEMETRY_RATE is used by this process)
+    for name, value in msg.get('param_set', {}).items():
+        if name in sim_parameters:
+            sim_parameters.request(name, value)
+            parameters_requested.set()
+    if not part or not targets:
+        return
+    owners = {shard_pool.owner[key] for key in targets}
+    everyone = 'geofence' in part
+    vehicle = '*' if msg.get('vehicle') == '*' else targets[0]
+    token = command_token(msg) if 'cmd_seq' in msg else None
+    with shard_lock:
+        recipients = range(len(shard_pool.shards)) if everyone else sorted(owners)
+        if token is not None:
+            shard_pending[token] = {'msg': msg, 'shards': set(recipients), 'errors': errors, 'fields': fields}
+        for shard in recipients:
+            # Shards that don't fly a target only get the fence
+            item = dict(part, vehicle=vehicle) if shard in owners else {'geofence': part['geofence'], 'vehicle': '*'}
+            shard_queue.append((shard, (token, item)))
+
+
+def shard_reply(item):
+    """Handle one reply from a shard: a datagram to send, or the outcome of a forwarded command."""
+    if item[0] == 'send':
+        transport.send_json(item[1], item[2])
+        return
+    kind, token, shard, errors, fields = item
+    with shard_lock:
+        pending = shard_pending.get(token)
+        if pending is None:
+            return
+        pending['shards'].discard(shard)
+        pending['errors'].extend(error for error in errors if error not in pending['errors'])
+        pending['fields'].update(fields)
+        if pending['shards']:
+            return
+        del shard_pending[token]
+    reply = command_acks.reply(pending['msg'], pending['errors'], pending['fields'])
+    if pending['errors']:
+        print(f"[UDP] Command {token[1]} rejected: {reply['error']}")
+    transport.send_json(reply, (UDP_IP, UDP_PORT_TX))
+
+
+def handle_mission(msg, errors, reply):
+    """Track chunked mission uploads (see mission.py). Returns the mission array once one completes."""
+    vehicle = msg.get('vehicle')
+    if 'mission_start' in msg:
+        start = msg['mission_start']
+        try:
+            mission_uploads[(vehicle, start['id'])] = mission.Mission_Assembly(
+                start['id'], start['count'], start['chunks'], start['crc'], start.get('chunk_size', mission.CHUNK_WAYPOINTS))
+        except ValueError as e:
+            errors.append(e.args[0])
+        while len(mission_uploads) > mission.MAX_UPLOADS:
+            del mission_uploads[next(iter(mission_uploads))]
+        return None
+    part = msg.get('mission_chunk') or msg['mission_end']
+    assembly = mission_uploads.get((vehicle, part['id']))
+    if assembly is None:
+        errors.append(f"Unknown mission {part['id']}")
+        return None
+    if 'mission_chunk' in msg:
+        try:
+            assembly.add_chunk(part['index'], part['waypoints'])
+        except ValueError as e:
+            errors.append(e.args[0])
+        return None
+    # A bad mode rejects the mission_end before anything is installed; the upload is kept for a retry
+    mode = part.get('mode')
+    if mode is not None and (not isinstance(mode, str) or mode.upper() not in flight_modes.MODES):
+        errors.append(f"Unknown mode {mode}")
+        return None
+    reply['missing'] = assembly.missing()
+    try:
+        waypoints = assembly.finish()
+    except ValueError as e:
+        errors.append(e.args[0])
+        if not reply['missing']:
+            del mission_uploads[(vehicle, part['id'])]
+        return None
+    del mission_uploads[(vehicle, part['id'])]
+    return waypoints
+
+
+def handle_parameters(key, msg):
+    """Validate and queue parameter sets of one vehicle, and reply with the requested and set values."""
+    sets = dict(msg.get('param_set', {}))
+    if 'pid' in msg:
+        sets.update(parameters.controller_sets(msg['pid']))
+    reply = {'param_value': {}, 'vehicle': key}
+    get = msg.get('param_get')
+    if get == '*':
+        reply['param_value'].update(sim_parameters.values())
+        reply['param_value'].update(vehicles[key]['params'].values())
+        reply['param_info'] = dict(sim_parameters.info(), **vehicles[key]['params'].info())
+    elif get:
+        reply['param_value'].update(sim_parameters.values(get))
+        reply['param_value'].update(vehicles[key]['params'].values(get))
+    errors = {}
+    for table in (sim_parameters, vehicles[key]['params']):
+        accepted, rejected = table.request_all({name: value for name, value in sets.items() if parameter_table(key, name) is table})
+        reply['param_value'].update(accepted)
+        errors.update({name: e.args[0] for name, e in rejected.items()})
+    if errors:
+        reply['param_error'] = errors
+        print(f"[PARAM] {key} rejected {errors}")
+    if len(sets) > len(errors):
+        parameters_requested.set()
+    transport.send_json(reply, (UDP_IP, UDP_PORT_TX))
+    return errors
+
+
+def telemetry_sender():
+    """Send live telemetry of every vehicle to GCS, tagged with the vehicle id."""
     print(f"[UDP] Telemetry broadcasting on {UDP_IP}:{UDP_PORT_TX} ...")
+    timer = monitor.timer('telemetry_sender')
+    seq = 0
     while run:
+        timer.period = 1.0/TELEMETRY_RATE
+        start = timer.start()
         try:
-            pos = quad.get_position('q1')
-            ori = quad.get_orientation('q1')
-
-            if isinstance(pos, np.ndarray):
-                pos = pos.tolist()
-            if isinstance(ori, np.ndarray):
-                ori = ori.tolist()
+            encode = telemetry.encode_state if TELEMETRY_FORMAT == 'binary' else telemetry.encode_state_json
+            snapshot = store.snapshot()
+            for key in store.keys:
+                v = store.vehicle(snapshot, key)
+                frame = encode(seq, key, snapshot['sim_time'], v['position'], v['orientation'], v['velocity'],
+                               v['battery'], v['mode'], v['waypoint_index'], v['voltage'], v['current'], v['energy'])
+                send_telemetry(frame)
+                seq += 1
 
-            telemetry = {
-                'position': pos,
-                'orientation': ori,
-                'battery': round(battery, 2),
-                'mode': current_mode,
-                'waypoint_index': current_wp_index
-            }
+        except Exception as e:
+            print(f"[UDP] Telemetry error: {e}")
+        timer.stop(start)
+        timer.sleep(1.0/TELEMETRY_RATE)
 
-            sock_tx.sendto(json.dumps(telemetry).encode(), (UDP_IP, UDP_PORT_TX))
 
+def stream_sender():
+    """Send subscribed high-rate streams, several samples per datagram."""
+    timer = monitor.timer('stream_sender', STREAM_FLUSH_PERIOD)
+    seq = 0
+    binary_per_datagram = {name: telemetry.samples_per_datagram(name) for name in telemetry.STREAMS}
+    json_per_datagram = {name: telemetry.json_samples_per_datagram(name) for name in telemetry.STREAMS}
+    while run:
+        start = timer.start()
+        try:
+            binary = TELEMETRY_FORMAT == 'binary'
+            for key, vehicle in vehicles.items():
+                for name, samples in vehicle['sampler'].drain().items():
+                    per_datagram = (binary_per_datagram if binary else json_per_datagram)[name]
+                    for first in range(0, len(samples), per_datagram):
+                        chunk = samples[first:first+per_datagram]
+                        if binary:
+                            frame = telemetry.encode_stream(seq, key, name, chunk)
+                        else:
+                            frame = telemetry.encode_stream_json(seq, key, name, chunk)
+                        send_telemetry(frame)
+                        seq += 1
         except Exception as e:
-            print(f"[UDP] Telemetry error: {e}")
-        time.sleep(0.05)  # ~20 Hz
+            print(f"[UDP] Stream error: {e}")
+        timer.stop(start)
+        timer.sleep(STREAM_FLUSH_PERIOD)
 
 # ===========================================================
 # ---- Battery Simulation ----
 # ===========================================================
-def update_battery():
-    """Simulate battery draining over time."""
-    global battery
-    while run:
-        battery = max(0.0, battery - BATTERY_DRAIN_RATE)
-        time.sleep(0.5)
+def battery_step(quad, dt):
+    """Discharge every vehicle's battery by the motors' current over one physics step."""
+    batteries.step(quad.propulsion.currents, dt)
+    quad.propulsion.voltage[:] = batteries.voltage()
 
 # ===========================================================
 # ---- Flight Mode Handling ----
 # ===========================================================
-def flight_mode_handler(ctrl, quad):
-    """Manage TAKEOFF, LAND, RTL, GUIDED modes."""
-    global current_mode, current_wp_index, WAYPOINTS
-    while run:
-        pos = quad.get_position('q1')
-
-        if current_mode == 'TAKEOFF':
-            ctrl.update_target((pos[0], pos[1], 2.0))
-        elif current_mode == 'LAND':
-            ctrl.update_target((pos[0], pos[1], 0.0))
-        elif current_mode == 'RTL':
-            ctrl.update_target((0, 0, 0))
-        elif current_mode == 'GUIDED':
-            if current_wp_index < len(WAYPOINTS):
-                target = WAYPOINTS[current_wp_index]
-                ctrl.update_target(target)
-                curr = quad.get_position('q1')
-                if all(abs(a - b) < 0.1 for a, b in zip(curr, target)):
-                    current_wp_index += 1
-                    print(f"[GUIDED] Reached waypoint {current_wp_index}/{len(WAYPOINTS)}")
-
-        time.sleep(0.05)
+def flight_mode_step(quad):
+    """Run one tick of the TAKEOFF, LAND, RTL, GUIDED mode logic of every vehicle."""
+    with lock:
+        for i, mode in batteries.check_failsafe(BATTERY_RTL_PERCENT, BATTERY_LAND_PERCENT):
+            key = batteries.keys[i]
+            if vehicles[key]['mode_handler'].set_mode(mode):
+                print(f"[BATTERY] {key} at {batteries.percent()[i]:.1f}% ({batteries.voltage()[i]:.2f} V), switching to {mode}")
+        for key, vehicle in vehicles.items():
+            handler = vehicle['mode_handler']
+            pos = quad.get_position(key)
+            if geofence is not None:
+                check_geofence(key, handler, pos)
+            if handler.step(vehicle['ctrl'], pos):
+                print(f"[GUIDED] {key} reached waypoint {handler.wp_index}/{len(handler.waypoints)}")
+
+
+def check_geofence(key, handler, pos):
+    """Switch a vehicle to GEOFENCE_ACTION when it breaches the geofence; once per breach."""
+    reason = geofence.breach(pos)
+    if reason is None:
+        fence_breaches.discard(key)
+    elif key not in fence_breaches:
+        fence_breaches.add(key)
+        if handler.mode != GEOFENCE_ACTION and handler.set_mode(GEOFENCE_ACTION):
+            print(f"[FENCE] {key} {reason} at ({pos[0]:.1f}, {pos[1]:.1f}, {pos[2]:.1f}), switching to {GEOFENCE_ACTION}")
+
+
+def control_step():
+    apply_parameters()
+    if controllers is not None:
+        controllers.update()
+        return
+    for vehicle in vehicles.values():
+        vehicle['ctrl'].update()
 
 # ===========================================================
 # ---- Main Simulation ----
 # ===========================================================
 def Single_Point2Point():
-    global run
-
-    QUADCOPTER = {'q1': {
-        'position': [0, 0, 0],
-        'orientation': [0, 0, 0],
-        'L': 0.3,
-        'r': 0.1,
-        'prop_size': [10, 4.5],
-        'weight': 1.2
-    }}
-
-    CONTROLLER_PARAMETERS = {
-        'Motor_limits': [4000, 9000],
-        'Tilt_limits': [-10, 10],
-        'Yaw_Control_Limits': [-900, 900],
-        'Z_XY_offset': 500,
-        'Linear_PID': {'P': [300, 300, 7000], 'I': [0.04, 0.04, 4.5], 'D': [450, 450, 5000]},
-        'Linear_To_Angular_Scaler': [1, 1, 0],
-        'Yaw_Rate_Scaler': 0.18,
-        'Angular_PID': {'P': [22000, 22000, 1500], 'I': [0, 0, 1.2], 'D': [12000, 12000, 0]},
-    }
+    global run, store, monitor
 
     signal.signal(signal.SIGINT, signal_handler)
 
-    quad = quadcopter.Quadcopter(QUADCOPTER)
-    gui_object = gui.GUI(quads=QUADCOPTER)
-    ctrl = controller.Controller_PID_Point2Point(
-        quad.get_state, quad.get_time, quad.set_motor_speeds,
-        params=CONTROLLER_PARAMETERS, quad_identifier='q1'
-    )
+    quads = make_quadcopters(NUM_VEHICLES)
+    if BATCHED_DYNAMICS:
+        quad = quadcopter.Quadcopter_Fleet(quads, integrator=INTEGRATOR)
+    else:
+        quad = quadcopter.Quadcopter(quads, integrator=INTEGRATOR)
+    gui_object = gui.GUI(quads=quads, blit=GUI_BLIT, trail=GUI_TRAIL)
+    create_vehicles(quad, quads)
+    create_sim_parameters()
+    store = state_store.State_Store(quads)
+    publish_state(quad, 0.0)
+
+    # Physics, control, flight modes and battery all advance from one simulated clock,
+    # so TIME_SCALING=0 runs the whole loop faster than real time.
+    sim_clock = scheduler.Lockstep_Scheduler(time_scaling=TIME_SCALING, start_time=quad.get_time())
+
+    def physics_step():
+        quad.update(QUAD_DYNAMICS_UPDATE)
+        battery_step(quad, QUAD_DYNAMICS_UPDATE)
+        quad.set_time(sim_clock.get_time())
+        sim_time = sim_clock.get_sim_time()
+        for vehicle in vehicles.values():
+            vehicle['sampler'].sample(sim_time)
+        publish_state(quad, sim_time)
+
+    sim_clock.add_task(lambda: flight_mode_step(quad), FLIGHT_MODE_UPDATE, name='flight_mode')
+    sim_clock.add_task(control_step, CONTROLLER_DYNAMICS_UPDATE, name='controller')
+    sim_clock.add_task(physics_step, QUAD_DYNAMICS_UPDATE, name='physics')
+    monitor = loop_timing.Loop_Monitor()
+    for timer in sim_clock.timers():
+        monitor.add(timer)
+    sim_clock.start_thread()
+
+    open_transport()
+    threading.Thread(target=telemetry_sender, daemon=True).start()
+    threading.Thread(target=stream_sender, daemon=True).start()
 
-    quad.start_thread(dt=QUAD_DYNAMICS_UPDATE, time_scaling=TIME_SCALING)
-    ctrl.start_thread(update_rate=CONTROLLER_DYNAMICS_UPDATE, time_scaling=TIME_SCALING)
+    print("[SIM] Quadcopter simulator started with UDP telemetry & control.")
 
-    threading.Thread(target=udp_listener, args=(ctrl,), daemon=True).start()
-    threading.Thread(target=telemetry_sender, args=(quad,), daemon=True).start()
-    threading.Thread(target=update_battery, daemon=True).start()
-    threading.Thread(target=flight_mode_handler, args=(ctrl, quad), daemon=True).start()
+    # The visualizer renders on this thread at its own rate from state snapshots
+    def snapshot():
+        state = store.snapshot()['state']
+        return state[:, 0:3], state[:, 6:9]
+    gui_object.run(snapshot, fps=GUI_FPS, running=lambda: run, timer=monitor.timer('gui', 1.0/GUI_FPS))
 
-    print("[SIM] Quadcopter simulator started with UDP telemetry & control.")
+    sim_clock.stop_thread()
+    print("[SIM] Simulation stopped.")
 
-    while run:
-        gui_object.quads['q1']['position'] = quad.get_position('q1')
-        gui_object.quads['q1']['orientation'] = quad.get_orientation('q1')
-        gui_object.update()
-        time.sleep(0.02)
+# ===========================================================
+# ---- Sharded Simulation ----
+# ===========================================================
+def shard_worker(index, keys, row, count, frames_name, barrier, commands, replies, stop, quads, settings):
+    """One shard process (see shards.py): flies vehicles 'keys', which are rows row.. of the shared frames."""
+    global transport
+    globals().update(settings)
+    quads = {key: quads[key] for key in keys}
+    quad = quadcopter.Quadcopter_Fleet(quads, integrator=INTEGRATOR)
+    create_vehicles(quad, quads)
+    create_sim_parameters()
+    transport = shards.Reply_Queue(replies)
+    frames = shards.Shared_Frames(count, name=frames_name)
+    clock = scheduler.Lockstep_Scheduler(time_scaling=0, start_time=quad.get_time())
+
+    def physics_step():
+        quad.update(QUAD_DYNAMICS_UPDATE)
+        battery_step(quad, QUAD_DYNAMICS_UPDATE)
+        quad.set_time(clock.get_time())
+
+    clock.add_task(lambda: flight_mode_step(quad), FLIGHT_MODE_UPDATE, name='flight_mode')
+    clock.add_task(control_step, CONTROLLER_DYNAMICS_UPDATE, name='controller')
+    clock.add_task(physics_step, QUAD_DYNAMICS_UPDATE, name='physics')
+    handlers = [vehicles[key]['mode_handler'] for key in keys]
+    rows = slice(row, row + len(keys))
+
+    def publish(frame):
+        frame['sim_time'][0] = clock.get_sim_time()
+        frame['state'][rows] = quad.states
+        frame['battery'][rows] = batteries.percent()
+        frame['voltage'][rows] = batteries.voltage()
+        frame['current'][rows] = batteries.current
+        frame['energy'][rows] = batteries.energy_remaining()
+        frame['mode'][rows] = [MODES.index(handler.mode) for handler in handlers]
+        frame['waypoint_index'][rows] = [handler.wp_index for handler in handlers]
+
+    def execute(item):
+        token, msg = item
+        fields = {}
+        try:
+            errors = execute_command(msg, fields)
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+            errors = [f"Invalid command: {e}"]
+        if token is not None:
+            replies.put(('ack', token, index, errors, fields))
 
-    quad.stop_thread()
-    ctrl.stop_thread()
+    try:
+        shards.shard_loop(clock, frames, publish, barrier, commands, stop, execute, SHARD_SYNC_PERIOD)
+    finally:
+        frames.close()
+
+
+def shard_aggregator():
+    """Pace the shards, publish every frame they meet on to the store, and pass them commands and replies."""
+    global run
+    timer = monitor.timer('shard_sync', SHARD_SYNC_PERIOD*TIME_SCALING if TIME_SCALING > 0 else None)
+    wall_start = time.perf_counter()
+    tick = 0
+    try:
+        while run:
+            if TIME_SCALING > 0:
+                deadline = wall_start + tick*SHARD_SYNC_PERIOD*TIME_SCALING
+                delay = deadline - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                timer.woke(time.perf_counter() - deadline)
+            start = timer.start()
+            with shard_lock:
+                queued = shard_queue[:]
+                shard_queue.clear()
+            for shard, item in queued:
+                shard_pool.send(shard, item)
+            frame = shard_pool.sync()
+            store.publish(frame['sim_time'][0], frame['state'], frame['battery'], frame['mode'], frame['waypoint_index'],
+                          frame['voltage'], frame['current'], frame['energy'])
+            del frame
+            for item in shard_pool.drain():
+                shard_reply(item)
+            apply_parameters()
+            timer.stop(start)
+            tick += 1
+    except threading.BrokenBarrierError:
+        if run:
+            print("[SHARD] A shard process stopped responding, stopping the simulation")
+            run = False
+    finally:
+        shard_pool.stop()
+
+
+def Sharded_Point2Point():
+    """Single_Point2Point with the fleet flown by SHARDS worker processes. This process aggregates
+    their frames for telemetry and the 3D view and passes commands to them."""
+    global run, store, monitor, shard_pool
+
+    signal.signal(signal.SIGINT, signal_handler)
+
+    quads = make_quadcopters(NUM_VEHICLES)
+    settings = {name: globals()[name] for name in SHARD_SETTINGS}
+    shard_pool = shards.Shard_Pool(quads, SHARDS, shard_worker, args=(quads, settings))
+    shard_pool.start()
+    gui_object = gui.GUI(quads=quads, blit=GUI_BLIT, trail=GUI_TRAIL)
+    create_sim_parameters()
+    store = state_store.State_Store(quads)
+    monitor = loop_timing.Loop_Monitor()
+    aggregator = threading.Thread(target=shard_aggregator, daemon=True)
+    aggregator.start()
+    while run and not store.published:
+        time.sleep(0.01)
+
+    open_transport()
+    threading.Thread(target=telemetry_sender, daemon=True).start()
+
+    print(f"[SIM] Quadcopter simulator started with {len(quads)} vehicles in {len(shard_pool.shards)} shard processes.")
+
+    def snapshot():
+        state = store.snapshot()['state']
+        return state[:, 0:3], state[:, 6:9]
+    try:
+        gui_object.run(snapshot, fps=GUI_FPS, running=lambda: run, timer=monitor.timer('gui', 1.0/GUI_FPS))
+    finally:
+        run = False
+        aggregator.join(shards.BARRIER_TIMEOUT)
     print("[SIM] Simulation stopped.")
 
 # ===========================================================
@@ -216,12 +851,32 @@ def parse_args():
     parser.add_argument("--time_scale", type=float, default=-1.0)
     parser.add_argument("--quad_update_time", type=float, default=0.0)
     parser.add_argument("--controller_update_time", type=float, default=0.0)
-    return parser.parse_args()
+    parser.add_argument("--batched", action="store_true", help="Use the vectorized fleet dynamics engine")
+    parser.add_argument("--integrator", choices=quadcopter.Quadcopter.INTEGRATORS, default=None, help="Dynamics integrator")
+    parser.add_argument("--vehicles", type=int, default=0, help="Number of simulated vehicles (q1..qN)")
+    parser.add_argument("--telemetry", choices=telemetry.FORMATS, default=None, help="Initial telemetry wire format")
+    parser.add_argument("--telemetry_rate", type=float, default=0.0, help="State telemetry rate in Hz")
+    parser.add_argument("--telemetry_ring", action="store_true", help="Offer telemetry through shared memory to a GCS on this host")
+    parser.add_argument("--battery_rtl", type=float, default=None, help="Battery %% at which vehicles return home")
+    parser.add_argument("--battery_land", type=float, default=None, help="Battery %% at which vehicles land")
+    parser.add_argument("--shards", type=int, default=0, help="Fly the fleet in this many worker processes")
+    parser.add_argument("--geofence", default=None, help="JSON file with a list of geofences (see navigation.make_fence)")
+    parser.add_argument("--blit", action="store_true", help="Use the blitted 3D visualizer")
+    parser.add_argument("--gui_fps", type=float, default=0.0, help="Visualizer frame rate")
+    parser.add_argument("--trail", type=int, default=0, help="Trail length in frames (blitted visualizer)")
+    args = parser.parse_args()
+    # Batched and sharded fleets use Quadcopter_Fleet, which has no per-vehicle solver such as vode
+    if args.integrator and (args.batched or args.shards > 0) and args.integrator not in quadcopter.Quadcopter_Fleet.INTEGRATORS:
+        parser.error(f"--integrator {args.integrator} is not available with --batched or --shards, "
+                     f"choose one of {', '.join(quadcopter.Quadcopter_Fleet.INTEGRATORS)}")
+    return args
 
 def signal_handler(signal, frame):
     global run
     run = False
     print("\n[SIM] Stopping simulation...")
+    if telemetry_ring is not None:
+        telemetry_ring.unlink()
     sys.exit(0)
 
 # ===========================================================
@@ -235,5 +890,30 @@ if __name__ == "__main__":
         QUAD_DYNAMICS_UPDATE = args.quad_update_time
     if args.controller_update_time > 0:
         CONTROLLER_DYNAMICS_UPDATE = args.controller_update_time
-
-    Single_Point2Point()
+    BATCHED_DYNAMICS = args.batched
+    if args.integrator:
+        INTEGRATOR = args.integrator
+    if args.vehicles > 0:
+        NUM_VEHICLES = args.vehicles
+    if args.telemetry:
+        TELEMETRY_FORMAT = args.telemetry
+    if args.telemetry_rate > 0:
+        TELEMETRY_RATE = args.telemetry_rate
+    TELEMETRY_RING = args.telemetry_ring
+    if args.battery_rtl is not None:
+        BATTERY_RTL_PERCENT = args.battery_rtl
+    if args.battery_land is not None:
+        BATTERY_LAND_PERCENT = args.battery_land
+    if args.geofence:
+        with open(args.geofence) as f:
+            geofence = navigation.Geofence([navigation.make_fence(spec) for spec in json.load(f)])
+    SHARDS = args.shards
+    GUI_BLIT = args.blit
+    if args.gui_fps > 0:
+        GUI_FPS = args.gui_fps
+    GUI_TRAIL = args.trail
+
+    if SHARDS > 0:
+        Sharded_Point2Point()
+    else:
+        Single_Point2Point()
@@ -0,0 +1,222 @@
+import asyncio
+import collections
+import itertools
+import json
+import os
+import socket
+import struct
+import threading
+import time
+
+# ===========================================================
+# ---- Asyncio UDP Transport ----
+# ===========================================================
+# One asyncio event loop per process runs in a background thread and owns every receiving
+# socket. Each datagram is handed to its endpoint's handler as soon as the loop reads it, so
+# bursts are drained immediately instead of one packet per polling tick. Handlers run on the
+# loop thread and must not block. Sending uses a plain socket, which is safe from any thread.
+
+MALFORMED_ERRORS = (ValueError, KeyError, IndexError, TypeError, UnicodeDecodeError, struct.error)
+# Every message (telemetry frames, command replies, mission chunks) is sized to fit one datagram
+# of at most MAX_DATAGRAM bytes, under the 1472 byte UDP payload of an Ethernet link, so none is
+# fragmented. Vehicle ids are at most MAX_VEHICLE_ID characters (the binary frames' '8s').
+MAX_DATAGRAM = 1400
+MAX_VEHICLE_ID = 8
+
+# Reliable commands: a command carries 'cmd_seq' and 'cmd_session' (random per sender process)
+# and is retransmitted every COMMAND_TIMEOUT seconds until the peer replies
+# {'ack': seq, 'cmd_session': ..., 'result': 'ACK' or 'NACK', 'error': ...}, at most
+# COMMAND_RETRIES times. Commands are sent one at a time, so they are executed in order.
+COMMAND_TIMEOUT = 0.25
+COMMAND_RETRIES = 5
+COMMAND_HISTORY = 256  # Replies the receiver keeps to acknowledge retransmissions again
+
+
+class Datagram_Endpoint(asyncio.DatagramProtocol):
+    # Counts received, dropped (sequence gaps reported by the handler via track_sequence),
+    # malformed (the handler raised a decode error) and failed datagrams.
+    def __init__(self, handler, name):
+        self.handler = handler
+        self.name = name
+        self.transport = None
+        self.received = 0
+        self.received_bytes = 0
+        self.dropped = 0
+        self.malformed = 0
+        self.errors = 0
+        self.last_seq = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.received += 1
+        self.received_bytes += len(data)
+        try:
+            self.handler(data, addr)
+        except MALFORMED_ERRORS:
+            self.malformed += 1
+        except Exception as e:
+            self.errors += 1
+            print(f"[UDP] {self.name} handler error: {e}")
+
+    def error_received(self, exc):
+        self.errors += 1
+
+    def track_sequence(self, key, seq):
+        """Count datagrams missing between consecutive sequence numbers of one sender stream."""
+        last = self.last_seq.get(key)
+        if last is not None and seq > last + 1:
+            self.dropped += seq - last - 1
+        self.last_seq[key] = seq
+
+    def stats(self):
+        return {'received': self.received, 'bytes': self.received_bytes, 'dropped': self.dropped,
+                'malformed': self.malformed, 'errors': self.errors}
+
+
+class UDP_Transport():
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.endpoints = {}
+        self.tx_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sent = 0
+        self.pings = {}
+        self.rtt = None
+        self.ping_seq = 0
+        self.session = os.urandom(4).hex()
+        self.command_seq = itertools.count(1)
+        self.command_queue = collections.deque()
+        self.command_in_flight = None
+        self.command_counts = {'ACK': 0, 'NACK': 0, 'TIMEOUT': 0, 'retransmitted': 0}
+        self.thread_object = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread_object.start()
+
+    def listen(self, name, ip, port, handler):
+        """Bind ip:port and call handler(data, addr) on the loop thread for every datagram."""
+        async def create():
+            return await self.loop.create_datagram_endpoint(lambda: Datagram_Endpoint(handler, name), local_addr=(ip, port))
+        transport, endpoint = asyncio.run_coroutine_threadsafe(create(), self.loop).result()
+        self.endpoints[name] = endpoint
+        return endpoint
+
+    def sendto(self, data, addr):
+        self.tx_socket.sendto(data, addr)
+        self.sent += 1
+
+    def send_json(self, msg, addr):
+        self.sendto(json.dumps(msg).encode(), addr)
+
+    # ---- Round-trip latency ----
+    def send_ping(self, addr):
+        """Send {'ping': id}; the peer echoes it back as {'pong': id}."""
+        self.ping_seq += 1
+        self.pings[self.ping_seq] = time.perf_counter()
+        if len(self.pings) > 16:
+            self.pings.pop(min(self.pings))
+        self.send_json({'ping': self.ping_seq}, addr)
+
+    def pong_received(self, ping_id):
+        sent = self.pings.pop(ping_id, None)
+        if sent is not None:
+            self.rtt = time.perf_counter() - sent
+        return self.rtt
+
+    # ---- Reliable commands ----
+    def send_command(self, msg, addr, callback=None):
+        """Queue msg for acknowledged, in-order delivery and return its sequence number. Never blocks;
+        callback(msg, reply) runs on the loop thread with the peer's reply, whose 'result' is 'ACK' or
+        'NACK', or a {'result': 'TIMEOUT'} reply if none came."""
+        seq = next(self.command_seq)
+        command = {'msg': dict(msg, cmd_seq=seq, cmd_session=self.session), 'addr': addr, 'callback': callback,
+                   'attempts': 0, 'timer': None}
+        self.loop.call_soon_threadsafe(self.queue_command, command)
+        return seq
+
+    def queue_command(self, command):
+        self.command_queue.append(command)
+        if self.command_in_flight is None:
+            self.send_next_command()
+
+    def send_next_command(self):
+        self.command_in_flight = self.command_queue.popleft() if self.command_queue else None
+        if self.command_in_flight is not None:
+            self.transmit_command()
+
+    def transmit_command(self):
+        command = self.command_in_flight
+        if command['attempts']:
+            self.command_counts['retransmitted'] += 1
+        command['attempts'] += 1
+        self.send_json(command['msg'], command['addr'])
+        command['timer'] = self.loop.call_later(COMMAND_TIMEOUT, self.command_timeout, command)
+
+    def command_timeout(self, command):
+        if command is not self.command_in_flight:
+            return
+        if command['attempts'] <= COMMAND_RETRIES:
+            self.transmit_command()
+        else:
+            self.finish_command({'result': 'TIMEOUT', 'error': f"no reply after {command['attempts']} attempts"})
+
+    def ack_received(self, reply):
+        """Handle an {'ack': seq, ...} reply; call from the receive handler (loop thread)."""
+        command = self.command_in_flight
+        if command is None or reply.get('cmd_session') != self.session or reply['ack'] != command['msg']['cmd_seq']:
+            return
+        command['timer'].cancel()
+        self.finish_command(reply)
+
+    def finish_command(self, reply):
+        command = self.command_in_flight
+        self.command_counts[reply.get('result', 'ACK')] += 1
+        if command['callback'] is not None:
+            command['callback'](command['msg'], reply)
+        self.send_next_command()
+
+    def commands_pending(self):
+        """(seq, attempts) of the command in flight, then of the queued ones."""
+        command = self.command_in_flight
+        pending = [] if command is None else [(command['msg']['cmd_seq'], command['attempts'])]
+        return pending + [(c['msg']['cmd_seq'], 0) for c in list(self.command_queue)]
+
+    def stats(self):
+        stats = {name: endpoint.stats() for name, endpoint in self.endpoints.items()}
+        stats['sent'] = self.sent
+        stats['rtt'] = self.rtt
+        stats['commands'] = dict(self.command_counts)
+        return stats
+
+    def close(self):
+        for endpoint in self.endpoints.values():
+            if endpoint.transport is not None:
+                self.loop.call_soon_threadsafe(endpoint.transport.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.tx_socket.close()
+
+
+class Command_Acks():
+    # Receiving side of the reliable commands: builds the ACK/NACK reply of each executed command
+    # and keeps the last COMMAND_HISTORY of them, so a retransmitted command (its ACK was lost)
+    # is acknowledged again instead of being executed twice.
+    def __init__(self, capacity=COMMAND_HISTORY):
+        self.capacity = capacity
+        self.replies = collections.OrderedDict()
+        self.duplicates = 0
+
+    def duplicate(self, msg):
+        """The reply already sent for msg if it is a retransmission, else None."""
+        reply = self.replies.get((msg.get('cmd_session'), msg['cmd_seq']))
+        if reply is not None:
+            self.duplicates += 1
+        return reply
+
+    def reply(self, msg, errors, fields=None):
+        """The reply to an executed command; fields are extra entries for the sender."""
+        reply = dict(fields or {}, ack=msg['cmd_seq'], cmd_session=msg.get('cmd_session'), result='NACK' if errors else 'ACK')
+        if errors:
+            reply['error'] = '; '.join(errors)
+        self.replies[(msg.get('cmd_session'), msg['cmd_seq'])] = reply
+        if len(self.replies) > self.capacity:
+            self.replies.popitem(last=False)
+        return reply